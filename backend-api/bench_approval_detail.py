@@ -0,0 +1,125 @@
+"""承認詳細（GET /api/approvals/{id}）のDBレイテンシの計測
+
+同じ申請を、詳細SQL（1往復）の各 include と、304 用の検証子だけの読み取り、
+以前の実装と同じ順のクエリ（SET + COMMIT、申請、承認履歴、ステップ数の
+5往復）で読み、1件あたりのレイテンシを比べる。
+往復回数の差はDBまでのネットワーク遅延に比例するので、本番と同じ距離のDBで計測する。
+
+    python bench_approval_detail.py --tenant 1 --iterations 2000
+    python bench_approval_detail.py --tenant 1 --approval-id 12 --approval-id 34
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from main import (
+    APPROVAL_DETAIL_STATEMENTS, APPROVAL_VALIDATORS, connect_db, queries,
+)
+
+def legacy_detail(conn, approval_id, tenant_id):
+    """以前の実装のクエリ（RLSの SET + COMMIT、申請、承認履歴、ステップ数）"""
+    conn.set_tenant(None)  # テナント設定を最初の文に相乗りさせない
+    cursor = conn.cursor()
+    cursor.execute("SET app.current_tenant_id = %s", (str(tenant_id),))
+    conn.commit()
+    cursor.execute(
+        """
+        SELECT a.*, u.name as applicant_name, r.name as route_name
+        FROM approvals a
+        INNER JOIN users u ON a.applicant_id = u.id
+        INNER JOIN approval_routes r ON a.route_id = r.id
+        WHERE a.id = %s AND a.tenant_id = %s
+        """,
+        (approval_id, tenant_id)
+    )
+    approval = cursor.fetchone()
+    cursor.execute(
+        """
+        SELECT ah.*, u.name as approver_name
+        FROM approval_histories ah
+        LEFT JOIN users u ON ah.user_id = u.id
+        WHERE ah.approval_id = %s
+        ORDER BY ah.created_at ASC
+        LIMIT 100
+        """,
+        (approval_id,)
+    )
+    cursor.fetchall()
+    cursor.execute(
+        "SELECT COUNT(DISTINCT step_order) as total_steps FROM approval_route_steps WHERE route_id = %s",
+        (approval["route_id"],)
+    )
+    cursor.fetchone()
+
+def prepared(statement):
+    def read(conn, approval_id, tenant_id):
+        conn.set_tenant(tenant_id)
+        queries.execute(conn.cursor(), statement, (approval_id, tenant_id)).fetchone()
+    return read
+
+VARIANTS = {
+    "legacy (5 round trips)": legacy_detail,
+    "include=histories": prepared(APPROVAL_DETAIL_STATEMENTS[(True, False)]),
+    "include=history_summary": prepared(APPROVAL_DETAIL_STATEMENTS[(False, True)]),
+    "include=": prepared(APPROVAL_DETAIL_STATEMENTS[(False, False)]),
+    "If-None-Match (validator)": prepared(APPROVAL_VALIDATORS[True]),
+}
+
+def busiest_approvals(conn, tenant_id, count):
+    """承認履歴の多い申請"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT set_config('app.current_tenant_id', %s, false)", (str(tenant_id),))
+    cursor.execute(
+        """
+        SELECT a.id FROM approvals a
+        LEFT JOIN approval_history_summaries hs ON hs.approval_id = a.id
+        WHERE a.tenant_id = %s
+        ORDER BY COALESCE(hs.history_count, 0) DESC, a.id
+        LIMIT %s
+        """,
+        (tenant_id, count)
+    )
+    ids = [row["id"] for row in cursor.fetchall()]
+    conn.rollback()
+    return ids
+
+def main():
+    parser = argparse.ArgumentParser(description="承認詳細のDBレイテンシ（以前の実装との比較）")
+    parser.add_argument("--tenant", type=int, required=True)
+    parser.add_argument("--approval-id", type=int, action="append", help="省略時は承認履歴の多い10件")
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    conn = connect_db()
+    try:
+        approval_ids = args.approval_id or busiest_approvals(conn, args.tenant, 10)
+        if not approval_ids:
+            print(f"tenant {args.tenant} has no approvals")
+            return 1
+        print(f"approvals={approval_ids} iterations={args.iterations}")
+
+        for name, read in VARIANTS.items():
+            # PREPARE とキャッシュのウォームアップ
+            for approval_id in approval_ids:
+                read(conn, approval_id, args.tenant)
+                conn.rollback()
+            latencies = []
+            for i in range(args.iterations):
+                approval_id = approval_ids[i % len(approval_ids)]
+                started = time.perf_counter()
+                read(conn, approval_id, args.tenant)
+                # プール返却時と同じくトランザクションを終える
+                conn.rollback()
+                latencies.append(time.perf_counter() - started)
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(
+                f"{name:28} p50={1000 * quantiles[49]:6.2f}ms  p95={1000 * quantiles[94]:6.2f}ms  "
+                f"p99={1000 * quantiles[98]:6.2f}ms"
+            )
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""承認検索（GET /api/approvals/search）のDBレイテンシの計測
+
+検索語ごとに、APIと同じ検索SQL（build_approvals_search_query）を繰り返し実行し、
+1件あたりのレイテンシと、実行計画で使われたインデックスを出力する。
+単語の一致は全文検索インデックス（idx_approvals_search_vector）、日本語などの部分一致は
+トライグラムインデックス（idx_approvals_search_trgm）を使うはず。2文字以下の語は
+トライグラムを作れないため、部分一致がインデックスで絞り込めない（全件を読む）。
+
+目標（1テナント100万件）は、そのくらいの申請を入れたDBで計測する。例:
+
+    INSERT INTO approvals (tenant_id, route_id, route_version, applicant_id, title, description,
+                           status, current_step, form_data, created_at)
+    SELECT 1, 1, 1, 3, '交通費精算 ' || g, '出張 ' || md5(g::text), 'approved', 1,
+           jsonb_build_object('amount', g % 100000), NOW() - g * interval '1 minute'
+    FROM generate_series(1, 1000000) g;
+    ANALYZE approvals;
+
+    python bench_approval_search.py --tenant 1
+    python bench_approval_search.py --tenant 1 --q 交通費 --q "invoice 2024" --iterations 500
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from main import build_approvals_search_query, connect_db
+
+DEFAULT_QUERIES = [
+    "invoice",         # 全文検索（単語）
+    "交通費精算",      # 部分一致（トライグラム）
+    "出張",            # 2文字（トライグラムで絞り込めない）
+    "zzqx-no-match",   # 該当なし
+]
+
+def plan_indexes(plan):
+    """実行計画（EXPLAIN の JSON）で使われたインデックス名"""
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names |= plan_indexes(child)
+    return names
+
+def main():
+    parser = argparse.ArgumentParser(description="承認検索のDBレイテンシ")
+    parser.add_argument("--tenant", type=int, required=True)
+    parser.add_argument("--q", action="append", help="検索語（複数指定可）。省略時は単語・日本語・2文字・該当なし")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT extname FROM pg_extension WHERE extname IN ('pg_trgm', 'btree_gin')")
+        missing = {"pg_trgm", "btree_gin"} - {row["extname"] for row in cursor.fetchall()}
+        conn.rollback()
+        if missing:
+            print(f"missing extensions: {', '.join(sorted(missing))} (run database/migrations/008_approvals_search.sql)")
+            return 1
+
+        conn.set_tenant(args.tenant)
+        cursor.execute("SELECT count(*) AS n FROM approvals WHERE tenant_id = %s", (args.tenant,))
+        print(f"tenant {args.tenant}: {cursor.fetchone()['n']} approvals, iterations={args.iterations}")
+        conn.rollback()
+
+        for q in args.q or DEFAULT_QUERIES:
+            query, params = build_approvals_search_query(args.tenant, q, None, None, None, None, args.limit)
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            indexes = plan_indexes(cursor.fetchone()["QUERY PLAN"][0]["Plan"])
+            conn.rollback()
+
+            latencies = []
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                conn.rollback()
+                latencies.append(time.perf_counter() - started)
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(
+                f"{q!r:20} rows={len(rows):3}  p50={1000 * quantiles[49]:8.2f}ms  "
+                f"p95={1000 * quantiles[94]:8.2f}ms  p99={1000 * quantiles[98]:8.2f}ms  "
+                f"indexes={', '.join(sorted(indexes)) or '(none)'}"
+            )
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
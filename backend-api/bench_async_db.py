@@ -0,0 +1,135 @@
+"""同期（psycopg2 + スレッドプール）と非同期（psycopg3）のDBアクセスの比較
+
+DB_ASYNC_ENABLED=false / true で uvicorn をそれぞれ起動し、ホットなエンドポイントに
+同時接続数を変えて負荷をかけ、スループットとレイテンシを出力する。
+クライアントは asyncio で1リクエスト1接続の HTTP/1.1 を送る（追加の依存なし）。
+
+DATABASE_URL などは .env / 環境変数のまま使う。DBにサンプルデータを入れておく。
+
+    python bench_async_db.py --email tanaka@demo.com --password password
+    python bench_async_db.py --email tanaka@demo.com --password password --concurrency 100 1000 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+PATHS = ["/api/approvals?limit=20", "/api/approvals/inbox", "/api/notifications", "/api/approvals/{id}"]
+
+async def request(host, port, method, path, headers=None, body=None):
+    """1回のリクエストを送り、(ステータス, 本文) を返す"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        data = b"" if body is None else json.dumps(body).encode()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close",
+                 f"Content-Length: {len(data)}", "Content-Type: application/json"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + data)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ", 2)[1]), payload
+
+async def load(host, port, paths, headers, total, concurrency):
+    """total 件を同時 concurrency 件で送り、(秒数, レイテンシの一覧, エラー件数) を返す"""
+    latencies = []
+    errors = 0
+    sent = 0
+
+    async def worker():
+        nonlocal errors, sent
+        while sent < total:
+            path = paths[sent % len(paths)]
+            sent += 1
+            started = time.perf_counter()
+            try:
+                status, _ = await request(host, port, "GET", path, headers)
+            except OSError:
+                status = None
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies, errors
+
+def wait_until_up(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + "/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"server did not start: {base_url}")
+
+def percentile(values, p):
+    return statistics.quantiles(values, n=100)[p - 1] if len(values) > 1 else values[0]
+
+async def bench_mode(args, async_enabled):
+    env = dict(os.environ, DB_ASYNC_ENABLED="true" if async_enabled else "false")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", args.host, "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(f"http://{args.host}:{args.port}")
+        status, body = await request(args.host, args.port, "POST", "/api/auth/login",
+                                     body={"email": args.email, "password": args.password})
+        if status != 200:
+            raise RuntimeError(f"login failed: {status} {body[:200]!r}")
+        headers = {"Authorization": f"Bearer {json.loads(body)['token']}"}
+
+        status, body = await request(args.host, args.port, "GET", "/api/approvals?limit=1", headers)
+        approvals = json.loads(body) if status == 200 else []
+        paths = [
+            path.replace("{id}", str(approvals[0]["id"])) for path in PATHS
+            if "{id}" not in path or approvals
+        ]
+
+        # 接続プール・PREPARE のウォームアップ
+        await load(args.host, args.port, paths, headers, args.concurrency[0] * 2, args.concurrency[0])
+
+        mode = "async" if async_enabled else "sync"
+        for concurrency in args.concurrency:
+            elapsed, latencies, errors = await load(
+                args.host, args.port, paths, headers, args.requests, concurrency
+            )
+            print(
+                f"{mode:5} concurrency={concurrency:5}: {args.requests / elapsed:8.1f} req/s  "
+                f"p50={1000 * percentile(latencies, 50):7.1f}ms  "
+                f"p95={1000 * percentile(latencies, 95):7.1f}ms  "
+                f"p99={1000 * percentile(latencies, 99):7.1f}ms  errors={errors}"
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="同期/非同期のDBアクセスのスループット比較")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--requests", type=int, default=5000, help="同時接続数ごとのリクエスト数")
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    args = parser.parse_args()
+
+    print(f"paths={PATHS} requests={args.requests}")
+    for mode in args.modes:
+        asyncio.run(bench_mode(args, mode == "async"))
+
+if __name__ == "__main__":
+    main()
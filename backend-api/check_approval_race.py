@@ -0,0 +1,187 @@
+"""承認の同時実行チェック（起動中のAPIに対して実行する）
+
+同じ申請に同じ承認者の承認を数百件同時に送り、1件だけが200になること、
+承認履歴が1件だけ増えること、実行中に pg_locks にロック待ち（granted = false）が
+出ないこと（遷移は FOR UPDATE SKIP LOCKED で取り、待たずに409を返す）を確認する。
+
+--mode free（既定）: 全リクエストを同時に送る実際の競合。勝者のコミットより前に
+    申請を読んだリクエストは409、後に読んだリクエストは「pending ではない」の400になる。
+    後から来たリクエストが次のステップを承認しないよう、最後のステップの申請を指定する。
+--mode locked: 全リクエストが同じ状態を読んでから書き込むよう、申請の承認履歴
+    サマリーの行を別の接続でロックしておく。最初に申請の行を取ったリクエストは
+    同じ文の中のサマリー更新で待つ（このロック待ちだけを許す）。他のリクエストは
+    SKIP LOCKED で0行になり409を返す。全員が返ってからロックを外すと、待っていた
+    リクエストがコミットして200を返す（200が1件、409がN-1件）。
+
+使い方:
+    python check_approval_race.py --approval-id 12 --email tanaka@demo.com --password password
+    python check_approval_race.py --approval-id 12 --email tanaka@demo.com --password password --mode locked
+
+--approval-id には、--email のユーザーが現在の承認者である pending の申請を指定する。
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import psycopg2
+
+def api(base_url, method, path, token=None, body=None):
+    """(ステータス, JSON) を返す"""
+    request = urllib.request.Request(
+        base_url + path,
+        method=method,
+        data=None if body is None else json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+def token_tenant_id(token):
+    """JWTのペイロードからテナントIDを取り出す（検証はしない）"""
+    payload = token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))["tenant_id"]
+
+class LockWaitMonitor:
+    """実行中の pg_locks を定期的に読み、ロック待ち（granted = false）の最大数を記録する"""
+
+    SQL = """
+        SELECT count(*) FROM pg_locks l
+        JOIN pg_stat_activity a ON a.pid = l.pid
+        WHERE NOT l.granted AND a.datname = current_database() AND l.pid <> pg_backend_pid()
+    """
+
+    def __init__(self, database_url, interval=0.005):
+        self.conn = psycopg2.connect(database_url)
+        self.conn.autocommit = True
+        self.interval = interval
+        self.max_waiting = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        cursor = self.conn.cursor()
+        while not self._stop.is_set():
+            cursor.execute(self.SQL)
+            self.max_waiting = max(self.max_waiting, cursor.fetchone()[0])
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.conn.close()
+
+def hold_summary_lock(database_url, tenant_id, approval_id):
+    """承認履歴サマリーの行をロックした接続を返す（commit で外れる）"""
+    conn = psycopg2.connect(database_url)
+    cursor = conn.cursor()
+    cursor.execute("SELECT set_config('app.current_tenant_id', %s, false)", (str(tenant_id),))
+    # 承認履歴がまだ無い申請はサマリーの行も無いため、空の行を作ってからロックする
+    cursor.execute(
+        "INSERT INTO approval_history_summaries (approval_id) VALUES (%s) ON CONFLICT (approval_id) DO NOTHING",
+        (approval_id,)
+    )
+    conn.commit()
+    cursor.execute(
+        "SELECT 1 FROM approval_history_summaries WHERE approval_id = %s FOR UPDATE", (approval_id,)
+    )
+    return conn
+
+def send_all(base_url, path, token, requests):
+    """全スレッドをそろえてから承認を送る。[(ステータス, JSON)] のフューチャーを返す"""
+    barrier = threading.Barrier(requests)
+
+    def approve():
+        barrier.wait()
+        return api(base_url, "POST", path, token, {"comment": "race check"})
+
+    executor = ThreadPoolExecutor(max_workers=requests)
+    return executor, [executor.submit(approve) for _ in range(requests)]
+
+def main():
+    parser = argparse.ArgumentParser(description="承認の同時実行チェック（200は1件だけ、ロック待ちなし）")
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--approval-id", type=int, required=True)
+    parser.add_argument("--email", required=True, help="現在の承認者")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--requests", type=int, default=300, help="同時に送る承認の数")
+    parser.add_argument("--mode", choices=["free", "locked"], default="free")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    status, body = api(args.base_url, "POST", "/api/auth/login",
+                       body={"email": args.email, "password": args.password})
+    if status != 200:
+        print(f"login failed: {status} {body}")
+        return 1
+    token = body["token"]
+    detail_path = f"/api/approvals/{args.approval_id}?include="
+
+    status, before = api(args.base_url, "GET", detail_path, token)
+    if status != 200 or before["status"] != "pending":
+        print(f"approval {args.approval_id} is not pending: {status} {before}")
+        return 1
+    if args.mode == "free" and before["current_step"] != before["total_steps"]:
+        print(f"approval {args.approval_id} is at step {before['current_step']} of {before['total_steps']}; "
+              "--mode free needs an approval at its last step")
+        return 1
+
+    path = f"/api/approvals/{args.approval_id}/approve"
+    started = time.perf_counter()
+    with LockWaitMonitor(args.database_url) as monitor:
+        lock_conn = None
+        if args.mode == "locked":
+            lock_conn = hold_summary_lock(args.database_url, token_tenant_id(token), args.approval_id)
+        executor, futures = send_all(args.base_url, path, token, args.requests)
+        with executor:
+            if lock_conn is not None:
+                # 勝ったリクエストはロックで待つため、残りが全員返ってからロックを外す
+                pending = set(futures)
+                deadline = time.monotonic() + 60
+                while len(pending) > 1 and time.monotonic() < deadline:
+                    _, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                lock_conn.commit()
+                lock_conn.close()
+            statuses = Counter(future.result()[0] for future in futures)
+    elapsed = time.perf_counter() - started
+
+    status, after = api(args.base_url, "GET", detail_path, token)
+    history_added = after["history_count"] - before["history_count"]
+    print(f"{args.requests} requests ({args.mode}) in {elapsed:.2f}s: {dict(sorted(statuses.items()))}")
+    print(
+        f"step {before['current_step']} -> {after['current_step']}, "
+        f"status {before['status']} -> {after['status']}, histories +{history_added}, "
+        f"max lock waits {monitor.max_waiting}"
+    )
+
+    if args.mode == "locked":
+        # サマリーの行で待つ勝者の1件だけ
+        ok = (statuses == Counter({200: 1, 409: args.requests - 1})
+              and monitor.max_waiting <= 1)
+    else:
+        ok = (statuses[200] == 1 and statuses[200] + statuses[409] + statuses[400] == args.requests
+              and monitor.max_waiting == 0)
+    ok = ok and history_added == 1
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""エンドポイントごとのDB往復回数のチェック
+
+アプリをプロセス内で起動し（FastAPI の TestClient。httpx が必要）、各エンドポイントを
+2回ずつ順に呼んで、psycopg2 の execute・COPY・COMMIT・ROLLBACK の回数を数える。
+1回目は接続ごとの PREPARE を含む。2回目の回数が EXPECTED 以下であること、
+テナント設定を単独の SET で送っていないこと（最初の文に相乗りしている）を確認する。
+
+DATABASE_URL の DB にサンプルデータ（backend/seed.sql）を入れておく。
+
+    python check_round_trips.py --email tanaka@demo.com --password password
+"""
+import argparse
+import sys
+import threading
+from collections import Counter
+
+import psycopg2
+import psycopg2.extras
+from fastapi.testclient import TestClient
+
+import main as api
+
+# エンドポイント -> 2回目（PREPARE済み）の往復回数の上限。
+# 読み取りは1文で済ませ、プール返却時の ROLLBACK を含めて2往復。
+# ETag を返す一覧は検証子を先に読むため、本体を読むときは3往復
+# （承認ルート一覧はキャッシュに当たれば2往復）
+EXPECTED = {
+    "POST /api/auth/login": 2,
+    "GET /api/approvals": 2,
+    "GET /api/approvals/inbox": 2,
+    "GET /api/approvals/{id}": 2,
+    "GET /api/approvals/{id}?include=history_summary": 2,
+    "GET /api/approvals/{id}/histories": 2,
+    "GET /api/notifications": 2,
+    "GET /api/approval-routes": 3,
+    "GET /api/form-templates": 3,
+    "GET /api/users": 2,
+    "GET /api/files": 2,
+}
+
+class RoundTrips:
+    """DBへ送った文の数（リクエストは1件ずつ送るので、プロセス全体で数える）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def record(self, kind):
+        with self._lock:
+            self._counts[kind] += 1
+
+    def take(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+round_trips = RoundTrips()
+
+def install_counters():
+    """カーソルと接続をラップする。execute はテナント設定を相乗りさせた後の文を数える"""
+    execute = psycopg2.extras.RealDictCursor.execute
+    copy_expert = psycopg2.extras.RealDictCursor.copy_expert
+    commit = api.TenantConnection.commit
+    rollback = psycopg2.extensions.connection.rollback
+
+    def in_transaction(conn):
+        return conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def counted_execute(self, query, vars=None):
+        text = query if isinstance(query, str) else query.decode()
+        round_trips.record("set" if text.lstrip().upper().startswith("SET ") else "execute")
+        return execute(self, query, vars)
+
+    def counted_copy_expert(self, sql, file, *args, **kwargs):
+        round_trips.record("copy")
+        return copy_expert(self, sql, file, *args, **kwargs)
+
+    def counted_commit(self):
+        if in_transaction(self):
+            round_trips.record("commit")
+        return commit(self)
+
+    def counted_rollback(self):
+        # トランザクション外の ROLLBACK は psycopg2 がサーバーに送らない
+        if in_transaction(self):
+            round_trips.record("rollback")
+        return rollback(self)
+
+    psycopg2.extras.RealDictCursor.execute = counted_execute
+    psycopg2.extras.RealDictCursor.copy_expert = counted_copy_expert
+    api.TenantConnection.commit = counted_commit
+    api.TenantConnection.rollback = counted_rollback
+
+def main():
+    parser = argparse.ArgumentParser(description="エンドポイントごとのDB往復回数")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    args = parser.parse_args()
+
+    install_counters()
+    failures = []
+    with TestClient(api.app) as client:
+        round_trips.take()  # 起動時の接続確認
+
+        def measure(name, method, path, **kwargs):
+            counts = []
+            for _ in range(2):
+                response = client.request(method, path, **kwargs)
+                counts.append(round_trips.take())
+            cold, warm = counts
+            total = sum(warm.values())
+            detail = ", ".join(f"{kind}={n}" for kind, n in sorted(warm.items()))
+            print(f"{name:52} {response.status_code}  cold={sum(cold.values()):2}  warm={total:2}  ({detail})")
+            if response.status_code >= 400:
+                failures.append(f"{name}: HTTP {response.status_code}")
+            if total > EXPECTED[name]:
+                failures.append(f"{name}: {total} round trips (expected <= {EXPECTED[name]})")
+            if warm["set"] or cold["set"]:
+                failures.append(f"{name}: sent a separate SET")
+            return response
+
+        response = measure(
+            "POST /api/auth/login", "POST", "/api/auth/login",
+            json={"email": args.email, "password": args.password},
+        )
+        if response.status_code != 200:
+            print(f"login failed: {response.text}")
+            return 1
+        headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+        approvals = measure("GET /api/approvals", "GET", "/api/approvals", headers=headers).json()
+        measure("GET /api/approvals/inbox", "GET", "/api/approvals/inbox", headers=headers)
+        if approvals:
+            approval_id = approvals[0]["id"]
+            measure("GET /api/approvals/{id}", "GET", f"/api/approvals/{approval_id}", headers=headers)
+            measure(
+                "GET /api/approvals/{id}?include=history_summary", "GET",
+                f"/api/approvals/{approval_id}?include=history_summary", headers=headers,
+            )
+            measure(
+                "GET /api/approvals/{id}/histories", "GET",
+                f"/api/approvals/{approval_id}/histories", headers=headers,
+            )
+        measure("GET /api/notifications", "GET", "/api/notifications", headers=headers)
+        measure("GET /api/approval-routes", "GET", "/api/approval-routes", headers=headers)
+        measure("GET /api/form-templates", "GET", "/api/form-templates", headers=headers)
+        measure("GET /api/users", "GET", "/api/users", headers=headers)
+        measure("GET /api/files", "GET", "/api/files", headers=headers)
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""ルートエンジン（CompiledRoute）のストレステスト
+
+並列グループ（all / any）・任意ステップ・承認待ちにしないステージを含む
+ランダムなルートを作り、多数の申請を複数スレッドで最後まで承認する。
+1回の承認ごとに、ステップの一覧を毎回たどる素朴な実装（walk_*。遷移表を
+作る前のハンドラと同じく、ステップの一覧を走査して承認者を探す）と
+遷移が一致することを確認し、両者の処理時間を比べる。
+DBには接続しない。
+
+    python check_route_engine.py --routes 300 --approvals 100000 --threads 32
+"""
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from main import STAGE_MAX_APPROVERS, AlreadyApproved, CompiledRoute, Transition
+
+DELEGATE_ID = 10 ** 9  # ルートに含まれない承認者（代理承認・管理者）
+
+def random_route(rnd, max_stages):
+    """step_order ごとに承認者1人〜STAGE_MAX_APPROVERS人のステージを並べたルート"""
+    steps = []
+    for order in range(1, rnd.randint(1, max_stages) + 1):
+        size = rnd.choice([1, 1, 1, 2, 3, 5, 20, STAGE_MAX_APPROVERS])
+        requirement = rnd.choice(["all", "any"]) if size > 1 else None
+        # 全員が任意のステージ（承認待ちにしない）も作る
+        optional_rate = 1.0 if rnd.random() < 0.1 else 0.2
+        for i in range(size):
+            steps.append({
+                "step_order": order,
+                "approver_id": order * 1000 + i,
+                "is_required": rnd.random() >= optional_rate,
+                "is_parallel_group": size > 1,
+                "parallel_requirement": requirement,
+            })
+    return steps
+
+def walk_stage(steps, step_order):
+    return [step for step in steps if step["step_order"] == step_order]
+
+def walk_enter(steps, after_step):
+    """after_step より後で、必須の承認者がいる最初のステップに入る"""
+    for step in steps:
+        if step["step_order"] > after_step and step["is_required"] is not False:
+            order = step["step_order"]
+            return Transition("pending", order, frozenset(), walk_next_approver(walk_stage(steps, order), frozenset()))
+    return Transition("approved", steps[-1]["step_order"] + 1 if steps else 1, frozenset(), None)
+
+def walk_next_approver(stage, approved):
+    for step in stage:
+        if step["is_required"] is not False and step["approver_id"] not in approved:
+            return step["approver_id"]
+    return None
+
+def walk_start(steps):
+    if all(step["is_required"] is False for step in steps):
+        return Transition("pending", 1, frozenset(), None)
+    return walk_enter(steps, 0)
+
+def walk_approve(steps, current_step, approved, approver_id, on_behalf_of=None):
+    """CompiledRoute.approve と同じ規則の遷移
+
+    承認済みの承認者をビットマスクではなく集合で持つ（Transition.approved_mask に入れる）。
+    """
+    stage = walk_stage(steps, current_step)
+    required = [step["approver_id"] for step in stage if step["is_required"] is not False]
+    if not required:
+        return walk_enter(steps, current_step)
+
+    members = [step["approver_id"] for step in stage]
+    member = approver_id if approver_id in members else on_behalf_of
+    if member not in members:
+        member = walk_next_approver(stage, approved)
+    if member in approved:
+        raise AlreadyApproved()
+
+    approved = approved | {member}
+    requirement = stage[0].get("parallel_requirement") or "all"
+    if approved if requirement == "any" else all(approver in approved for approver in required):
+        return walk_enter(steps, current_step)
+    return Transition("pending", current_step, approved, walk_next_approver(stage, approved))
+
+def mask_members(route, step_order, mask):
+    stage = route._stages.get(step_order)
+    if stage is None:
+        return frozenset()
+    return frozenset(approver for approver, bit in stage.bits.items() if mask & bit)
+
+def timed(approve, *args):
+    """(遷移または AlreadyApproved, 秒数) を返す"""
+    started = time.perf_counter()
+    try:
+        outcome = approve(*args)
+    except AlreadyApproved:
+        outcome = AlreadyApproved
+    return outcome, time.perf_counter() - started
+
+def run_approval(args):
+    """1件の申請を完了まで承認し、(承認の回数, CompiledRoute の秒数, walk の秒数) を返す"""
+    seed, routes = args
+    rnd = random.Random(seed)
+    steps, route = rnd.choice(routes)
+
+    compiled = route.start()
+    walked = walk_start(steps)
+    assert compiled.status == walked.status and compiled.current_step == walked.current_step, seed
+    actions = compiled_seconds = walked_seconds = 0
+
+    while compiled.status == "pending":
+        members = [step["approver_id"] for step in walk_stage(steps, compiled.current_step)]
+        waiting = [approver for approver in members if approver not in walked.approved_mask]
+        roll = rnd.random()
+        if not waiting or roll < 0.1:
+            approver_id = DELEGATE_ID
+        elif roll < 0.15 and walked.approved_mask:
+            approver_id = rnd.choice(sorted(walked.approved_mask))  # 二重承認
+        else:
+            approver_id = rnd.choice(waiting)
+
+        compiled_next, seconds = timed(
+            route.approve, compiled.current_step, compiled.approved_mask, approver_id,
+            compiled.current_approver_id,
+        )
+        compiled_seconds += seconds
+        walked_next, seconds = timed(
+            walk_approve, steps, walked.current_step, walked.approved_mask, approver_id,
+            walked.current_approver_id,
+        )
+        walked_seconds += seconds
+
+        if compiled_next is AlreadyApproved or walked_next is AlreadyApproved:
+            assert compiled_next is walked_next, (seed, approver_id, "AlreadyApproved")
+            continue
+        compiled, walked = compiled_next, walked_next
+        assert (
+            compiled.status == walked.status
+            and compiled.current_step == walked.current_step
+            and compiled.current_approver_id == walked.current_approver_id
+            and mask_members(route, compiled.current_step, compiled.approved_mask) == walked.approved_mask
+        ), (seed, approver_id, compiled, walked)
+        actions += 1
+
+    assert compiled.current_step == walked.current_step == steps[-1]["step_order"] + 1, seed
+    return actions, compiled_seconds, walked_seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="CompiledRoute とステップ一覧の走査の比較（ストレステスト）")
+    parser.add_argument("--routes", type=int, default=300)
+    parser.add_argument("--max-stages", type=int, default=12)
+    parser.add_argument("--approvals", type=int, default=100000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    routes = []
+    for _ in range(args.routes):
+        steps = random_route(rnd, args.max_stages)
+        routes.append((steps, CompiledRoute(steps)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(
+            run_approval, ((args.seed * 10 ** 9 + i, routes) for i in range(args.approvals))
+        ))
+    elapsed = time.perf_counter() - started
+
+    actions = sum(result[0] for result in results)
+    compiled_seconds = sum(result[1] for result in results)
+    walked_seconds = sum(result[2] for result in results)
+    print(f"{args.approvals} approvals, {actions} approve actions, {args.threads} threads, {elapsed:.1f}s")
+    print(f"CompiledRoute: {1e6 * compiled_seconds / actions:.2f} us per approve")
+    print(f"step walk:     {1e6 * walked_seconds / actions:.2f} us per approve")
+    print("OK: all transitions matched")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
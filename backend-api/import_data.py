@@ -0,0 +1,59 @@
+"""データ移行用の一括インポート（CLI）
+
+APIの POST /api/import/{kind} と同じ処理を、サーバーを経由せずに実行する。
+大きなファイルもバッチ単位で COPY するため、メモリ使用量は一定。
+
+使い方:
+    python import_data.py users users.csv --tenant 1   # password_hash（bcrypt）の列が必要
+    python import_data.py approvals approvals.ndjson --tenant 1
+    python import_data.py approval_histories histories.csv --tenant 1 --dry-run
+
+進捗は標準エラー出力に、最後の集計は標準出力にJSONで出力する。
+"""
+import argparse
+import json
+import sys
+
+from main import IMPORT_BATCH_SIZE, IMPORT_FORMATS, IMPORT_SPECS, connect_db, run_import
+
+def main():
+    parser = argparse.ArgumentParser(description="承認データの一括インポート")
+    parser.add_argument("kind", choices=sorted(IMPORT_SPECS))
+    parser.add_argument("file", help="CSV（1行目がヘッダ）または NDJSON。- で標準入力")
+    parser.add_argument("--tenant", type=int, required=True, help="取り込み先のテナントID")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="省略時は拡張子で判定")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="検証のみ行い取り込まない")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        fmt = "ndjson" if args.file.lower().endswith((".ndjson", ".jsonl")) else "csv"
+
+    if args.file == "-":
+        sys.stdin.reconfigure(encoding="utf-8-sig", newline="")
+        text_stream = sys.stdin
+    else:
+        text_stream = open(args.file, encoding="utf-8-sig", newline="")
+
+    conn = connect_db()
+    event = None
+    try:
+        with text_stream:
+            for event in run_import(
+                conn, args.tenant, args.kind, text_stream, fmt, args.dry_run, args.batch_size
+            ):
+                if event["event"] == "done":
+                    print(json.dumps(event, ensure_ascii=False, indent=2))
+                else:
+                    print(
+                        f"{event['rows']} rows, {event['inserted']} inserted, {event['errors']} errors",
+                        file=sys.stderr,
+                    )
+    finally:
+        conn.close()
+
+    return 1 if event is None or event["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,24 +2,42 @@
 ApprovalHub FastAPI Backend
 シンプルで高速なREST API
 """
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ValidationError
 from typing import Optional, List
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 import os
 import json
 import uuid
+import base64
+import csv
+import io
+import hashlib
+import re
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2.extras import RealDictCursor
+import psycopg
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from psycopg_pool import PoolTimeout as AsyncPoolTimeout
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from urllib.parse import urlparse
 import socket
+import threading
+import time
+from functools import partial
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from collections import deque, namedtuple
+from bisect import bisect_right
 import boto3
 from botocore.exceptions import ClientError
+import password_hashing
 
 # 環境変数読み込み
 load_dotenv()
@@ -52,9 +70,15 @@ app.add_middleware(
 )
 
 # セキュリティ
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# パスワードハッシュ（bcrypt）設定
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # work factor。これより弱いハッシュはログイン時に再ハッシュ
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))  # ハッシュ専用プロセス数
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 4)))  # 処理中+待ちの上限（超えたら429）
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))  # 1件の結果を待つ秒数
+PASSWORD_HASH_BULK_CHUNK = int(os.getenv("PASSWORD_HASH_BULK_CHUNK", "8"))  # 一括ハッシュ化で1タスクにまとめる件数
+
 # JWT設定
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
@@ -78,43 +102,758 @@ if R2_ACCOUNT_ID and R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY:
         region_name='auto'
     )
 
-# データベース接続（IPv4を強制）
-def get_db():
-    database_url = os.getenv("DATABASE_URL")
-
-    # URLをパース
-    parsed = urlparse(database_url)
-
-    # 接続パラメータを構築（sslmode=requireを追加してIPv6問題を回避）
-    conn_params = {
+# データベース接続プール設定
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # 空き接続の待機秒数
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # 接続の最大寿命（秒）
+DB_POOL_HEALTH_CHECK_IDLE = float(os.getenv("DB_POOL_HEALTH_CHECK_IDLE", "30"))  # この秒数以上アイドルならチェックアウト時にping
+
+# リードレプリカ（未設定ならすべてプライマリ）
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))  # これを超えて遅延したらプライマリへ（秒）
+DB_REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "10"))  # 書き込み後にプライマリを読む秒数
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "5"))  # 遅延の確認間隔（秒）
+
+# 非同期DBモード（psycopg3）。有効時はホットエンドポイントを非同期版に切り替える
+DB_ASYNC_ENABLED = os.getenv("DB_ASYNC_ENABLED", "false").lower() in ("1", "true", "yes")
+DB_ASYNC_POOL_MIN_SIZE = int(os.getenv("DB_ASYNC_POOL_MIN_SIZE", "2"))
+DB_ASYNC_POOL_MAX_SIZE = int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", "20"))
+
+DB_DNS_TTL = float(os.getenv("DB_DNS_TTL", "300"))  # 名前解決結果のキャッシュ秒数
+DB_DNS_REFRESH_AHEAD = float(os.getenv("DB_DNS_REFRESH_AHEAD", "0.8"))  # TTLのこの割合を過ぎたらバックグラウンド更新
+DB_DNS_RETRY_INTERVAL = 30.0  # 解決失敗後の再試行間隔（秒）
+
+def build_db_conn_params(database_url):
+    """DATABASE_URLから接続パラメータを構築（起動時に一度だけ）"""
+    parsed = urlparse(database_url or "")
+
+    # sslmode=requireを追加してIPv6問題を回避
+    return {
         "host": parsed.hostname,
         "port": parsed.port or 5432,
-        "database": parsed.path.lstrip('/'),
+        "dbname": parsed.path.lstrip('/'),
         "user": parsed.username,
         "password": parsed.password,
-        "cursor_factory": RealDictCursor,
         "sslmode": "require",
         "connect_timeout": 10
     }
 
-    # IPv4を強制するためにoptions設定を追加
-    # Supabaseは常にIPv4アドレスも提供しているので、
-    # gethostbyname()でIPv4アドレスを取得
+class HostResolver:
+    """DBホストのIPv4アドレスをTTL付きでキャッシュする
+
+    Supabaseは常にIPv4アドレスも提供しているので、gethostbyname()で
+    IPv4アドレスを取得してIPv4接続を強制する。TTL切れ前にバックグラウンドで
+    更新し、DNS解決に失敗した場合は最後に成功したアドレスを使い続ける。
+    """
+
+    def __init__(self, hostname, ttl, refresh_ahead):
+        self.hostname = hostname
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self._lock = threading.Lock()
+        self._addr = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._refreshing = False
+
+    def resolve(self):
+        if not self.hostname:
+            return self.hostname
+
+        now = time.monotonic()
+        with self._lock:
+            if self._addr and now < self._expires_at:
+                if now >= self._refresh_at and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, daemon=True).start()
+                return self._addr
+
+        return self._refresh()
+
+    def _refresh(self):
+        try:
+            addr = socket.gethostbyname(self.hostname)
+        except Exception as e:
+            print(f"Failed to resolve IPv4 address: {e}")
+            now = time.monotonic()
+            with self._lock:
+                self._refreshing = False
+                if self._addr:
+                    # 最後に成功したアドレスを使い続け、少し待ってから再試行
+                    self._expires_at = max(self._expires_at, now + self.ttl)
+                    self._refresh_at = now + DB_DNS_RETRY_INTERVAL
+                    return self._addr
+            # 一度も解決できていない場合はホスト名をそのまま使用
+            return self.hostname
+
+        now = time.monotonic()
+        with self._lock:
+            self._addr = addr
+            self._expires_at = now + self.ttl
+            self._refresh_at = now + self.ttl * self.refresh_ahead
+            self._refreshing = False
+        return addr
+
+DB_CONN_PARAMS = build_db_conn_params(os.getenv("DATABASE_URL"))
+db_host_resolver = HostResolver(DB_CONN_PARAMS["host"], DB_DNS_TTL, DB_DNS_REFRESH_AHEAD)
+
+def with_tenant_context(query, params, tenant_id):
+    """RLS用のテナントIDを、トランザクション最初の文に相乗りさせる
+
+    SET + COMMIT の往復をなくすため、set_config(..., true)（トランザクション
+    ローカル）を同じexecuteで送る。トランザクション終了時に自動で消えるので、
+    プールで使い回す接続に別テナントの設定が残ることもない。
+    """
+    prefix = "SELECT set_config('app.current_tenant_id', %(_rls_tenant_id)s, true); "
+    if isinstance(params, dict):
+        return prefix + query, {**params, "_rls_tenant_id": str(tenant_id)}
+    if params is None:
+        query, params = query.replace("%", "%%"), ()
+    return prefix.replace("%(_rls_tenant_id)s", "%s") + query, (str(tenant_id), *params)
+
+class TenantConnection(psycopg2.extensions.connection):
+    """RLS用のテナントIDとPREPARE済みの文を保持する接続"""
+    tenant_id = None
+    on_commit = None  # コミットのたびに呼ぶ関数（書き込みリクエストの間だけ設定する）
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+    def set_tenant(self, tenant_id):
+        """以降の各トランザクションでRLSのテナントを適用する（DBへの往復なし）"""
+        self.tenant_id = tenant_id
+
+    def commit(self):
+        super().commit()
+        if self.on_commit is not None:
+            self.on_commit()
+
+class TenantCursor(RealDictCursor):
+    """新しいトランザクションの最初の文にテナント設定を相乗りさせるカーソル"""
+
+    def execute(self, query, vars=None):
+        conn = self.connection
+        if (conn.tenant_id is not None
+                and conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE):
+            query, vars = with_tenant_context(query, vars, conn.tenant_id)
+        return super().execute(query, vars)
+
+# データベース接続（IPv4を強制）
+def connect_db(base_params=DB_CONN_PARAMS, resolver=db_host_resolver):
+    conn_params = dict(base_params, host=resolver.resolve())
+    return psycopg2.connect(
+        connection_factory=TenantConnection,
+        cursor_factory=TenantCursor,
+        **conn_params
+    )
+
+class PoolTimeout(Exception):
+    """接続プールから時間内に接続を取得できなかった"""
+
+class ConnectionPool:
+    """スレッドセーフなpsycopg2接続プール
+
+    - min_size本の接続を維持し、max_size本まで拡張する
+    - チェックアウト時、一定時間アイドルだった接続は SELECT 1 で死活確認する
+    - max_lifetimeを超えた接続は破棄して作り直す
+    - 上限に達している場合はtimeout秒まで返却を待つ
+    """
+
+    def __init__(self, connect, min_size, max_size, timeout, max_lifetime, health_check_idle):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, 最終使用時刻)
+        self._created_at = {}  # conn -> 作成時刻
+        self._size = 0  # 作成中・使用中・アイドルを含む接続数
+        self._closed = False
+        self._counters = {
+            "connections_created": 0,
+            "connections_recycled": 0,
+            "connections_broken": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+        }
+
+    def _open(self):
+        """新しい物理接続を作成（スロットは呼び出し側で確保済み）"""
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created_at[conn] = time.monotonic()
+            self._counters["connections_created"] += 1
+        return conn
+
+    def _close_conn(self, conn):
+        self._created_at.pop(conn, None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_expired(self, conn, now):
+        created_at = self._created_at.get(conn, now)
+        return self.max_lifetime > 0 and now - created_at > self.max_lifetime
+
+    def _check(self, conn, last_used):
+        """チェックアウト前の検証。使えない場合はカウンタ名を返す"""
+        now = time.monotonic()
+        if conn.closed:
+            return "connections_broken"
+        if self._is_expired(conn, now):
+            return "connections_recycled"
+        if now - last_used >= self.health_check_idle:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return "connections_broken"
+        return None
+
+    def warm(self):
+        """min_size本まで接続を事前に作成"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            conn = self._open()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self):
+        """接続を取得（上限到達時はtimeout秒まで待機）"""
+        deadline = time.monotonic() + self.timeout
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()  # LIFO: 直近に使った接続を優先
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        conn = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"Timed out after {self.timeout}s waiting for a database connection"
+                        )
+                    if not waited:
+                        self._counters["waits"] += 1
+                        waited = True
+                    self._cond.wait(remaining)
+
+                self._counters["checkouts"] += 1
+                if waited:
+                    self._counters["wait_time_total"] += time.monotonic() - started
+
+            if conn is None:
+                return self._open()
+
+            reason = self._check(conn, last_used)
+            if reason is None:
+                return conn
+
+            # 使えない接続は破棄し、同じスロットで作り直す
+            with self._cond:
+                self._counters[reason] += 1
+                self._close_conn(conn)
+            return self._open()
+
+    def putconn(self, conn, discard=False):
+        """接続を返却（未完了のトランザクションはロールバック）
+
+        テナント設定はトランザクションローカルなのでセッションのリセットは不要。
+        conn.reset()（DISCARD ALL）はPREPARE済みの文まで消してしまうので使わない。
+        """
+        conn.tenant_id = None
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            if discard or conn.closed:
+                self._counters["connections_broken"] += 1
+                self._close_conn(conn)
+                self._size -= 1
+            elif self._closed or self._is_expired(conn, time.monotonic()):
+                self._counters["connections_recycled"] += 1
+                self._close_conn(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        """アイドル接続をすべて閉じる（使用中の接続は返却時に閉じる）"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._close_conn(conn)
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                **self._counters,
+            }
+
+db_pool = ConnectionPool(
+    connect_db,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    max_lifetime=DB_POOL_MAX_LIFETIME,
+    health_check_idle=DB_POOL_HEALTH_CHECK_IDLE,
+)
+
+# リードレプリカ
+REPLICA_CONN_PARAMS = build_db_conn_params(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+replica_host_resolver = (
+    HostResolver(REPLICA_CONN_PARAMS["host"], DB_DNS_TTL, DB_DNS_REFRESH_AHEAD)
+    if REPLICA_CONN_PARAMS else None
+)
+replica_db_pool = None
+if REPLICA_CONN_PARAMS:
+    replica_db_pool = ConnectionPool(
+        partial(connect_db, REPLICA_CONN_PARAMS, replica_host_resolver),
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        health_check_idle=DB_POOL_HEALTH_CHECK_IDLE,
+    )
+
+READ_METHODS = ("GET", "HEAD")
+
+class ReplicaRouter:
+    """読み取りリクエストをリードレプリカに振り分ける
+
+    - GET/HEADのみレプリカへ。それ以外はプライマリ
+    - 書き込んだ直後のクライアント（同じAuthorizationヘッダ）はsticky_seconds秒間
+      プライマリを読む（read-your-writes）
+    - レプリカの遅延がmax_lagを超えている間、または接続に失敗した後は
+      lag_check_interval秒間プライマリにフェイルバックする
+    """
+
+    LAG_SQL = """
+        SELECT CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END AS lag
+    """
+
+    def __init__(self, max_lag, sticky_seconds, lag_check_interval):
+        self.max_lag = max_lag
+        self.sticky_seconds = sticky_seconds
+        self.lag_check_interval = lag_check_interval
+        self._lock = threading.Lock()
+        self._recent_writes = {}  # クライアントキー -> 最終書き込み時刻
+        self._lag = 0.0
+        self._lag_checked_at = None
+        self._counters = {
+            "replica_reads": 0,
+            "primary_reads_sticky": 0,
+            "primary_reads_fallback": 0,
+            "replica_errors": 0,
+        }
+
+    @staticmethod
+    def _client_key(request):
+        return request.headers.get("authorization") or (request.client.host if request.client else None)
+
+    def mark_write(self, request):
+        key = self._client_key(request)
+        if key is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[key] = now
+            if len(self._recent_writes) > 10000:
+                self._recent_writes = {
+                    k: t for k, t in self._recent_writes.items() if now - t < self.sticky_seconds
+                }
+
+    def wants_replica(self, request):
+        if request.method not in READ_METHODS:
+            return False
+        now = time.monotonic()
+        key = self._client_key(request)
+        with self._lock:
+            written_at = self._recent_writes.get(key)
+            if written_at is not None and now - written_at < self.sticky_seconds:
+                self._counters["primary_reads_sticky"] += 1
+                return False
+            if (self._lag is None or self._lag > self.max_lag) and not self.lag_check_due(now):
+                self._counters["primary_reads_fallback"] += 1
+                return False
+        return True
+
+    def lag_check_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self._lag_checked_at is None or now - self._lag_checked_at >= self.lag_check_interval
+
+    def record_lag(self, lag):
+        """遅延を記録し、レプリカを使ってよいかを返す"""
+        with self._lock:
+            self._lag = float(lag or 0)
+            self._lag_checked_at = time.monotonic()
+            if self._lag > self.max_lag:
+                self._counters["primary_reads_fallback"] += 1
+                return False
+            return True
+
+    def record_replica_read(self):
+        with self._lock:
+            self._counters["replica_reads"] += 1
+
+    def record_error(self, error):
+        print(f"[DB] Replica unavailable, falling back to primary: {error}")
+        with self._lock:
+            self._lag = None  # 不明（次の確認までプライマリを使う）
+            self._lag_checked_at = time.monotonic()
+            self._counters["replica_errors"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {"replica_lag_seconds": self._lag, **self._counters}
+
+replica_router = ReplicaRouter(DB_REPLICA_MAX_LAG, DB_REPLICA_STICKY_SECONDS, DB_REPLICA_LAG_CHECK_INTERVAL)
+
+@app.on_event("startup")
+def open_db_pool():
+    for pool in (db_pool, replica_db_pool):
+        if pool is None:
+            continue
+        try:
+            pool.warm()
+        except Exception as e:
+            # DBが起動していなくてもAPI自体は起動させる（接続は初回リクエスト時に作成）
+            print(f"[DB] Failed to warm connection pool: {e}")
+
+@app.on_event("shutdown")
+def close_db_pool():
+    db_pool.close()
+    if replica_db_pool is not None:
+        replica_db_pool.close()
+
+def checkout_db_conn(request):
+    """リクエストに応じてプライマリかレプリカの接続を取得し、(プール, 接続)を返す"""
+    if replica_db_pool is not None and replica_router.wants_replica(request):
+        try:
+            conn = replica_db_pool.getconn()
+        except (PoolTimeout, psycopg2.Error) as e:
+            replica_router.record_error(e)
+        else:
+            usable = True
+            if replica_router.lag_check_due():
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(ReplicaRouter.LAG_SQL)
+                    usable = replica_router.record_lag(cursor.fetchone()["lag"])
+                    conn.rollback()
+                except psycopg2.Error as e:
+                    replica_db_pool.putconn(conn, discard=True)
+                    replica_router.record_error(e)
+                    return db_pool, db_pool.getconn()
+            if usable:
+                replica_router.record_replica_read()
+                return replica_db_pool, conn
+            replica_db_pool.putconn(conn)
+
+    return db_pool, db_pool.getconn()
+
+def acquire_db_conn(request):
+    """checkout_db_conn と同じ。プールのタイムアウトは503にする"""
     try:
-        # IPv4アドレスのみを取得
-        import socket
-        ipv4_addr = socket.gethostbyname(parsed.hostname)
-        conn_params["host"] = ipv4_addr
-    except Exception as e:
-        # DNS解決失敗時はホスト名をそのまま使用
-        print(f"Failed to resolve IPv4 address: {e}")
-        pass
+        return checkout_db_conn(request)
+    except PoolTimeout as e:
+        print(f"[DB] {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is busy, please retry"
+        )
 
-    conn = psycopg2.connect(**conn_params)
+def get_db(request: Request):
+    pool, conn = acquire_db_conn(request)
+    # 書き込みはコミットした時点で記録する（依存関係の後処理はレスポンスの
+    # 送信後に実行されるため、ここで記録すると直後のGETに間に合わない）
+    if replica_db_pool is not None and request.method not in READ_METHODS:
+        conn.on_commit = lambda: replica_router.mark_write(request)
     try:
         yield conn
     finally:
-        conn.close()
+        conn.on_commit = None
+        pool.putconn(conn)
+
+# ========================================
+# 非同期データアクセス（psycopg3）
+# ========================================
+
+class ResolvedAsyncConnection(psycopg.AsyncConnection):
+    """接続のたびにキャッシュ済みIPv4アドレスを使い、RLS用のテナントIDを保持する非同期接続"""
+    tenant_id = None
+    on_commit = None  # コミットのたびに呼ぶ関数（書き込みリクエストの間だけ設定する）
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+    @classmethod
+    async def connect(cls, conninfo="", **kwargs):
+        resolver = kwargs.pop("host_resolver", db_host_resolver)
+        kwargs["host"] = resolver.resolve()
+        return await super().connect(conninfo, **kwargs)
+
+    def set_tenant(self, tenant_id):
+        """以降の各トランザクションでRLSのテナントを適用する（DBへの往復なし）"""
+        self.tenant_id = tenant_id
+
+    async def commit(self):
+        await super().commit()
+        if self.on_commit is not None:
+            self.on_commit()
+
+class TenantAsyncCursor(psycopg.AsyncClientCursor):
+    """新しいトランザクションの最初の文にテナント設定を相乗りさせる非同期カーソル
+
+    複数文を1回で送るため、クライアント側バインドのカーソルを使う。
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        conn = self.connection
+        if (conn.tenant_id is None
+                or conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE):
+            return await super().execute(query, params, **kwargs)
+
+        query, params = with_tenant_context(query, params, conn.tenant_id)
+        await super().execute(query, params, **kwargs)
+        # psycopg3は先頭の結果セットを返すので、本来のクエリの結果に進める
+        self.nextset()
+        return self
+
+async def reset_async_conn(conn):
+    """プール返却時の後処理（未完了のトランザクションはロールバック）
+
+    ConnectionPool.putconn と同じく、テナント設定はトランザクションローカルなので
+    RESET ALL は送らない（トランザクション外ならロールバックも往復しない）。
+    """
+    conn.tenant_id = None
+    await conn.rollback()
+
+async_db_pool = None
+async_replica_db_pool = None
+
+def create_async_pool(conn_params, resolver):
+    return AsyncConnectionPool(
+        kwargs={
+            **conn_params,
+            "row_factory": dict_row,
+            "cursor_factory": TenantAsyncCursor,
+            "host_resolver": resolver,
+        },
+        connection_class=ResolvedAsyncConnection,
+        min_size=DB_ASYNC_POOL_MIN_SIZE,
+        max_size=DB_ASYNC_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        check=AsyncConnectionPool.check_connection,
+        reset=reset_async_conn,
+        open=False,
+    )
+
+@app.on_event("startup")
+async def open_async_db_pool():
+    global async_db_pool, async_replica_db_pool
+    if not DB_ASYNC_ENABLED:
+        return
+    async_db_pool = create_async_pool(DB_CONN_PARAMS, db_host_resolver)
+    # DBが起動していなくてもAPI自体は起動させる
+    await async_db_pool.open(wait=False)
+    if REPLICA_CONN_PARAMS:
+        async_replica_db_pool = create_async_pool(REPLICA_CONN_PARAMS, replica_host_resolver)
+        await async_replica_db_pool.open(wait=False)
+
+@app.on_event("shutdown")
+async def close_async_db_pool():
+    for pool in (async_db_pool, async_replica_db_pool):
+        if pool is not None:
+            await pool.close()
+
+async def checkout_async_db_conn(request):
+    """checkout_db_connの非同期版"""
+    if async_replica_db_pool is not None and replica_router.wants_replica(request):
+        try:
+            conn = await async_replica_db_pool.getconn()
+        except (AsyncPoolTimeout, psycopg.Error) as e:
+            replica_router.record_error(e)
+        else:
+            usable = True
+            if replica_router.lag_check_due():
+                try:
+                    cursor = await conn.execute(ReplicaRouter.LAG_SQL)
+                    usable = replica_router.record_lag((await cursor.fetchone())["lag"])
+                    await conn.rollback()
+                except psycopg.Error as e:
+                    await conn.close()
+                    await async_replica_db_pool.putconn(conn)
+                    replica_router.record_error(e)
+                    return async_db_pool, await async_db_pool.getconn()
+            if usable:
+                replica_router.record_replica_read()
+                return async_replica_db_pool, conn
+            await async_replica_db_pool.putconn(conn)
+
+    return async_db_pool, await async_db_pool.getconn()
+
+async def acquire_async_db_conn(request):
+    """acquire_db_conn の非同期版"""
+    if async_db_pool is None:
+        raise HTTPException(status_code=500, detail="Async database pool is not configured")
+    try:
+        return await checkout_async_db_conn(request)
+    except AsyncPoolTimeout as e:
+        print(f"[DB] {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is busy, please retry"
+        )
+
+async def release_async_db_conn(pool, conn):
+    """トランザクションを終えて返却する（get_async_db を使わずに取得した接続用）"""
+    try:
+        await conn.rollback()
+    except psycopg.Error:
+        await conn.close()
+    await pool.putconn(conn)
+
+async def get_async_db(request: Request):
+    pool, conn = await acquire_async_db_conn(request)
+    # 書き込みはコミットした時点で記録する（get_db と同じ）
+    if async_replica_db_pool is not None and request.method not in READ_METHODS:
+        conn.on_commit = lambda: replica_router.mark_write(request)
+    try:
+        # 正常終了ならコミット、例外ならロールバック（pool.connection()と同じ挙動）
+        async with conn:
+            yield conn
+    finally:
+        conn.on_commit = None
+        await pool.putconn(conn)
+
+def db_route(method, path, async_impl, **kwargs):
+    """同期版/非同期版を持つエンドポイントを、DB_ASYNC_ENABLEDに応じて片方だけ登録する"""
+    def decorator(func):
+        if async_impl == DB_ASYNC_ENABLED:
+            app.add_api_route(path, func, methods=[method.upper()], **kwargs)
+        return func
+    return decorator
+
+# ========================================
+# プリペアドステートメント
+# ========================================
+
+class QueryRegistry:
+    """ホットクエリのプリペアドステートメント管理
+
+    SQLに名前を付けて登録しておき、プールの接続ごとに一度だけPREPAREする。
+    以降はEXECUTEで名前と引数だけを送るので、SQL本文の送信と再プランを省ける。
+    文ごとに実行回数と所要時間を集計する。
+    """
+
+    def __init__(self):
+        self._statements = {}  # name -> (PREPARE文, EXECUTE文)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, sql):
+        """%sプレースホルダのSQLを$1, $2...に変換して登録"""
+        parts = sql.split("%s")
+        prepared_sql = parts[0] + "".join(
+            f"${i}{part}" for i, part in enumerate(parts[1:], start=1)
+        )
+        execute_sql = f"EXECUTE {name}"
+        if len(parts) > 1:
+            execute_sql += f"({', '.join(['%s'] * (len(parts) - 1))})"
+        self._statements[name] = (f"PREPARE {name} AS {prepared_sql}", execute_sql)
+        self._stats[name] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0}
+        return name
+
+    def _record(self, name, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stat = self._stats[name]
+            stat["calls"] += 1
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+
+    def execute(self, cursor, name, params=()):
+        prepare_sql, execute_sql = self._statements[name]
+        conn = cursor.connection
+        if name not in conn.prepared_statements:
+            cursor.execute(prepare_sql)
+            conn.prepared_statements.add(name)
+        started = time.perf_counter()
+        cursor.execute(execute_sql, params)
+        self._record(name, started)
+        return cursor
+
+    async def execute_async(self, cursor, name, params=()):
+        prepare_sql, execute_sql = self._statements[name]
+        conn = cursor.connection
+        if name not in conn.prepared_statements:
+            await cursor.execute(prepare_sql)
+            conn.prepared_statements.add(name)
+        started = time.perf_counter()
+        await cursor.execute(execute_sql, params)
+        self._record(name, started)
+        return cursor
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "calls": stat["calls"],
+                    "total_ms": round(stat["total_ms"], 2),
+                    "avg_ms": round(stat["total_ms"] / stat["calls"], 2) if stat["calls"] else 0.0,
+                    "max_ms": round(stat["max_ms"], 2),
+                }
+                for name, stat in self._stats.items()
+            }
+
+queries = QueryRegistry()
 
 # Pydanticモデル
 class LoginRequest(BaseModel):
@@ -184,6 +923,159 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             detail="Invalid authentication credentials"
         )
 
+# ========================================
+# パスワードハッシュ（bcrypt）
+# ========================================
+class PasswordHasherBusy(Exception):
+    """ハッシュ処理の待ちが上限に達している"""
+
+class PasswordHasher:
+    """bcrypt のハッシュ化・照合を専用のプロセスプールで行う
+
+    CPUを使う処理をリクエストのスレッドプールから切り離し、ログインが
+    集中しても他のエンドポイントを止めないようにする。処理中と待ちの
+    件数が max_pending に達したら、キューに積まずに PasswordHasherBusy
+    を送出する（ハンドラは429にする）。
+    ワーカーはスレッドを持つ親プロセスを fork しないよう spawn で起動する。
+    ワーカーで実行するのは password_hashing モジュールの関数だけ。
+    """
+
+    def __init__(self, workers, max_pending, timeout, rounds):
+        self.workers = max(workers, 1)
+        self.max_pending = max(max_pending, 1)
+        self.timeout = timeout
+        self.rounds = rounds
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._counters = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0, "timeouts": 0}
+
+    def _get_executor(self):
+        # 呼び出し側で self._lock を保持している
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, counter, count, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters["rejected"] += 1
+                raise PasswordHasherBusy("password hashing queue is full")
+            future = self._get_executor().submit(fn, *args)
+            self._pending += 1
+            self._counters[counter] += count
+        future.add_done_callback(self._release)
+        return future
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # 枠はワーカーの処理が終わった時点で戻る
+            with self._lock:
+                self._counters["timeouts"] += 1
+            raise PasswordHasherBusy("password hashing timed out")
+
+    def _run(self, counter, fn, *args):
+        return self._result(self._submit(counter, 1, fn, *args))
+
+    def hash(self, password):
+        return self._run("hashed", password_hashing.hash_password, password, self.rounds)
+
+    def hash_many(self, passwords, chunk_size=PASSWORD_HASH_BULK_CHUNK):
+        """まとめてハッシュ化し、入力順に返す
+
+        chunk_size 件ずつのタスクにして全ワーカーに分散する。同時に投入する
+        タスクは workers 個までで、続きは先に投入したタスクが終わってから
+        投入するため、ログインなど他の呼び出しもタスクの合間に処理される。
+        """
+        hashes = []
+        in_flight = deque()
+        for start in range(0, len(passwords), chunk_size):
+            if len(in_flight) >= self.workers:
+                hashes.extend(self._result(in_flight.popleft()))
+            chunk = passwords[start:start + chunk_size]
+            in_flight.append(
+                self._submit("hashed", len(chunk), password_hashing.hash_passwords, chunk, self.rounds)
+            )
+        while in_flight:
+            hashes.extend(self._result(in_flight.popleft()))
+        return hashes
+
+    def verify(self, password, hashed):
+        """(一致したか, 再ハッシュしたハッシュまたは None) を返す"""
+        verified, new_hash = self._run(
+            "verified", password_hashing.verify_password, password, hashed, self.rounds
+        )
+        if new_hash is not None:
+            with self._lock:
+                self._counters["rehashed"] += 1
+        return verified, new_hash
+
+    def warm(self):
+        """全ワーカーを起動しておく（最初のログインで spawn を待たない）"""
+        with self._lock:
+            executor = self._get_executor()
+        futures = [executor.submit(password_hashing.warm, self.rounds) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "rounds": self.rounds,
+                **self._counters,
+            }
+
+password_hasher = PasswordHasher(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_TIMEOUT, BCRYPT_ROUNDS
+)
+
+@app.on_event("startup")
+def open_password_hasher():
+    try:
+        password_hasher.warm()
+    except Exception as e:
+        # 起動に失敗してもAPI自体は起動させる（ワーカーは初回のハッシュ処理で再度起動する）
+        print(f"[PASSWORD] Failed to start hasher workers: {e}")
+
+@app.on_event("shutdown")
+def close_password_hasher():
+    password_hasher.close()
+
+def password_hasher_call(method, *args):
+    """PasswordHasher を呼び、待ちが上限に達していれば429にする"""
+    try:
+        return method(*args)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many password operations, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+def hash_password(password):
+    return password_hasher_call(password_hasher.hash, password)
+
+def verify_password(password, hashed):
+    return password_hasher_call(password_hasher.verify, password, hashed)
+
 # ルート
 @app.get("/")
 def read_root():
@@ -196,7 +1088,23 @@ def read_root():
 @app.get("/health")
 def health_check():
     """ヘルスチェックエンドポイント（Render用）"""
-    return {"status": "healthy", "version": "1.0.0"}
+    result = {
+        "status": "healthy",
+        "version": "1.0.0",
+        "db_pool": db_pool.stats(),
+        "queries": queries.stats(),
+        "route_cache": route_cache.stats(),
+        "route_catalog_cache": route_catalog_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+    }
+    if replica_db_pool is not None:
+        result["replica_db_pool"] = replica_db_pool.stats()
+        result["replica_routing"] = replica_router.stats()
+    if async_db_pool is not None:
+        result["async_db_pool"] = async_db_pool.get_stats()
+    if async_replica_db_pool is not None:
+        result["async_replica_db_pool"] = async_replica_db_pool.get_stats()
+    return result
 
 @app.post("/api/auth/login", response_model=LoginResponse)
 def login(request: LoginRequest, conn=Depends(get_db)):
@@ -216,15 +1124,31 @@ def login(request: LoginRequest, conn=Depends(get_db)):
             detail="メールアドレスまたはパスワードが正しくありません"
         )
 
+    # bcrypt の処理中は読み取りのトランザクションを開いたままにしない
+    conn.rollback()
+
     # パスワード検証（bcryptハッシュ）
     # サンプルデータのパスワードは 'password'
     # 実際のbcryptハッシュと照合
-    if not pwd_context.verify(request.password, user["password"]):
+    verified, new_hash = verify_password(request.password, user["password"])
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="メールアドレスまたはパスワードが正しくありません"
         )
 
+    # work factor が BCRYPT_ROUNDS より弱ければ作り直したハッシュに置き換える。
+    # 同時にパスワードが変更されていたら上書きしない。表示内容は変わらないため
+    # updated_at・一覧の版数（ETag）は更新しない
+    if new_hash is not None:
+        # RLS設定（UPDATE が始めるトランザクションに相乗り）
+        conn.set_tenant(user["tenant_id"])
+        cursor.execute(
+            "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+            (new_hash, user["id"], user["password"])
+        )
+        conn.commit()
+
     # JWT生成
     token = create_access_token({
         "user_id": user["id"],
@@ -275,8 +1199,14 @@ def signup(request: SignupRequest, conn=Depends(get_db)):
             detail="このメールアドレスは既に登録されています"
         )
 
+    # bcrypt の処理中は読み取りのトランザクションを開いたままにしない
+    conn.rollback()
+
     # パスワードハッシュ化
-    hashed_password = pwd_context.hash(request.password)
+    hashed_password = hash_password(request.password)
+
+    # RLS設定（INSERT が始めるトランザクションに相乗り）
+    conn.set_tenant(tenant_id)
 
     # 新規ユーザー作成
     cursor.execute(
@@ -289,6 +1219,7 @@ def signup(request: SignupRequest, conn=Depends(get_db)):
     )
 
     user = cursor.fetchone()
+    bump_list_version(cursor, tenant_id, "users")
     conn.commit()
 
     # JWT生成
@@ -308,10 +1239,320 @@ def signup(request: SignupRequest, conn=Depends(get_db)):
         }
     }
 
-@app.get("/api/approvals", response_model=List[dict])
+APPROVALS_PAGE_DEFAULT = 100
+APPROVALS_PAGE_MAX = 500
+
+# ========================================
+# 一覧の項目指定（fields=）
+# ========================================
+# GET /api/approvals?fields=id,title,status,applicant_name
+# 指定された項目の式だけをSELECTし、不要なJOINやサブクエリも省く。
+
+def parse_list_fields(fields, available, default):
+    """fields パラメータ（カンマ区切り）を返す項目のタプルにする（省略時は default）"""
+    if fields is None:
+        return default
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    if not names or any(name not in available for name in names):
+        raise HTTPException(
+            status_code=400,
+            detail=f"fields must be a comma-separated list of: {', '.join(available)}"
+        )
+    return names
+
+def select_list_sql(names, available):
+    """項目名のリストをSELECT句の列にする（別名は項目名そのもの）"""
+    return ", ".join(f'{available[name]} as "{name}"' for name in names)
+
+def project_rows(rows, names):
+    """ページング用に追加で取得した列を落とす"""
+    if not rows or len(rows[0]) == len(names):
+        return rows
+    return [{name: row[name] for name in names} for row in rows]
+
+# 承認一覧で返せる項目とそのSQL式
+APPROVAL_LIST_FIELDS = {
+    "id": "a.id",
+    "title": "a.title",
+    "description": "a.description",
+    "status": "a.status",
+    "route_id": "a.route_id",
+    "route_name": "r.name",
+    "total_steps": "rv.total_steps",
+    "applicant_id": "a.applicant_id",
+    "applicant_name": "u.name",
+    "current_step": "a.current_step",
+    "current_approver_id": "a.current_approver_id",
+    "template_id": "a.template_id",
+    "form_data": "a.form_data",
+    "approved_at": "a.approved_at",
+    "rejected_at": "a.rejected_at",
+    "withdrawn_at": "a.withdrawn_at",
+    "created_at": "a.created_at",
+    "updated_at": "a.updated_at",
+}
+# 省略時は一覧画面で使わない form_data（JSON）を返さない
+APPROVAL_LIST_DEFAULT_FIELDS = tuple(name for name in APPROVAL_LIST_FIELDS if name != "form_data")
+
+def approvals_list_sql(my, with_status, after, extra_conditions="", fields=APPROVAL_LIST_DEFAULT_FIELDS):
+    """承認一覧のSQL（フィルタの組み合わせごとに別の文として登録する）
+
+    (created_at, id) のキーセットでページングする。各組み合わせに対応する
+    インデックスは database/migrations/004_approvals_keyset_indexes.sql を参照。
+    extra_conditions はフォーム入力値フィルタ、fields は省略時以外の項目指定
+    （どちらも登録せずにそのまま実行する）。
+    """
+    # カーソルを作るため created_at と id は常に取得する
+    columns = dict.fromkeys((*fields, "created_at", "id"))
+    expressions = [APPROVAL_LIST_FIELDS[name] for name in columns]
+    query = f"""
+        SELECT {select_list_sql(columns, APPROVAL_LIST_FIELDS)}
+        FROM approvals a
+    """
+    if any(expression.startswith("u.") for expression in expressions):
+        query += " INNER JOIN users u ON a.applicant_id = u.id"
+    if any(expression.startswith("r.") for expression in expressions):
+        query += " INNER JOIN approval_routes r ON a.route_id = r.id"
+    if any(expression.startswith("rv.") for expression in expressions):
+        query += (
+            " INNER JOIN approval_route_versions rv"
+            " ON rv.route_id = a.route_id AND rv.version = a.route_version"
+        )
+    query += " WHERE a.tenant_id = %s"
+    if my:
+        query += " AND a.applicant_id = %s"
+    if with_status:
+        query += " AND a.status = %s"
+    if after:
+        query += " AND (a.created_at, a.id) < (%s, %s)"
+    return query + extra_conditions + " ORDER BY a.created_at DESC, a.id DESC LIMIT %s"
+
+for _my in (False, True):
+    for _with_status in (False, True):
+        for _after in (False, True):
+            queries.register(
+                "approvals_list"
+                + ("_my" if _my else "")
+                + ("_status" if _with_status else "")
+                + ("_after" if _after else ""),
+                approvals_list_sql(_my, _with_status, _after),
+            )
+
+def encode_approvals_cursor(row):
+    """一覧の最終行から次ページ用の不透明なカーソルを作る"""
+    raw = json.dumps([row["created_at"].isoformat(), row["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_approvals_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, approval_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(approval_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def build_approvals_list_query(tenant_id, user_id, status, my, cursor, limit):
+    """承認一覧の文の名前とパラメータを決める（同期版・非同期版で共通）
+
+    次ページの有無を判定するため、limit + 1 件取得する。
+    """
+    name = "approvals_list"
+    params = [tenant_id]
+
+    # 自分の申請のみフィルタ
+    if my:
+        name += "_my"
+        params.append(user_id)
+        print(f"[DEBUG] Filtering by applicant_id: {user_id}")
+
+    if status:
+        name += "_status"
+        params.append(status)
+
+    if cursor:
+        name += "_after"
+        params.extend(decode_approvals_cursor(cursor))
+
+    params.append(limit + 1)
+    return name, params
+
+def clamp_page_limit(limit, default, maximum):
+    if not limit:
+        return default
+    return max(1, min(limit, maximum))
+
+def paginate_rows(rows, limit, response, encode_cursor):
+    """limit + 1 件目があれば次ページのカーソルをX-Next-Cursorヘッダに載せる"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1])
+    return rows
+
+# ========================================
+# 条件付きGET（ETag / If-None-Match）
+# ========================================
+# SPAがポーリングするリソースは、updated_at などの検証子だけを読む軽いクエリで
+# ETag を求め、変わっていなければ本体のクエリ・シリアライズをせずに304を返す。
+# 検証子は本体より先に（または同じ文で）読むので、ETag が本体より新しくなることはない。
+
+def make_etag(*validators):
+    """検証子の値から強いETagを作る"""
+    return '"' + hashlib.sha1(repr(validators).encode()).hexdigest() + '"'
+
+def etag_matches(request, etag):
+    """If-None-Match がETagに一致するか（弱い比較）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+def set_etag(response, etag):
+    response.headers["ETag"] = etag
+    # ブラウザにはキャッシュさせつつ、毎回再検証させる
+    response.headers["Cache-Control"] = "private, no-cache"
+
+def not_modified(etag):
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_etag(response, etag)
+    return response
+
+# 一覧の版数（database/migrations/012_tenant_list_versions.sql）。
+# 一覧に出る行を書き込むハンドラは、コミット直前に bump_list_version を呼ぶ。
+# 同じ一覧への書き込みは行ロックで直列になるため、コミットのたびに値が変わる。
+LIST_VERSION_BUMP = queries.register("list_version_bump", """
+    INSERT INTO tenant_list_versions (tenant_id, list, version)
+    VALUES (%s, %s, 1)
+    ON CONFLICT (tenant_id, list) DO UPDATE SET version = tenant_list_versions.version + 1
+""")
+
+def bump_list_version(cursor, tenant_id, list_name):
+    """一覧の版数を上げる（行ロックを持つ時間を短くするためコミット直前に呼ぶ）"""
+    queries.execute(cursor, LIST_VERSION_BUMP, (tenant_id, list_name))
+
+def list_version_sql(list_name, alias):
+    return (
+        f"COALESCE((SELECT version FROM tenant_list_versions "
+        f"WHERE tenant_id = %s AND list = '{list_name}'), 0) as {alias}"
+    )
+
+# ========================================
+# フォーム入力値（form_data）フィルタ
+# ========================================
+# GET /api/approvals?template_id=5&form.amount=gt:100000&form.category=in:a,b
+#   演算子: eq（省略時）/ gt / gte / lt / lte / in（カンマ区切り）
+# フィルタできるのは、管理者が POST /api/form-templates/{id}/filter-indexes で
+# filterable にしたフィールドだけ（そのフィールドの部分インデックスがある）。
+# number 型は数値として、それ以外は文字列として比較する（date は YYYY-MM-DD なので
+# 文字列比較で範囲指定できる）。
+FORM_FILTER_PREFIX = "form."
+FORM_FILTER_OPERATORS = {"eq": "=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "in": "IN"}
+FORM_FIELD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,63}$")
+
+def form_field_sql(field, alias="a."):
+    """フィールド値の式（インデックスの式と同一にする）
+
+    部分インデックスの式と一致させるためフィールドidはリテラルで埋め込む。
+    FORM_FIELD_ID_PATTERN に合わないidは埋め込まない。
+    """
+    if not FORM_FIELD_ID_PATTERN.match(str(field.get("id"))):
+        raise ValueError(f"Invalid form field id: {field.get('id')!r}")
+    value = f"{alias}form_data->>'{field['id']}'"
+    if field.get("type") == "number":
+        return f"(CASE WHEN {value} ~ '^-?[0-9]+(\\.[0-9]+)?$' THEN ({value})::numeric END)"
+    return f"({value})"
+
+def form_filter_index_name(template_id, field):
+    digest = hashlib.md5(field["id"].encode()).hexdigest()[:12]
+    return f"idx_approvals_form_t{template_id}_{digest}"
+
+def parse_form_filters(query_params):
+    """form.<field>=<op>:<value> のクエリパラメータを (field_id, op, value) のリストにする"""
+    filters = []
+    for key, raw in query_params.multi_items():
+        if not key.startswith(FORM_FILTER_PREFIX):
+            continue
+        op, sep, value = raw.partition(":")
+        if not sep or op not in FORM_FILTER_OPERATORS:
+            op, value = "eq", raw
+        filters.append((key[len(FORM_FILTER_PREFIX):], op, value))
+    return filters
+
+def build_form_filter_conditions(template_id, template_fields, filters):
+    """フォーム入力値フィルタのSQL条件とパラメータ
+
+    template_id は部分インデックスの条件と一致させるためリテラルで埋め込む。
+    """
+    fields = {field.get("id"): field for field in template_fields or []}
+    conditions = f" AND a.template_id = {int(template_id)}"
+    params = []
+    for field_id, op, value in filters:
+        field = fields.get(field_id)
+        if field is None or not field.get("filterable") or not FORM_FIELD_ID_PATTERN.match(field_id):
+            raise HTTPException(status_code=400, detail=f"Field '{field_id}' is not filterable")
+
+        values = value.split(",") if op == "in" else [value]
+        if field.get("type") == "number":
+            try:
+                values = [Decimal(v) for v in values]
+            except ArithmeticError:
+                raise HTTPException(status_code=400, detail=f"Field '{field_id}' expects a number")
+
+        if op == "in":
+            conditions += f" AND {form_field_sql(field)} = ANY(%s)"
+            params.append(values)
+        else:
+            conditions += f" AND {form_field_sql(field)} {FORM_FILTER_OPERATORS[op]} %s"
+            params.append(values[0])
+    return conditions, params
+
+FORM_TEMPLATE_FIELDS_SQL = "SELECT id, fields FROM form_templates WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL"
+
+def validate_template_fields(fields, is_admin, current_fields=None):
+    """テンプレート作成・更新で受け取ったフィールド定義を検証する
+
+    フィールドidは FORM_FIELD_ID_PATTERN に合うものだけ受け付ける。
+    filterable はインデックスと対になるため管理者だけが変更できる。管理者以外が
+    送った値は無視し、既存のフィールドの値（current_fields）を引き継ぐ。
+    """
+    current = {field.get("id"): field for field in current_fields or [] if isinstance(field, dict)}
+    for field in fields:
+        if not isinstance(field, dict):
+            raise HTTPException(status_code=400, detail="Each field must be an object")
+        field_id = field.get("id")
+        if not isinstance(field_id, str) or not FORM_FIELD_ID_PATTERN.match(field_id):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Field id {field_id!r} must match {FORM_FIELD_ID_PATTERN.pattern}"
+            )
+        if is_admin:
+            continue
+        field.pop("filterable", None)
+        if current.get(field_id, {}).get("filterable"):
+            field["filterable"] = True
+    return fields
+
+def build_approvals_form_filter_query(tenant_id, user_id, status, my, cursor, limit, template, filters,
+                                     fields=APPROVAL_LIST_DEFAULT_FIELDS):
+    """フォーム入力値フィルタ付きの承認一覧SQLとパラメータ"""
+    if template is None:
+        raise HTTPException(status_code=404, detail="Form template not found")
+    conditions, condition_params = build_form_filter_conditions(template["id"], template["fields"], filters)
+    _, params = build_approvals_list_query(tenant_id, user_id, status, my, cursor, limit)
+    query = approvals_list_sql(my, bool(status), bool(cursor), conditions, fields)
+    return query, params[:-1] + condition_params + params[-1:]
+
+@db_route("get", "/api/approvals", async_impl=False, response_model=List[dict])
 def get_approvals(
+    request: Request,
+    response: Response,
     status: Optional[str] = None,
     my: Optional[bool] = False,
+    limit: Optional[int] = APPROVALS_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    template_id: Optional[int] = None,
+    fields: Optional[str] = None,
     payload: dict = Depends(verify_token),
     conn = Depends(get_db)
 ):
@@ -320,106 +1561,630 @@ def get_approvals(
     Args:
         status: ステータスでフィルタ（pending/approved/rejected/withdrawn）
         my: Trueの場合、自分が作成した申請のみ取得
+        limit: 1ページの件数（最大500）
+        cursor: 前ページのX-Next-Cursorヘッダの値。続きのページを取得する
+        template_id: form.<field> フィルタを使う場合のフォームテンプレート
+        fields: 返す項目（カンマ区切り）。省略時は form_data 以外
+
+    レスポンス本文は従来通り配列。続きがある場合のみ X-Next-Cursor ヘッダに
+    次ページのカーソル（next_cursor）を返す。
     """
     print(f"[DEBUG] get_approvals called - tenant_id: {payload.get('tenant_id')}, user_id: {payload.get('user_id')}, my={my}")
 
-    cursor = conn.cursor()
+    db_cursor = conn.cursor()
 
     tenant_id = payload.get("tenant_id")
     user_id = payload.get("user_id")
+    limit = clamp_page_limit(limit, APPROVALS_PAGE_DEFAULT, APPROVALS_PAGE_MAX)
+    fields = parse_list_fields(fields, APPROVAL_LIST_FIELDS, APPROVAL_LIST_DEFAULT_FIELDS)
 
-    # RLS設定
+    # RLS設定（最初のクエリに相乗り）
     print(f"[DEBUG] Setting RLS tenant_id: {tenant_id}")
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
+    conn.set_tenant(tenant_id)
 
     # 承認一覧取得
     print(f"[DEBUG] Executing query for tenant_id: {tenant_id}")
-    query = """
+    form_filters = parse_form_filters(request.query_params)
+    if form_filters:
+        if template_id is None:
+            raise HTTPException(status_code=400, detail="template_id is required for form filters")
+        db_cursor.execute(FORM_TEMPLATE_FIELDS_SQL, (template_id, tenant_id))
+        query, params = build_approvals_form_filter_query(
+            tenant_id, user_id, status, my, cursor, limit, db_cursor.fetchone(), form_filters, fields
+        )
+        db_cursor.execute(query, params)
+    else:
+        statement, params = build_approvals_list_query(tenant_id, user_id, status, my, cursor, limit)
+        if fields == APPROVAL_LIST_DEFAULT_FIELDS:
+            queries.execute(db_cursor, statement, params)
+        else:
+            db_cursor.execute(approvals_list_sql(my, bool(status), bool(cursor), fields=fields), params)
+    print(f"[DEBUG] Query executed, fetching results...")
+    approvals = db_cursor.fetchall()
+    print(f"[DEBUG] Found {len(approvals)} approvals")
+
+    return project_rows(paginate_rows(approvals, limit, response, encode_approvals_cursor), fields)
+
+@db_route("get", "/api/approvals", async_impl=True, response_model=List[dict])
+async def get_approvals_async(
+    request: Request,
+    response: Response,
+    status: Optional[str] = None,
+    my: Optional[bool] = False,
+    limit: Optional[int] = APPROVALS_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    template_id: Optional[int] = None,
+    fields: Optional[str] = None,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_async_db)
+):
+    """承認一覧取得（非同期版）"""
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+    limit = clamp_page_limit(limit, APPROVALS_PAGE_DEFAULT, APPROVALS_PAGE_MAX)
+    fields = parse_list_fields(fields, APPROVAL_LIST_FIELDS, APPROVAL_LIST_DEFAULT_FIELDS)
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    form_filters = parse_form_filters(request.query_params)
+    if form_filters:
+        if template_id is None:
+            raise HTTPException(status_code=400, detail="template_id is required for form filters")
+        db_cursor = await conn.execute(FORM_TEMPLATE_FIELDS_SQL, (template_id, tenant_id))
+        query, params = build_approvals_form_filter_query(
+            tenant_id, user_id, status, my, cursor, limit, await db_cursor.fetchone(), form_filters, fields
+        )
+        db_cursor = await conn.execute(query, params)
+    else:
+        statement, params = build_approvals_list_query(tenant_id, user_id, status, my, cursor, limit)
+        if fields == APPROVAL_LIST_DEFAULT_FIELDS:
+            db_cursor = await queries.execute_async(conn.cursor(), statement, params)
+        else:
+            db_cursor = await conn.execute(
+                approvals_list_sql(my, bool(status), bool(cursor), fields=fields), params
+            )
+    approvals = await db_cursor.fetchall()
+    return project_rows(paginate_rows(approvals, limit, response, encode_approvals_cursor), fields)
+
+def approvals_inbox_sql(after):
+    """自分の承認待ち一覧のSQL
+
+    current_approver_id が自分、または自分を代理人とする有効な代理設定の
+    委任元ユーザーである申請を返す。
+    承認者ごとに database/migrations/005_approvals_inbox_index.sql の部分インデックスを
+    (created_at, id) の降順で範囲スキャンし（1人あたり最大 LIMIT 件）、それをまとめて
+    並べ直す。current_approver_id = ANY(...) の1回のスキャンでは並び順に読めず、
+    該当する申請をすべて読んでからソートすることになる。
+    """
+    keyset = " AND (a.created_at, a.id) < (%s, %s)" if after else ""
+    return f"""
         SELECT
             a.*,
             u.name as applicant_name,
             r.name as route_name
-        FROM approvals a
+        FROM (
+            SELECT %s::bigint AS approver_id
+            UNION
+            SELECT d.user_id FROM delegations d
+            WHERE d.delegate_user_id = %s
+              AND d.deleted_at IS NULL
+              AND CURRENT_DATE BETWEEN d.start_date AND d.end_date
+        ) approvers
+        CROSS JOIN LATERAL (
+            SELECT a.* FROM approvals a
+            WHERE a.tenant_id = %s
+              AND a.status = 'pending'
+              AND a.current_approver_id = approvers.approver_id
+              AND a.applicant_id <> %s{keyset}
+            ORDER BY a.created_at DESC, a.id DESC
+            LIMIT %s
+        ) a
         INNER JOIN users u ON a.applicant_id = u.id
         INNER JOIN approval_routes r ON a.route_id = r.id
-        WHERE a.tenant_id = %s
+        ORDER BY a.created_at DESC, a.id DESC
+        LIMIT %s
     """
-    params = [tenant_id]
-
-    # 自分の申請のみフィルタ
-    if my:
-        query += " AND a.applicant_id = %s"
-        params.append(user_id)
-        print(f"[DEBUG] Filtering by applicant_id: {user_id}")
 
-    if status:
-        query += " AND a.status = %s"
-        params.append(status)
+APPROVALS_INBOX = queries.register("approvals_inbox", approvals_inbox_sql(False))
+APPROVALS_INBOX_AFTER = queries.register("approvals_inbox_after", approvals_inbox_sql(True))
+
+def build_approvals_inbox_query(tenant_id, user_id, cursor, limit):
+    params = [user_id, user_id, tenant_id, user_id]
+    if cursor:
+        params.extend(decode_approvals_cursor(cursor))
+    params.extend([limit + 1, limit + 1])
+    return (APPROVALS_INBOX_AFTER if cursor else APPROVALS_INBOX), params
+
+@db_route("get", "/api/approvals/inbox", async_impl=False, response_model=List[dict])
+def get_approvals_inbox(
+    response: Response,
+    limit: Optional[int] = APPROVALS_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_db)
+):
+    """自分の承認待ち一覧取得（代理承認分を含む）
 
-    query += " ORDER BY a.created_at DESC LIMIT 100"
+    ページングは GET /api/approvals と同じく cursor / X-Next-Cursor で行う。
+    """
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+    limit = clamp_page_limit(limit, APPROVALS_PAGE_DEFAULT, APPROVALS_PAGE_MAX)
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    db_cursor = conn.cursor()
+    statement, params = build_approvals_inbox_query(tenant_id, user_id, cursor, limit)
+    queries.execute(db_cursor, statement, params)
+    approvals = db_cursor.fetchall()
+    return paginate_rows(approvals, limit, response, encode_approvals_cursor)
+
+@db_route("get", "/api/approvals/inbox", async_impl=True, response_model=List[dict])
+async def get_approvals_inbox_async(
+    response: Response,
+    limit: Optional[int] = APPROVALS_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_async_db)
+):
+    """自分の承認待ち一覧取得（非同期版）"""
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+    limit = clamp_page_limit(limit, APPROVALS_PAGE_DEFAULT, APPROVALS_PAGE_MAX)
 
-    cursor.execute(query, params)
-    print(f"[DEBUG] Query executed, fetching results...")
-    approvals = cursor.fetchall()
-    print(f"[DEBUG] Found {len(approvals)} approvals")
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
-    return approvals
+    statement, params = build_approvals_inbox_query(tenant_id, user_id, cursor, limit)
+    db_cursor = await queries.execute_async(conn.cursor(), statement, params)
+    approvals = await db_cursor.fetchall()
+    return paginate_rows(approvals, limit, response, encode_approvals_cursor)
 
-class CreateApprovalRequest(BaseModel):
-    title: str
-    description: Optional[str] = None
-    route_id: int
-    template_id: Optional[int] = None
-    form_data: Optional[dict] = None
+# 検索用の式（database/migrations/008_approvals_search.sql のインデックス式と同一）
+APPROVAL_SEARCH_VECTOR_SQL = """(setweight(to_tsvector('simple', coalesce(a.title, '')), 'A')
+     || setweight(to_tsvector('simple', coalesce(a.description, '')), 'B')
+     || setweight(jsonb_to_tsvector('simple', coalesce(a.form_data, '{}'::jsonb), '["string", "numeric"]'), 'C'))"""
+APPROVAL_SEARCH_TEXT_SQL = """(coalesce(a.title, '') || ' ' || coalesce(a.description, '') || ' ' || coalesce(a.form_data::text, ''))"""
 
-class RouteStepRequest(BaseModel):
-    step_order: int
-    approver_id: int
-    is_required: bool = True
-    is_parallel_group: bool = False
-    parallel_requirement: Optional[str] = None  # 'all' or 'any'
+APPROVALS_SEARCH_PAGE_DEFAULT = 20
+APPROVALS_SEARCH_PAGE_MAX = 100
 
-class CreateRouteRequest(BaseModel):
-    name: str
-    description: Optional[str] = None
-    is_active: bool = True
-    steps: List[RouteStepRequest]
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
-class UpdateRouteRequest(BaseModel):
-    name: Optional[str] = None
-    description: Optional[str] = None
-    is_active: Optional[bool] = None
-    steps: Optional[List[RouteStepRequest]] = None
+def encode_search_cursor(row):
+    raw = json.dumps([row["rank"], row["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
 
-class CreateUserRequest(BaseModel):
-    name: str
-    email: EmailStr
-    password: str
-    role: str = "member"  # admin, manager, member
+def decode_search_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, approval_id = json.loads(raw)
+        return float(rank), int(approval_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def build_approvals_search_query(tenant_id, q, status, date_from, date_to, cursor, limit):
+    """承認検索のSQLとパラメータ（同期版・非同期版で共通）
+
+    全文インデックス（単語単位）とトライグラムインデックス（部分一致）の
+    どちらかに当たった申請を、関連度（ts_rank + word_similarity）順に返す。
+    関連度は real で比較し、(rank, id) のキーセットでページングする。
+    """
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="q is required")
 
-class UpdateUserRequest(BaseModel):
-    name: Optional[str] = None
-    email: Optional[EmailStr] = None
-    password: Optional[str] = None
-    role: Optional[str] = None
+    filters = ""
+    params = [q, q, tenant_id, q, f"%{escape_like(q)}%"]
+    if status:
+        filters += " AND a.status = %s"
+        params.append(status)
+    if date_from:
+        filters += " AND a.created_at >= %s"
+        params.append(date_from)
+    if date_to:
+        filters += " AND a.created_at < %s"
+        params.append(date_to + timedelta(days=1))
+
+    after = ""
+    if cursor:
+        after = " WHERE (s.rank, s.id) < (%s::real, %s)"
+        params.extend(decode_search_cursor(cursor))
+    params.append(limit + 1)
+
+    query = f"""
+        SELECT s.* FROM (
+            SELECT
+                a.*,
+                u.name as applicant_name,
+                r.name as route_name,
+                (ts_rank({APPROVAL_SEARCH_VECTOR_SQL}, websearch_to_tsquery('simple', %s))
+                 + word_similarity(%s, {APPROVAL_SEARCH_TEXT_SQL}))::real as rank
+            FROM approvals a
+            INNER JOIN users u ON a.applicant_id = u.id
+            INNER JOIN approval_routes r ON a.route_id = r.id
+            WHERE a.tenant_id = %s
+              AND (
+                  {APPROVAL_SEARCH_VECTOR_SQL} @@ websearch_to_tsquery('simple', %s)
+                  OR {APPROVAL_SEARCH_TEXT_SQL} ILIKE %s
+              ){filters}
+        ) s{after}
+        ORDER BY s.rank DESC, s.id DESC
+        LIMIT %s
+    """
+    return query, params
 
-@app.post("/api/approvals")
-def create_approval(
-    request_body: CreateApprovalRequest,
+@db_route("get", "/api/approvals/search", async_impl=False, response_model=List[dict])
+def search_approvals(
+    response: Response,
+    q: str,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = APPROVALS_SEARCH_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
     payload: dict = Depends(verify_token),
     conn = Depends(get_db)
 ):
-    """新規承認申請を作成"""
-    print(f"[DEBUG] create_approval called - title: {request_body.title}")
+    """承認検索（タイトル・説明・フォーム入力値）
 
-    cursor = conn.cursor()
+    Args:
+        q: 検索語（websearch形式。"..." でフレーズ、-で除外）
+        status: ステータスでフィルタ
+        date_from, date_to: 申請日（created_at）の範囲。両端を含む
+        limit: 1ページの件数（最大100）
+        cursor: 前ページのX-Next-Cursorヘッダの値
+
+    結果は関連度順。各行の rank が関連度。
+    """
     tenant_id = payload.get("tenant_id")
-    user_id = payload.get("user_id")
+    limit = clamp_page_limit(limit, APPROVALS_SEARCH_PAGE_DEFAULT, APPROVALS_SEARCH_PAGE_MAX)
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    db_cursor = conn.cursor()
+    query, params = build_approvals_search_query(tenant_id, q, status, date_from, date_to, cursor, limit)
+    db_cursor.execute(query, params)
+    approvals = db_cursor.fetchall()
+    return paginate_rows(approvals, limit, response, encode_search_cursor)
+
+@db_route("get", "/api/approvals/search", async_impl=True, response_model=List[dict])
+async def search_approvals_async(
+    response: Response,
+    q: str,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = APPROVALS_SEARCH_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_async_db)
+):
+    """承認検索（非同期版）"""
+    tenant_id = payload.get("tenant_id")
+    limit = clamp_page_limit(limit, APPROVALS_SEARCH_PAGE_DEFAULT, APPROVALS_SEARCH_PAGE_MAX)
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    query, params = build_approvals_search_query(tenant_id, q, status, date_from, date_to, cursor, limit)
+    db_cursor = await conn.execute(query, params)
+    approvals = await db_cursor.fetchall()
+    return paginate_rows(approvals, limit, response, encode_search_cursor)
+
+# ========================================
+# 承認エクスポート API（監査用）
+# ========================================
+# 1年分など件数の多いエクスポートを、名前付き（サーバーサイド）カーソルで
+# EXPORT_FETCH_SIZE 件ずつ取り出してそのままレスポンスに書き出す。
+# 一覧APIのように fetchall() しないので、件数に関係なくメモリ使用量は一定。
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+EXPORT_INCLUDES = ("histories", "files")
+EXPORT_COLUMNS = [
+    "id", "title", "description", "status", "applicant_id", "applicant_name",
+    "route_id", "route_name", "template_id", "form_data", "current_step",
+    "created_at", "updated_at",
+]
+
+# 承認履歴・添付ファイルは申請ごとに JSON 配列へ集約して同じ行に含める
+EXPORT_INCLUDE_SQL = {
+    "histories": """
+        (SELECT COALESCE(json_agg(json_build_object(
+                    'user_id', h.user_id, 'user_name', hu.name, 'action', h.action,
+                    'step_order', h.step_order, 'comment', h.comment, 'created_at', h.created_at
+                ) ORDER BY h.created_at, h.id), '[]'::json)
+         FROM approval_histories h
+         LEFT JOIN users hu ON h.user_id = hu.id
+         WHERE h.approval_id = a.id) as histories""",
+    "files": """
+        (SELECT COALESCE(json_agg(json_build_object(
+                    'id', f.id, 'file_name', f.file_name, 'file_size', f.file_size,
+                    'mime_type', f.mime_type, 'uploader_id', f.uploader_id, 'created_at', f.created_at
+                ) ORDER BY f.id), '[]'::json)
+         FROM files f
+         WHERE f.approval_id = a.id AND f.deleted_at IS NULL) as files""",
+}
+
+def parse_export_includes(include):
+    includes = [name for name in (include or "").split(",") if name]
+    unknown = set(includes) - set(EXPORT_INCLUDES)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"include must be a comma-separated list of {', '.join(EXPORT_INCLUDES)}"
+        )
+    return [name for name in EXPORT_INCLUDES if name in includes]
+
+def build_approvals_export_query(tenant_id, status, date_from, date_to, includes):
+    """エクスポート用のSQL（作成日時の古い順）"""
+    columns = ["a." + name for name in EXPORT_COLUMNS if name not in ("applicant_name", "route_name")]
+    columns += ["u.name as applicant_name", "r.name as route_name"]
+    columns += [EXPORT_INCLUDE_SQL[name] for name in includes]
+    query = f"""
+        SELECT {", ".join(columns)}
+        FROM approvals a
+        LEFT JOIN users u ON a.applicant_id = u.id
+        LEFT JOIN approval_routes r ON a.route_id = r.id
+        WHERE a.tenant_id = %s
+    """
+    params = [tenant_id]
+    if status:
+        query += " AND a.status = %s"
+        params.append(status)
+    if date_from:
+        query += " AND a.created_at >= %s"
+        params.append(date_from)
+    if date_to:
+        query += " AND a.created_at < %s"
+        params.append(date_to + timedelta(days=1))
+    return query + " ORDER BY a.created_at, a.id", params
+
+def export_json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+class ApprovalExportWriter:
+    """取り出した行を CSV / NDJSON の文字列に変換する"""
+
+    def __init__(self, fmt, includes):
+        self.fmt = fmt
+        self.columns = EXPORT_COLUMNS + includes
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer) if fmt == "csv" else None
+
+    def header(self):
+        if self.writer is None:
+            return ""
+        self.writer.writerow(self.columns)
+        return self._flush()
+
+    def rows(self, rows):
+        if self.writer is None:
+            for row in rows:
+                self.buffer.write(json.dumps(row, ensure_ascii=False, default=export_json_default))
+                self.buffer.write("\n")
+            return self._flush()
+
+        # CSVでは form_data・履歴・ファイルは JSON 文字列の列にする
+        for row in rows:
+            self.writer.writerow([
+                json.dumps(value, ensure_ascii=False, default=export_json_default)
+                if isinstance(value, (dict, list))
+                else value.isoformat() if isinstance(value, (datetime, date))
+                else value
+                for value in (row[column] for column in self.columns)
+            ])
+        return self._flush()
+
+    def _flush(self):
+        chunk = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return chunk
+
+def approvals_export_response(stream, fmt):
+    filename = f"approvals-{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    return StreamingResponse(
+        stream,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@db_route("get", "/api/approvals/export", async_impl=False)
+def export_approvals(
+    request: Request,
+    format: str = "csv",
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    include: Optional[str] = None,
+    payload: dict = Depends(verify_token)
+):
+    """承認データのエクスポート（管理者のみ）
+
+    Args:
+        format: csv / ndjson
+        status: ステータスでフィルタ
+        date_from: 作成日の開始（この日を含む）
+        date_to: 作成日の終了（この日を含む）
+        include: histories,files のカンマ区切り。承認履歴・添付ファイル情報を各行に含める
+
+    DB接続はレスポンスを書き終えるまで使うため、get_db（後処理はレスポンス送信後）
+    ではなくここで取得し、ストリームの終了時に返却する。取得の失敗・権限・クエリの
+    エラーはストリームを始める前に返す。
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    includes = parse_export_includes(include)
+
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+
+    pool, conn = acquire_db_conn(request)
+    try:
+        # RLS設定（最初のクエリに相乗り）
+        conn.set_tenant(tenant_id)
+
+        # 名前付きカーソルの DECLARE にはテナント設定を相乗りできないので、
+        # 権限確認を先に実行してトランザクションを開始しておく
+        cursor = conn.cursor()
+        cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+        user = cursor.fetchone()
+        if not user or user["role"] != "admin":
+            raise HTTPException(status_code=403, detail="Admin only")
+
+        query, params = build_approvals_export_query(tenant_id, status, date_from, date_to, includes)
+        export_cursor = conn.cursor(name="approvals_export")
+        export_cursor.execute(query, params)
+    except BaseException:
+        pool.putconn(conn)
+        raise
+
+    writer = ApprovalExportWriter(format, includes)
+
+    def stream():
+        try:
+            yield  # 開始の目印（下の next まで進める）
+            yield writer.header()
+            while True:
+                rows = export_cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                yield writer.rows(rows)
+        finally:
+            # 名前付きカーソルは返却時のロールバックで閉じる
+            pool.putconn(conn)
+
+    chunks = stream()
+    # 開始しておくと、一度も読まれずに破棄された場合（送信前の切断など）も finally で返却される
+    next(chunks)
+    return approvals_export_response(chunks, format)
+
+@db_route("get", "/api/approvals/export", async_impl=True)
+async def export_approvals_async(
+    request: Request,
+    format: str = "csv",
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    include: Optional[str] = None,
+    payload: dict = Depends(verify_token)
+):
+    """承認データのエクスポート（非同期版）"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    includes = parse_export_includes(include)
+
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+
+    # 同期版と同じく、接続はここで取得してストリームの終了時に返却する
+    pool, conn = await acquire_async_db_conn(request)
+    try:
+        # RLS設定（最初のクエリに相乗り）
+        conn.set_tenant(tenant_id)
+
+        db_cursor = await conn.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+        user = await db_cursor.fetchone()
+        if not user or user["role"] != "admin":
+            raise HTTPException(status_code=403, detail="Admin only")
+
+        query, params = build_approvals_export_query(tenant_id, status, date_from, date_to, includes)
+        export_cursor = conn.cursor(name="approvals_export")
+        await export_cursor.execute(query, params)
+    except BaseException:
+        await release_async_db_conn(pool, conn)
+        raise
+
+    writer = ApprovalExportWriter(format, includes)
+
+    async def stream():
+        try:
+            yield  # 開始の目印（下の __anext__ まで進める）
+            yield writer.header()
+            while True:
+                rows = await export_cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                yield writer.rows(rows)
+        finally:
+            try:
+                await export_cursor.close()
+            finally:
+                await release_async_db_conn(pool, conn)
+
+    chunks = stream()
+    await chunks.__anext__()
+    return approvals_export_response(chunks, format)
+
+class CreateApprovalRequest(BaseModel):
+    title: str
+    description: Optional[str] = None
+    route_id: int
+    template_id: Optional[int] = None
+    form_data: Optional[dict] = None
+
+class RouteStepRequest(BaseModel):
+    step_order: int
+    approver_id: int
+    is_required: bool = True
+    is_parallel_group: bool = False
+    parallel_requirement: Optional[str] = None  # 'all' or 'any'
+
+class CreateRouteRequest(BaseModel):
+    name: str
+    description: Optional[str] = None
+    is_active: bool = True
+    steps: List[RouteStepRequest]
+
+class UpdateRouteRequest(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    is_active: Optional[bool] = None
+    steps: Optional[List[RouteStepRequest]] = None
+
+class CreateUserRequest(BaseModel):
+    name: str
+    email: EmailStr
+    password: str
+    role: str = "member"  # admin, manager, member
+
+class BulkUserRow(BaseModel):
+    name: str
+    email: EmailStr
+    role: str = "member"  # admin, manager, member
+    password: Optional[str] = None
+    password_hash: Optional[str] = None  # 移行元の bcrypt ハッシュ（password の代わり）
+
+class UpdateUserRequest(BaseModel):
+    name: Optional[str] = None
+    email: Optional[EmailStr] = None
+    password: Optional[str] = None
+    role: Optional[str] = None
+
+@app.post("/api/approvals")
+def create_approval(
+    request_body: CreateApprovalRequest,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_db)
+):
+    """新規承認申請を作成"""
+    print(f"[DEBUG] create_approval called - title: {request_body.title}")
+
+    cursor = conn.cursor()
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # 承認ルートの存在確認
     cursor.execute(
@@ -431,21 +2196,25 @@ def create_approval(
     if not route:
         raise HTTPException(status_code=404, detail="Approval route not found")
 
+    # 現在のバージョンに固定する（以降ルートを編集してもこの申請の構成は変わらない）
+    route_version = route["layout_version"]
+    initial = get_route_layout(cursor, route["id"], route_version).start()
+
     # 新規承認申請を作成
     form_data_json = json.dumps(request_body.form_data) if request_body.form_data else None
 
     cursor.execute(
         """
         INSERT INTO approvals (
-            tenant_id, route_id, applicant_id, title, description,
+            tenant_id, route_id, route_version, applicant_id, title, description,
             template_id, form_data,
-            status, current_step, created_at, updated_at
+            status, current_step, current_approver_id, created_at, updated_at
         )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, 'pending', 1, NOW(), NOW())
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'pending', %s, %s, NOW(), NOW())
         RETURNING id
         """,
-        (tenant_id, request_body.route_id, user_id, request_body.title, request_body.description,
-         request_body.template_id, form_data_json)
+        (tenant_id, request_body.route_id, route_version, user_id, request_body.title, request_body.description,
+         request_body.template_id, form_data_json, initial.current_step, initial.current_approver_id)
     )
 
     result = cursor.fetchone()
@@ -461,65 +2230,416 @@ def create_approval(
         "approval_id": approval_id
     }
 
+# ========================================
+# 承認ルートエンジン
+# ========================================
+# 承認ルートを step_order ごとのステージに分け、不変の遷移表にコンパイルする。
+#   - 同じ step_order のステップは1つのステージ（並列グループ）になる
+#   - parallel_requirement='any' は誰か一人、'all'（既定）は必須承認者全員の承認で完了
+#   - is_required=False の承認者は完了条件に含めない。必須承認者がいない
+#     ステージは承認待ちにせず読み飛ばす
+# ステージ内の承認状況は approvals.stage_approved_mask のビットで持つため、
+# 承認1件の評価は辞書引きとビット演算だけで済む。
+PARALLEL_REQUIREMENTS = ("all", "any")
+STAGE_MAX_APPROVERS = 63  # stage_approved_mask（BIGINT）のビット数
+
+Transition = namedtuple("Transition", ["status", "current_step", "approved_mask", "current_approver_id"])
+
+class AlreadyApproved(Exception):
+    pass
+
+class RouteStage:
+    """同じ step_order を持つステップの集まり（単独ステップは承認者1人のステージ）"""
+
+    __slots__ = ("step_order", "approvers", "bits", "required_mask", "requirement")
+
+    def __init__(self, step_order, steps):
+        if len(steps) > STAGE_MAX_APPROVERS:
+            raise ValueError(f"Step {step_order} has too many approvers (max {STAGE_MAX_APPROVERS})")
+
+        requirements = {step.get("parallel_requirement") for step in steps} - {None}
+        if not requirements <= set(PARALLEL_REQUIREMENTS):
+            raise ValueError("parallel_requirement must be 'all' or 'any'")
+        if len(requirements) > 1:
+            raise ValueError(f"Step {step_order} mixes parallel requirements")
+
+        self.step_order = step_order
+        self.requirement = requirements.pop() if requirements else "all"
+        self.approvers = tuple(step["approver_id"] for step in steps)
+        if len(set(self.approvers)) != len(self.approvers):
+            raise ValueError(f"Step {step_order} lists the same approver twice")
+
+        # ビット i が approvers[i] に対応する
+        self.bits = {approver_id: 1 << i for i, approver_id in enumerate(self.approvers)}
+        self.required_mask = 0
+        for i, step in enumerate(steps):
+            if step.get("is_required") is not False:
+                self.required_mask |= 1 << i
+
+    def is_complete(self, mask):
+        if self.requirement == "any":
+            return mask != 0
+        return mask & self.required_mask == self.required_mask
+
+    def next_approver(self, mask):
+        """まだ承認していない必須承認者のうち先頭（current_approver_id に使う）"""
+        outstanding = self.required_mask & ~mask
+        if not outstanding:
+            return None
+        return self.approvers[(outstanding & -outstanding).bit_length() - 1]
+
+class CompiledRoute:
+    """承認ルートの遷移表（不変）
+
+    steps は approval_route_versions.step_layout と同じ形式（step_order 順）。
+    """
+
+    def __init__(self, steps, layout_version=None):
+        groups = {}
+        for step in steps:
+            groups.setdefault(step["step_order"], []).append(step)
+        stages = [RouteStage(order, groups[order]) for order in sorted(groups)]
+
+        self.layout_version = layout_version
+        self.steps = tuple(steps)
+        self.total_steps = len(stages)
+        self.end_step = stages[-1].step_order + 1 if stages else 1
+
+        # 承認待ちにするステージと、各ステージの次に進むステージ
+        blocking = [stage for stage in stages if stage.required_mask]
+        self._stages = {stage.step_order: stage for stage in blocking}
+        self._blocking_orders = [stage.step_order for stage in blocking]
+        self._next = {}
+        for current, following in zip(blocking, blocking[1:] + [None]):
+            self._next[current.step_order] = following
+        self.first_stage = blocking[0] if blocking else None
+
+    def _enter(self, stage):
+        if stage is None:
+            return Transition("approved", self.end_step, 0, None)
+        return Transition("pending", stage.step_order, 0, stage.next_approver(0))
+
+    def start(self):
+        """申請作成時の状態"""
+        if self.first_stage is None:
+            # 承認待ちにするステップが無いルートは、最初の承認で完了させる
+            return Transition("pending", 1, 0, None)
+        return self._enter(self.first_stage)
+
+    def approve(self, current_step, approved_mask, approver_id, on_behalf_of=None):
+        """current_step で approver_id が承認した後の状態を返す
+
+        approver_id がステージの承認者でない場合（代理承認・管理者による承認）は
+        on_behalf_of（通常は current_approver_id）の分として扱う。
+        """
+        stage = self._stages.get(current_step)
+        if stage is None:
+            # ルートの変更などで現在のステップが遷移表に無い場合は、その次へ進める
+            index = bisect_right(self._blocking_orders, current_step)
+            following = self._stages[self._blocking_orders[index]] if index < len(self._blocking_orders) else None
+            return self._enter(following)
+
+        bit = stage.bits.get(approver_id)
+        if bit is None:
+            bit = stage.bits.get(on_behalf_of)
+        if bit is None:
+            outstanding = stage.required_mask & ~approved_mask
+            bit = outstanding & -outstanding
+        if approved_mask & bit:
+            raise AlreadyApproved()
+
+        mask = approved_mask | bit
+        if stage.is_complete(mask):
+            return self._enter(self._next[current_step])
+        return Transition("pending", current_step, mask, stage.next_approver(mask))
+
+def build_step_layout(steps):
+    """ステップ定義を step_order 順のレイアウトと総ステップ数に変換
+
+    ルートとして成り立たない構成は ValueError にする。
+    """
+    layout = sorted(
+        (
+            {
+                "step_order": step.step_order,
+                "approver_id": step.approver_id,
+                "is_required": step.is_required,
+                "is_parallel_group": step.is_parallel_group,
+                "parallel_requirement": step.parallel_requirement,
+            }
+            for step in steps
+        ),
+        key=lambda step: step["step_order"],
+    )
+    return CompiledRoute(layout).total_steps, layout
+
+# ステップ定義を既存の approval_route_steps と (step_order, approver_id) で突き合わせ、
+# 消えたものの削除・属性の変わったものの更新・新しいものの追加を1文で行う。
+# 変わっていない行には触れない
+ROUTE_STEPS_SYNC = queries.register("route_steps_sync", """
+    WITH incoming AS (
+        SELECT *
+        FROM unnest(%s::int[], %s::bigint[], %s::boolean[], %s::boolean[], %s::varchar[])
+            AS s(step_order, approver_id, is_required, is_parallel_group, parallel_requirement)
+    ),
+    removed AS (
+        DELETE FROM approval_route_steps ars
+        WHERE ars.route_id = %s
+          AND NOT EXISTS (
+              SELECT 1 FROM incoming i
+              WHERE i.step_order = ars.step_order AND i.approver_id = ars.approver_id
+          )
+        RETURNING ars.id
+    ),
+    changed AS (
+        UPDATE approval_route_steps ars
+        SET is_required = i.is_required,
+            is_parallel_group = i.is_parallel_group,
+            parallel_requirement = i.parallel_requirement,
+            updated_at = NOW()
+        FROM incoming i
+        WHERE ars.route_id = %s
+          AND ars.step_order = i.step_order AND ars.approver_id = i.approver_id
+          AND (ars.is_required, ars.is_parallel_group, ars.parallel_requirement)
+              IS DISTINCT FROM (i.is_required, i.is_parallel_group, i.parallel_requirement)
+        RETURNING ars.id
+    ),
+    added AS (
+        INSERT INTO approval_route_steps (
+            route_id, step_order, approver_id, is_required, is_parallel_group, parallel_requirement,
+            created_at, updated_at
+        )
+        SELECT %s, i.step_order, i.approver_id, i.is_required, i.is_parallel_group, i.parallel_requirement,
+               NOW(), NOW()
+        FROM incoming i
+        WHERE NOT EXISTS (
+            SELECT 1 FROM approval_route_steps ars
+            WHERE ars.route_id = %s
+              AND ars.step_order = i.step_order AND ars.approver_id = i.approver_id
+        )
+        RETURNING id
+    )
+    SELECT
+        (SELECT COUNT(*) FROM added) as added,
+        (SELECT COUNT(*) FROM changed) as changed,
+        (SELECT COUNT(*) FROM removed) as removed
+""")
+
+def sync_route_steps(cursor, route_id, step_layout):
+    """build_step_layout のレイアウトに approval_route_steps を合わせる
+
+    ステップ数によらず1往復。追加・更新・削除の件数を返す。
+    """
+    columns = [
+        [step[name] for step in step_layout]
+        for name in ("step_order", "approver_id", "is_required", "is_parallel_group", "parallel_requirement")
+    ]
+    queries.execute(cursor, ROUTE_STEPS_SYNC, (*columns, route_id, route_id, route_id, route_id))
+    return dict(cursor.fetchone())
+
+class RouteLayoutCache:
+    """コンパイル済み承認ルートのプロセス内キャッシュ
+
+    キーは (route_id, version)。ルートのバージョン（approval_route_versions）は
+    作成後に変わらないため、エントリは検証も破棄もしない。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, route_id, version):
+        with self._lock:
+            route = self._entries.get((route_id, version))
+            if route is not None:
+                self.hits += 1
+                return route
+            self.misses += 1
+            return None
+
+    def store(self, row):
+        route = CompiledRoute(row["step_layout"], row["version"])
+        with self._lock:
+            self._entries[(row["route_id"], row["version"])] = route
+        return route
+
+    def stats(self):
+        with self._lock:
+            return {"versions": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+route_cache = RouteLayoutCache()
+
+ROUTE_LAYOUT = queries.register("route_layout", """
+    SELECT route_id, version, total_steps, step_layout
+    FROM approval_route_versions
+    WHERE route_id = %s AND version = %s
+""")
+
+# 承認ルートを書き込む文（CTE route で RETURNING * した行）に続けて、
+# その構成をバージョンとして登録するCTE
+ROUTE_VERSION_INSERT_SQL = """
+        version AS (
+            INSERT INTO approval_route_versions (route_id, version, total_steps, step_layout, created_at)
+            SELECT id, layout_version, total_steps, step_layout, NOW()
+            FROM route
+        )"""
+
+def get_route_layout(cursor, route_id, version):
+    route = route_cache.lookup(route_id, version)
+    if route is None:
+        queries.execute(cursor, ROUTE_LAYOUT, (route_id, version))
+        route = route_cache.store(cursor.fetchone())
+    return route
+
+async def get_route_layout_async(conn, route_id, version):
+    route = route_cache.lookup(route_id, version)
+    if route is None:
+        cursor = await queries.execute_async(conn.cursor(), ROUTE_LAYOUT, (route_id, version))
+        route = route_cache.store(await cursor.fetchone())
+    return route
+
+# 一覧のETagの検証子。ルートと、承認者名を引くユーザーの一覧の版数
+APPROVAL_ROUTES_VALIDATOR = queries.register("approval_routes_validator", f"""
+    SELECT
+        {list_version_sql("approval_routes", "routes_version")},
+        {list_version_sql("users", "users_version")}
+""")
+
+class RouteCatalogCache:
+    """テナントごとの承認ルート一覧（ステップ・承認者名を含む）のプロセス内キャッシュ
+
+    エントリは APPROVAL_ROUTES_VALIDATOR の版数（ルート・ユーザー一覧の版数）と
+    組で持ち、一致しなければ読み直す。版数は書き込みと同じトランザクションで
+    上がるため、他プロセスでの変更もコミットされた時点で検出できる。
+    版数は単調増加なので、遅れて読み終えたリクエストが古い版数で
+    新しいエントリを上書きすることはしない。
+    このプロセスでの作成・更新・削除では明示的に破棄する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, tenant_id, version):
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def store(self, tenant_id, version, rows):
+        catalog = []
+        for row in rows:
+            route = dict(row)
+            route["step_count"] = len(route["steps"])
+            catalog.append(route)
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is None or entry[0] < version:
+                self._entries[tenant_id] = (version, catalog)
+        return catalog
+
+    def invalidate(self, tenant_id):
+        with self._lock:
+            if self._entries.pop(tenant_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tenants": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+route_catalog_cache = RouteCatalogCache()
+
+# 承認ルート一覧をステップ・承認者名まで含めて1クエリで読む
+APPROVAL_ROUTE_CATALOG = queries.register("approval_route_catalog", """
+    SELECT
+        ar.id,
+        ar.name,
+        ar.description,
+        ar.is_active,
+        ar.created_at,
+        ar.updated_at,
+        ar.total_steps,
+        COALESCE(s.steps, '[]'::json) as steps
+    FROM approval_routes ar
+    LEFT JOIN LATERAL (
+        SELECT json_agg(
+            json_build_object(
+                'step_order', ars.step_order,
+                'approver_id', ars.approver_id,
+                'approver_name', u.name,
+                'is_required', ars.is_required
+            )
+            ORDER BY ars.step_order ASC, ars.id ASC
+        ) as steps
+        FROM approval_route_steps ars
+        LEFT JOIN users u ON ars.approver_id = u.id
+        WHERE ars.route_id = ar.id
+    ) s ON TRUE
+    WHERE ar.tenant_id = %s AND ar.deleted_at IS NULL AND ar.is_active = TRUE
+    ORDER BY ar.created_at DESC
+""")
+
+# 承認ルート一覧で返せる項目
+APPROVAL_ROUTE_LIST_FIELDS = (
+    "id", "name", "description", "is_active", "created_at", "updated_at",
+    "total_steps", "step_count", "steps",
+)
+APPROVAL_ROUTE_LIST_DEFAULT_FIELDS = (
+    "id", "name", "description", "is_active", "created_at", "step_count", "steps",
+)
+
 @app.get("/api/approval-routes")
 def get_approval_routes(
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None,
     payload: dict = Depends(verify_token),
     conn = Depends(get_db)
 ):
-    """承認ルート一覧取得（承認者情報含む）"""
+    """承認ルート一覧取得（承認者情報含む）
+
+    Args:
+        fields: 返す項目（カンマ区切り）
+
+    ETag を返す。If-None-Match が一致すれば検証子だけを読んで304を返す。
+    一覧はテナントごとにキャッシュし、版数が変わったときだけ読み直す。
+    """
     print(f"[DEBUG] get_approval_routes called")
 
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
-
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
-
-    # 承認ルート一覧を取得
-    cursor.execute(
-        """
-        SELECT
-            ar.id,
-            ar.name,
-            ar.description,
-            ar.is_active,
-            ar.created_at
-        FROM approval_routes ar
-        WHERE ar.tenant_id = %s AND ar.deleted_at IS NULL AND ar.is_active = TRUE
-        ORDER BY ar.created_at DESC
-        """,
-        (tenant_id,)
-    )
-
-    routes = cursor.fetchall()
+    fields = parse_list_fields(fields, APPROVAL_ROUTE_LIST_FIELDS, APPROVAL_ROUTE_LIST_DEFAULT_FIELDS)
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    queries.execute(cursor, APPROVAL_ROUTES_VALIDATOR, (tenant_id, tenant_id))
+    version = tuple(cursor.fetchone().values())
+    etag = make_etag("approval_routes", tenant_id, fields, *version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    routes = route_catalog_cache.lookup(tenant_id, version)
+    if routes is None:
+        queries.execute(cursor, APPROVAL_ROUTE_CATALOG, (tenant_id,))
+        routes = route_catalog_cache.store(tenant_id, version, cursor.fetchall())
     print(f"[DEBUG] Found {len(routes)} approval routes")
 
-    # 各ルートのステップ情報を取得
-    result = []
-    for route in routes:
-        cursor.execute(
-            """
-            SELECT
-                ars.step_order,
-                ars.approver_id,
-                u.name as approver_name,
-                ars.is_required
-            FROM approval_route_steps ars
-            LEFT JOIN users u ON ars.approver_id = u.id
-            WHERE ars.route_id = %s
-            ORDER BY ars.step_order ASC
-            """,
-            (route["id"],)
-        )
-        steps = cursor.fetchall()
-
-        route_dict = dict(route)
-        route_dict["step_count"] = len(steps)
-        route_dict["steps"] = [dict(step) for step in steps]
-        result.append(route_dict)
-
-    return result
+    return [{name: route[name] for name in fields} for route in routes]
 
 @app.post("/api/approval-routes")
 def create_approval_route(
@@ -534,34 +2654,41 @@ def create_approval_route(
     tenant_id = payload.get("tenant_id")
     user_id = payload.get("user_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    # 承認ルートを作成（ステップ構成も非正規化して保存）
+    try:
+        total_steps, step_layout = build_step_layout(request_body.steps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 承認ルートを作成
     cursor.execute(
-        """
-        INSERT INTO approval_routes (tenant_id, name, description, is_active, created_by, created_at, updated_at)
-        VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
-        RETURNING id
+        f"""
+        WITH route AS (
+            INSERT INTO approval_routes (
+                tenant_id, name, description, is_active, created_by,
+                total_steps, step_layout, created_at, updated_at
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+            RETURNING *
+        ),
+        {ROUTE_VERSION_INSERT_SQL}
+        SELECT id FROM route
         """,
-        (tenant_id, request_body.name, request_body.description, request_body.is_active, user_id)
+        (tenant_id, request_body.name, request_body.description, request_body.is_active, user_id,
+         total_steps, json.dumps(step_layout))
     )
 
     route = cursor.fetchone()
     route_id = route["id"]
 
     # ステップを作成
-    for step in request_body.steps:
-        cursor.execute(
-            """
-            INSERT INTO approval_route_steps (route_id, step_order, approver_id, is_required, is_parallel_group, parallel_requirement, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, NOW(), NOW())
-            """,
-            (route_id, step.step_order, step.approver_id, step.is_required, step.is_parallel_group, step.parallel_requirement)
-        )
+    sync_route_steps(cursor, route_id, step_layout)
 
+    bump_list_version(cursor, tenant_id, "approval_routes")
     conn.commit()
+    route_catalog_cache.invalidate(tenant_id)
 
     print(f"[DEBUG] Created approval route: {route_id}")
 
@@ -584,9 +2711,8 @@ def update_approval_route(
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # ルートの存在確認
     cursor.execute(
@@ -621,20 +2747,35 @@ def update_approval_route(
         query = f"UPDATE approval_routes SET {', '.join(update_fields)} WHERE id = %s"
         cursor.execute(query, params)
 
-    # ステップの更新（既存のステップを削除して再作成）
+    # ステップの更新（既存のステップとの差分だけを反映）
+    step_changes = None
     if request_body.steps is not None:
-        cursor.execute("DELETE FROM approval_route_steps WHERE route_id = %s", (route_id,))
+        try:
+            total_steps, step_layout = build_step_layout(request_body.steps)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        for step in request_body.steps:
-            cursor.execute(
-                """
-                INSERT INTO approval_route_steps (route_id, step_order, approver_id, is_required, is_parallel_group, parallel_requirement, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW(), NOW())
-                """,
-                (route_id, step.step_order, step.approver_id, step.is_required, step.is_parallel_group, step.parallel_requirement)
-            )
+        step_changes = sync_route_steps(cursor, route_id, step_layout)
+
+    # 構成が変わったときだけ新しいバージョンを作る（既存のバージョンは変更しない）
+    if step_changes is not None and any(step_changes.values()):
+        cursor.execute(
+            f"""
+            WITH route AS (
+                UPDATE approval_routes
+                SET total_steps = %s, step_layout = %s, layout_version = layout_version + 1, updated_at = NOW()
+                WHERE id = %s
+                RETURNING *
+            ),
+            {ROUTE_VERSION_INSERT_SQL}
+            SELECT id FROM route
+            """,
+            (total_steps, json.dumps(step_layout), route_id)
+        )
 
+    bump_list_version(cursor, tenant_id, "approval_routes")
     conn.commit()
+    route_catalog_cache.invalidate(tenant_id)
 
     print(f"[DEBUG] Updated approval route: {route_id}")
 
@@ -656,9 +2797,8 @@ def delete_approval_route(
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # ルートの存在確認
     cursor.execute(
@@ -672,11 +2812,13 @@ def delete_approval_route(
 
     # ソフトデリート
     cursor.execute(
-        "UPDATE approval_routes SET deleted_at = NOW() WHERE id = %s",
+        "UPDATE approval_routes SET deleted_at = NOW(), updated_at = NOW() WHERE id = %s",
         (route_id,)
     )
 
+    bump_list_version(cursor, tenant_id, "approval_routes")
     conn.commit()
+    route_catalog_cache.invalidate(tenant_id)
 
     print(f"[DEBUG] Deleted approval route: {route_id}")
 
@@ -686,99 +2828,487 @@ def delete_approval_route(
         "route_id": route_id
     }
 
-@app.get("/api/approvals/{approval_id}")
-def get_approval_by_id(
-    approval_id: int,
-    payload: dict = Depends(verify_token),
-    conn = Depends(get_db)
-):
-    """承認詳細取得"""
-    print(f"[DEBUG] get_approval_by_id called - approval_id: {approval_id}")
-
-    cursor = conn.cursor()
-    tenant_id = payload.get("tenant_id")
+# 承認詳細・承認操作で使うプリペアドステートメント（同期版・非同期版で共通）
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
+APPROVAL_HISTORIES_PAGE_DEFAULT = 100
+APPROVAL_HISTORIES_PAGE_MAX = 500
 
-    # 承認詳細取得（承認履歴も含む）
-    query = """
+# 承認詳細のETagの検証子。申請・申請者・ルートの更新日時と、承認履歴サマリーの
+# 最終履歴ID・ステップごとの最新アクションの承認者の更新日時。承認履歴テーブルは
+# 読まない。詳細SQLにも同じ列を含めるので、通常のGETでも1往復でETagを返せる
+APPROVAL_VALIDATOR_COLUMNS = (
+    "updated_at", "applicant_updated_at", "route_updated_at",
+    "last_history_id", "history_users_updated_at",
+)
+APPROVAL_VALIDATOR_COLUMNS_SQL = """u.updated_at as applicant_updated_at,
+            r.updated_at as route_updated_at,
+            hs.last_history_id,
+            (
+                SELECT MAX(hu.updated_at)
+                FROM jsonb_each(hs.latest_by_step) e
+                INNER JOIN users hu ON hu.id = (e.value->>'user_id')::bigint
+            ) as history_users_updated_at"""
+APPROVAL_VALIDATOR_FROM_SQL = """FROM approvals a
+        INNER JOIN users u ON a.applicant_id = u.id
+        INNER JOIN approval_routes r ON a.route_id = r.id
+        LEFT JOIN approval_history_summaries hs ON hs.approval_id = a.id
+        WHERE a.id = %s AND a.tenant_id = %s"""
+# include=histories のときの追加の検証子。承認履歴の先頭ページには古い履歴の
+# 承認者名も出るため、サマリーの承認者だけでは足りない。テナントのユーザー一覧の
+# 版数を使う（ユーザーの作成・更新・削除のたびに上がる）
+APPROVAL_HISTORIES_VALIDATOR_COLUMN = "users_version"
+APPROVAL_HISTORIES_VALIDATOR_SQL = """COALESCE((
+                SELECT v.version FROM tenant_list_versions v
+                WHERE v.tenant_id = a.tenant_id AND v.list = 'users'
+            ), 0) as users_version"""
+
+def approval_detail_sql(with_histories, with_summary):
+    """承認詳細を申請者・承認履歴・総ステップ数ごと1往復で取得するSQL
+
+    総ステップ数は申請が固定したルートのバージョン（approval_route_versions）から取る。
+    承認履歴は古い順の先頭ページだけを含める（続きは GET /api/approvals/{id}/histories）。
+    history_summary（ステップごとの最新アクション）は承認履歴サマリーの行から作る。
+    """
+    histories_sql = f"""
+            COALESCE((
+                SELECT json_agg(h ORDER BY h.created_at, h.id)
+                FROM (
+                    SELECT
+                        ah.*,
+                        hu.name as approver_name,
+                        json_build_object('name', hu.name) as "user"
+                    FROM approval_histories ah
+                    LEFT JOIN users hu ON ah.user_id = hu.id
+                    WHERE ah.approval_id = a.id
+                    ORDER BY ah.created_at ASC, ah.id ASC
+                    LIMIT {APPROVAL_HISTORIES_PAGE_DEFAULT}
+                ) h
+            ), '[]'::json) as histories,
+            {APPROVAL_HISTORIES_VALIDATOR_SQL},
+    """ if with_histories else ""
+    summary_sql = """
+            (
+                SELECT COALESCE(json_agg(
+                    e.value || jsonb_build_object(
+                        'approver_name', su.name, 'user', jsonb_build_object('name', su.name)
+                    )
+                    ORDER BY e.key::int
+                ), '[]'::json)
+                FROM jsonb_each(hs.latest_by_step) e
+                LEFT JOIN users su ON su.id = (e.value->>'user_id')::bigint
+            ) as history_summary,
+    """ if with_summary else ""
+    return f"""
         SELECT
             a.*,
             u.name as applicant_name,
-            r.name as route_name
-        FROM approvals a
-        INNER JOIN users u ON a.applicant_id = u.id
-        INNER JOIN approval_routes r ON a.route_id = r.id
-        WHERE a.id = %s AND a.tenant_id = %s
+            r.name as route_name,{histories_sql}{summary_sql}
+            (
+                SELECT rv.total_steps FROM approval_route_versions rv
+                WHERE rv.route_id = a.route_id AND rv.version = a.route_version
+            ) as total_steps,
+            COALESCE(hs.history_count, 0) as history_count,
+            {APPROVAL_VALIDATOR_COLUMNS_SQL}
+        {APPROVAL_VALIDATOR_FROM_SQL}
     """
 
-    cursor.execute(query, (approval_id, tenant_id))
-    approval = cursor.fetchone()
+# (承認履歴を含めるか, サマリーを含めるか) -> 文の名前
+APPROVAL_DETAIL_STATEMENTS = {
+    (with_histories, with_summary): queries.register(
+        "approval_detail"
+        + ("_with_histories" if with_histories else "")
+        + ("_with_summary" if with_summary else ""),
+        approval_detail_sql(with_histories, with_summary),
+    )
+    for with_histories in (False, True)
+    for with_summary in (False, True)
+}
+def approval_validator_sql(with_histories):
+    """承認詳細のETagの検証子だけを読むSQL"""
+    histories_sql = f"""
+            {APPROVAL_HISTORIES_VALIDATOR_SQL},""" if with_histories else ""
+    return f"""
+        SELECT
+            a.id,
+            a.updated_at,{histories_sql}
+            {APPROVAL_VALIDATOR_COLUMNS_SQL}
+        {APPROVAL_VALIDATOR_FROM_SQL}
+    """
 
-    if not approval:
-        print(f"[DEBUG] Approval {approval_id} not found for tenant {tenant_id}")
-        raise HTTPException(status_code=404, detail="Approval not found")
+# 承認履歴を含めるか -> 文の名前
+APPROVAL_VALIDATORS = {
+    with_histories: queries.register(
+        "approval_validator" + ("_with_histories" if with_histories else ""),
+        approval_validator_sql(with_histories),
+    )
+    for with_histories in (False, True)
+}
+
+def approval_etag(row, variant):
+    columns = APPROVAL_VALIDATOR_COLUMNS
+    if variant[0]:
+        columns += (APPROVAL_HISTORIES_VALIDATOR_COLUMN,)
+    return make_etag(row["id"], variant, *(row[column] for column in columns))
+
+def approval_histories_sql(after):
+    """承認履歴を (created_at, id) の昇順でページングするSQL"""
+    query = """
+        SELECT
+            ah.*,
+            hu.name as approver_name,
+            json_build_object('name', hu.name) as "user"
+        FROM approval_histories ah
+        INNER JOIN approvals a ON ah.approval_id = a.id
+        LEFT JOIN users hu ON ah.user_id = hu.id
+        WHERE ah.approval_id = %s AND a.tenant_id = %s
+    """
+    if after:
+        query += " AND (ah.created_at, ah.id) > (%s, %s)"
+    return query + " ORDER BY ah.created_at, ah.id LIMIT %s"
+
+APPROVAL_HISTORIES = queries.register("approval_histories", approval_histories_sql(False))
+APPROVAL_HISTORIES_AFTER = queries.register("approval_histories_after", approval_histories_sql(True))
+
+def encode_history_cursor(history):
+    """承認履歴の最終行から次ページのカーソルを作る（形式は承認一覧と同じ）
+
+    詳細に埋め込んだ承認履歴は JSON なので created_at が文字列のこともある。
+    """
+    created_at = history["created_at"]
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, history["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def build_approval_histories_query(approval_id, tenant_id, cursor, limit):
+    params = [approval_id, tenant_id]
+    statement = APPROVAL_HISTORIES
+    if cursor:
+        statement = APPROVAL_HISTORIES_AFTER
+        params.extend(decode_approvals_cursor(cursor))
+    params.append(limit + 1)
+    return statement, params
+
+def history_summary_upsert_sql(source):
+    """追加した承認履歴（CTE source）を承認履歴サマリーに反映する文
+
+    承認履歴の INSERT ... RETURNING * を CTE にし、同じ文の中で実行する。
+    ステップごとの最新は (created_at, id) で比べるので、古い履歴を後から
+    取り込んでも最新のアクションは置き換わらない。
+    """
+    return f"""
+        INSERT INTO approval_history_summaries AS s
+            (approval_id, history_count, last_history_id, latest_by_step, updated_at)
+        SELECT n.approval_id, n.history_count, n.last_history_id, l.latest_by_step, NOW()
+        FROM (
+            SELECT approval_id, COUNT(*) as history_count, MAX(id) as last_history_id
+            FROM {source}
+            GROUP BY approval_id
+        ) n
+        INNER JOIN (
+            SELECT approval_id, jsonb_object_agg(step_key, entry) as latest_by_step
+            FROM (
+                SELECT DISTINCT ON (approval_id, COALESCE(step_order, 0))
+                    approval_id,
+                    COALESCE(step_order, 0)::text as step_key,
+                    jsonb_build_object(
+                        'id', id, 'step_order', step_order, 'user_id', user_id,
+                        'action', action, 'comment', comment, 'created_at', created_at
+                    ) as entry
+                FROM {source}
+                ORDER BY approval_id, COALESCE(step_order, 0), created_at DESC, id DESC
+            ) latest
+            GROUP BY approval_id
+        ) l ON l.approval_id = n.approval_id
+        ON CONFLICT (approval_id) DO UPDATE SET
+            history_count = s.history_count + EXCLUDED.history_count,
+            last_history_id = GREATEST(s.last_history_id, EXCLUDED.last_history_id),
+            latest_by_step = s.latest_by_step || COALESCE((
+                SELECT jsonb_object_agg(e.key, e.value)
+                FROM jsonb_each(EXCLUDED.latest_by_step) e
+                WHERE NOT s.latest_by_step ? e.key
+                   OR ((e.value->>'created_at')::timestamp, (e.value->>'id')::bigint)
+                      >= ((s.latest_by_step->e.key->>'created_at')::timestamp,
+                          (s.latest_by_step->e.key->>'id')::bigint)
+            ), '{{}}'::jsonb),
+            updated_at = NOW()
+    """
+
+# ルートは申請が固定した route_version で引く（キャッシュにあれば問い合わせない）
+APPROVAL_FOR_ACTION = queries.register("approval_for_action", """
+    SELECT * FROM approvals WHERE id = %s AND tenant_id = %s
+""")
+
+# 状態遷移は「条件付きUPDATE + 履歴INSERT + 履歴サマリー更新」を1文で行う。
+# 対象行は FOR UPDATE SKIP LOCKED で取るため、同時に遷移させようとした側は
+# ロック待ちせず0行で返る（ハンドラは409にする）。
+
+# 承認: 読み取った時点の (current_step, stage_approved_mask) のままである場合だけ、
+# ルートエンジンが決めた遷移（Transition）を書き込む
+TRANSITION_APPROVE = queries.register("transition_approve", f"""
+    WITH moved AS (
+        UPDATE approvals
+        SET status = %s, current_step = %s, stage_approved_mask = %s, current_approver_id = %s,
+            updated_at = NOW()
+        WHERE id = (
+            SELECT id FROM approvals
+            WHERE id = %s AND status = 'pending' AND current_step = %s AND stage_approved_mask = %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id
+    ),
+    logged AS (
+        INSERT INTO approval_histories (approval_id, step_order, user_id, action, comment, created_at)
+        SELECT id, %s::int, %s::bigint, 'approved', %s::text, NOW() FROM moved
+        RETURNING *
+    ),
+    summarized AS ({history_summary_upsert_sql("logged")})
+    SELECT approval_id FROM logged
+""")
+
+def terminal_transition_sql(status, applicant_condition):
+    """差し戻し・取り下げ（pending から終了状態へ）の1文"""
+    return f"""
+        WITH moved AS (
+            UPDATE approvals
+            SET status = '{status}', current_approver_id = NULL, updated_at = NOW()
+            WHERE id = (
+                SELECT id FROM approvals
+                WHERE id = %s AND tenant_id = %s AND status = 'pending' AND {applicant_condition}
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, current_step
+        ),
+        logged AS (
+            INSERT INTO approval_histories (approval_id, step_order, user_id, action, comment, created_at)
+            SELECT id, current_step, %s::bigint, '{status}', %s::text, NOW() FROM moved
+            RETURNING *
+        ),
+        summarized AS ({history_summary_upsert_sql("logged")})
+        SELECT approval_id, step_order FROM logged
+    """
+
+# 申請者以外のみ差し戻し可能 / 申請者本人のみ取り下げ可能
+TRANSITION_REJECT = queries.register(
+    "transition_reject", terminal_transition_sql("rejected", "applicant_id <> %s::bigint")
+)
+TRANSITION_WITHDRAW = queries.register(
+    "transition_withdraw", terminal_transition_sql("withdrawn", "applicant_id = %s::bigint")
+)
 
-    print(f"[DEBUG] Found approval: {approval_id}, fetching histories...")
+TRANSITION_CONFLICT = "This approval was updated by another request. Please reload and try again."
 
-    # 承認履歴を取得
+def evaluate_approve(route, approval, user_id):
+    """承認後の遷移を求める（同じステップで承認済みなら400）"""
     try:
-        cursor.execute(
-            """
-            SELECT
-                ah.*,
-                u.name as approver_name
-            FROM approval_histories ah
-            LEFT JOIN users u ON ah.user_id = u.id
-            WHERE ah.approval_id = %s
-            ORDER BY ah.created_at ASC
-            LIMIT 100
-            """,
-            (approval_id,)
+        return route.approve(
+            approval["current_step"], approval["stage_approved_mask"], user_id,
+            on_behalf_of=approval["current_approver_id"],
         )
-        histories = cursor.fetchall()
-        print(f"[DEBUG] Found {len(histories)} histories")
-    except Exception as e:
-        print(f"[DEBUG] Error fetching histories: {e}")
-        histories = []
+    except AlreadyApproved:
+        raise HTTPException(status_code=400, detail="You have already approved this step")
+
+def approve_transition_params(approval, transition, user_id, comment):
+    return (
+        *transition,
+        approval["id"], approval["current_step"], approval["stage_approved_mask"],
+        approval["current_step"], user_id, comment or "承認しました",
+    )
+
+def parse_detail_include(include):
+    """include パラメータ（カンマ区切り）を集合に変換"""
+    return {part.strip() for part in (include or "").split(",") if part.strip()}
 
-    # フロントエンドが期待する形式に変換
+def format_approval_detail(approval):
+    """承認詳細をフロントエンドが期待する形式に変換"""
     result = dict(approval)
+    for column in APPROVAL_VALIDATOR_COLUMNS[1:] + (APPROVAL_HISTORIES_VALIDATOR_COLUMN,):
+        result.pop(column, None)
+
+    # 承認履歴が先頭ページに収まらない場合、続きを取得するためのカーソル
+    histories = result.get("histories")
+    if histories is not None:
+        result["histories_next_cursor"] = (
+            encode_history_cursor(histories[-1]) if len(histories) < result["history_count"] else None
+        )
 
     # applicant オブジェクトを作成
     result['applicant'] = {
         'id': result.get('applicant_id'),
         'name': result.get('applicant_name')
     }
+    return result
 
-    # historiesを変換（user オブジェクトを含む形式に）
-    formatted_histories = []
-    for h in histories:
-        history_dict = dict(h)
-        history_dict['user'] = {
-            'name': history_dict.get('approver_name', 'システム')
-        }
-        formatted_histories.append(history_dict)
+def check_approver_action(approval, user_id, action):
+    """承認・差し戻し前のチェック（ステータス・自己承認）"""
+    if not approval:
+        raise HTTPException(status_code=404, detail="Approval not found")
 
-    result['histories'] = formatted_histories
+    if approval["status"] != "pending":
+        raise HTTPException(status_code=400, detail="This approval is not pending")
 
-    # total_steps を動的に取得（approval_route_stepsから）
-    cursor.execute(
-        "SELECT COUNT(DISTINCT step_order) as total_steps FROM approval_route_steps WHERE route_id = %s",
-        (approval["route_id"],)
-    )
-    step_count = cursor.fetchone()
-    result['total_steps'] = step_count["total_steps"] if step_count else 1
+    # 自己承認チェック
+    if approval["applicant_id"] == user_id:
+        raise HTTPException(status_code=403, detail=f"Cannot {action} your own request")
+
+@db_route("get", "/api/approvals/{approval_id}", async_impl=False)
+def get_approval_by_id(
+    approval_id: int,
+    request: Request,
+    response: Response,
+    include: Optional[str] = "histories",
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_db)
+):
+    """承認詳細取得
+
+    Args:
+        include: 含める関連データ（カンマ区切り）
+            histories: 承認履歴（古い順に先頭100件。続きは histories_next_cursor で
+                       GET /api/approvals/{id}/histories から取得）
+            history_summary: ステップごとの最新アクション（承認履歴サマリーから）
+
+    history_count（承認履歴の件数）は常に返す。
+    ETag を返す。If-None-Match が一致すれば検証子だけを読んで304を返す。
+    """
+    print(f"[DEBUG] get_approval_by_id called - approval_id: {approval_id}")
+
+    cursor = conn.cursor()
+    tenant_id = payload.get("tenant_id")
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    includes = parse_detail_include(include)
+    variant = ("histories" in includes, "history_summary" in includes)
+    if request.headers.get("if-none-match"):
+        queries.execute(cursor, APPROVAL_VALIDATORS[variant[0]], (approval_id, tenant_id))
+        validator = cursor.fetchone()
+        if validator:
+            etag = approval_etag(validator, variant)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+    # 承認詳細取得（申請者・承認履歴・総ステップ数を1クエリで）
+    queries.execute(cursor, APPROVAL_DETAIL_STATEMENTS[variant], (approval_id, tenant_id))
+    approval = cursor.fetchone()
 
+    if not approval:
+        print(f"[DEBUG] Approval {approval_id} not found for tenant {tenant_id}")
+        raise HTTPException(status_code=404, detail="Approval not found")
+
+    set_etag(response, approval_etag(approval, variant))
     print(f"[DEBUG] Returning approval data for: {approval_id}")
-    return result
+    return format_approval_detail(approval)
+
+@db_route("get", "/api/approvals/{approval_id}", async_impl=True)
+async def get_approval_by_id_async(
+    approval_id: int,
+    request: Request,
+    response: Response,
+    include: Optional[str] = "histories",
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_async_db)
+):
+    """承認詳細取得（非同期版）"""
+    tenant_id = payload.get("tenant_id")
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    includes = parse_detail_include(include)
+    variant = ("histories" in includes, "history_summary" in includes)
+    if request.headers.get("if-none-match"):
+        cursor = await queries.execute_async(
+            conn.cursor(), APPROVAL_VALIDATORS[variant[0]], (approval_id, tenant_id)
+        )
+        validator = await cursor.fetchone()
+        if validator:
+            etag = approval_etag(validator, variant)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+    cursor = await queries.execute_async(
+        conn.cursor(), APPROVAL_DETAIL_STATEMENTS[variant], (approval_id, tenant_id)
+    )
+    approval = await cursor.fetchone()
+
+    if not approval:
+        raise HTTPException(status_code=404, detail="Approval not found")
+
+    set_etag(response, approval_etag(approval, variant))
+    return format_approval_detail(approval)
+
+APPROVAL_EXISTS = queries.register(
+    "approval_exists", "SELECT 1 FROM approvals WHERE id = %s AND tenant_id = %s"
+)
+
+@db_route("get", "/api/approvals/{approval_id}/histories", async_impl=False, response_model=List[dict])
+def get_approval_histories(
+    approval_id: int,
+    response: Response,
+    limit: Optional[int] = APPROVAL_HISTORIES_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_db)
+):
+    """承認履歴取得（古い順）
+
+    Args:
+        limit: 1ページの件数（最大500）
+        cursor: 前ページのX-Next-Cursorヘッダ、または承認詳細の histories_next_cursor の値
+
+    続きがある場合のみ X-Next-Cursor ヘッダに次ページのカーソルを返す。
+    """
+    db_cursor = conn.cursor()
+    tenant_id = payload.get("tenant_id")
+    limit = clamp_page_limit(limit, APPROVAL_HISTORIES_PAGE_DEFAULT, APPROVAL_HISTORIES_PAGE_MAX)
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    statement, params = build_approval_histories_query(approval_id, tenant_id, cursor, limit)
+    queries.execute(db_cursor, statement, params)
+    histories = db_cursor.fetchall()
+
+    if not histories and not cursor:
+        queries.execute(db_cursor, APPROVAL_EXISTS, (approval_id, tenant_id))
+        if not db_cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Approval not found")
+
+    return paginate_rows(histories, limit, response, encode_history_cursor)
+
+@db_route("get", "/api/approvals/{approval_id}/histories", async_impl=True, response_model=List[dict])
+async def get_approval_histories_async(
+    approval_id: int,
+    response: Response,
+    limit: Optional[int] = APPROVAL_HISTORIES_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_async_db)
+):
+    """承認履歴取得（非同期版）"""
+    tenant_id = payload.get("tenant_id")
+    limit = clamp_page_limit(limit, APPROVAL_HISTORIES_PAGE_DEFAULT, APPROVAL_HISTORIES_PAGE_MAX)
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    statement, params = build_approval_histories_query(approval_id, tenant_id, cursor, limit)
+    db_cursor = await queries.execute_async(conn.cursor(), statement, params)
+    histories = await db_cursor.fetchall()
+
+    if not histories and not cursor:
+        db_cursor = await queries.execute_async(conn.cursor(), APPROVAL_EXISTS, (approval_id, tenant_id))
+        if not await db_cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Approval not found")
+
+    return paginate_rows(histories, limit, response, encode_history_cursor)
 
 class ApprovalActionRequest(BaseModel):
     comment: Optional[str] = None
 
-@app.post("/api/approvals/{approval_id}/approve")
+@db_route("post", "/api/approvals/{approval_id}/approve", async_impl=False)
 def approve_approval(
     approval_id: int,
     request_body: ApprovalActionRequest,
@@ -792,68 +3322,26 @@ def approve_approval(
     tenant_id = payload.get("tenant_id")
     user_id = payload.get("user_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # 承認情報を取得
-    cursor.execute(
-        "SELECT * FROM approvals WHERE id = %s AND tenant_id = %s",
-        (approval_id, tenant_id)
-    )
+    queries.execute(cursor, APPROVAL_FOR_ACTION, (approval_id, tenant_id))
     approval = cursor.fetchone()
 
-    if not approval:
-        raise HTTPException(status_code=404, detail="Approval not found")
+    check_approver_action(approval, user_id, "approve")
 
-    if approval["status"] != "pending":
-        raise HTTPException(status_code=400, detail="This approval is not pending")
+    # コンパイル済みルートで遷移を評価（並列グループ・任意ステップを考慮）
+    route = get_route_layout(cursor, approval["route_id"], approval["route_version"])
+    transition = evaluate_approve(route, approval, user_id)
 
-    # 自己承認チェック
-    if approval["applicant_id"] == user_id:
-        raise HTTPException(status_code=403, detail="Cannot approve your own request")
-
-    # 承認履歴を追加
-    cursor.execute(
-        """
-        INSERT INTO approval_histories (approval_id, step_order, user_id, action, comment, created_at)
-        VALUES (%s, %s, %s, %s, %s, NOW())
-        """,
-        (approval_id, approval["current_step"], user_id, "approved", request_body.comment or "承認しました")
+    # 読み取り時点から変わっていなければ遷移させ、承認履歴を追加（1文）
+    queries.execute(
+        cursor, TRANSITION_APPROVE,
+        approve_transition_params(approval, transition, user_id, request_body.comment)
     )
-
-    # total_stepsを動的に取得
-    cursor.execute(
-        "SELECT COUNT(DISTINCT step_order) as total_steps FROM approval_route_steps WHERE route_id = %s",
-        (approval["route_id"],)
-    )
-    step_count_result = cursor.fetchone()
-    total_steps = step_count_result["total_steps"] if step_count_result else 1
-
-    # current_stepを更新
-    new_step = approval["current_step"] + 1
-
-    # 最終ステップの場合はstatusをapprovedに
-    if new_step > total_steps:
-        cursor.execute(
-            """
-            UPDATE approvals
-            SET status = 'approved', current_step = %s, updated_at = NOW()
-            WHERE id = %s
-            """,
-            (new_step, approval_id)
-        )
-        final_status = "approved"
-    else:
-        cursor.execute(
-            """
-            UPDATE approvals
-            SET current_step = %s, updated_at = NOW()
-            WHERE id = %s
-            """,
-            (new_step, approval_id)
-        )
-        final_status = "pending"
+    if cursor.fetchone() is None:
+        raise HTTPException(status_code=409, detail=TRANSITION_CONFLICT)
 
     conn.commit()
 
@@ -863,63 +3351,76 @@ def approve_approval(
         "success": True,
         "message": "承認しました",
         "approval_id": approval_id,
-        "new_status": final_status,
-        "current_step": new_step
+        "new_status": transition.status,
+        "current_step": transition.current_step
     }
 
-@app.post("/api/approvals/{approval_id}/reject")
-def reject_approval(
+@db_route("post", "/api/approvals/{approval_id}/approve", async_impl=True)
+async def approve_approval_async(
     approval_id: int,
     request_body: ApprovalActionRequest,
     payload: dict = Depends(verify_token),
-    conn = Depends(get_db)
+    conn = Depends(get_async_db)
 ):
-    """承認を差し戻し"""
-    print(f"[DEBUG] reject_approval called - approval_id: {approval_id}")
-
-    cursor = conn.cursor()
+    """承認を実行（非同期版）"""
     tenant_id = payload.get("tenant_id")
     user_id = payload.get("user_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
-    # 承認情報を取得
-    cursor.execute(
-        "SELECT * FROM approvals WHERE id = %s AND tenant_id = %s",
-        (approval_id, tenant_id)
+    cursor = await queries.execute_async(conn.cursor(), APPROVAL_FOR_ACTION, (approval_id, tenant_id))
+    approval = await cursor.fetchone()
+
+    check_approver_action(approval, user_id, "approve")
+
+    route = await get_route_layout_async(conn, approval["route_id"], approval["route_version"])
+    transition = evaluate_approve(route, approval, user_id)
+
+    cursor = await queries.execute_async(
+        conn.cursor(), TRANSITION_APPROVE,
+        approve_transition_params(approval, transition, user_id, request_body.comment)
     )
-    approval = cursor.fetchone()
+    if await cursor.fetchone() is None:
+        raise HTTPException(status_code=409, detail=TRANSITION_CONFLICT)
 
-    if not approval:
-        raise HTTPException(status_code=404, detail="Approval not found")
+    await conn.commit()
 
-    if approval["status"] != "pending":
-        raise HTTPException(status_code=400, detail="This approval is not pending")
+    return {
+        "success": True,
+        "message": "承認しました",
+        "approval_id": approval_id,
+        "new_status": transition.status,
+        "current_step": transition.current_step
+    }
+
+@app.post("/api/approvals/{approval_id}/reject")
+def reject_approval(
+    approval_id: int,
+    request_body: ApprovalActionRequest,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_db)
+):
+    """承認を差し戻し"""
+    print(f"[DEBUG] reject_approval called - approval_id: {approval_id}")
 
-    # 自己差し戻しチェック
-    if approval["applicant_id"] == user_id:
-        raise HTTPException(status_code=403, detail="Cannot reject your own request")
+    cursor = conn.cursor()
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
 
-    # 承認履歴を追加
-    cursor.execute(
-        """
-        INSERT INTO approval_histories (approval_id, step_order, user_id, action, comment, created_at)
-        VALUES (%s, %s, %s, %s, %s, NOW())
-        """,
-        (approval_id, approval["current_step"], user_id, "rejected", request_body.comment or "差し戻しました")
-    )
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
-    # ステータスをrejectedに更新
-    cursor.execute(
-        """
-        UPDATE approvals
-        SET status = 'rejected', updated_at = NOW()
-        WHERE id = %s
-        """,
-        (approval_id,)
+    # pending なら rejected に更新して承認履歴を追加（1文）
+    queries.execute(
+        cursor, TRANSITION_REJECT,
+        (approval_id, tenant_id, user_id, user_id, request_body.comment or "差し戻しました")
     )
+    if cursor.fetchone() is None:
+        # 更新できなかった理由を調べる。チェックを通る場合は同時更新に負けている
+        queries.execute(cursor, APPROVAL_FOR_ACTION, (approval_id, tenant_id))
+        check_approver_action(cursor.fetchone(), user_id, "reject")
+        raise HTTPException(status_code=409, detail=TRANSITION_CONFLICT)
 
     conn.commit()
 
@@ -946,69 +3447,228 @@ def withdraw_approval(
     tenant_id = payload.get("tenant_id")
     user_id = payload.get("user_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
-    conn.commit()
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
-    # 承認情報を取得
-    cursor.execute(
-        "SELECT * FROM approvals WHERE id = %s AND tenant_id = %s",
-        (approval_id, tenant_id)
+    # pending なら withdrawn に更新して承認履歴を追加（1文）
+    queries.execute(
+        cursor, TRANSITION_WITHDRAW,
+        (approval_id, tenant_id, user_id, user_id, request_body.comment or "申請を取り下げました")
     )
-    approval = cursor.fetchone()
+    if cursor.fetchone() is None:
+        # 更新できなかった理由を調べる。チェックを通る場合は同時更新に負けている
+        queries.execute(cursor, APPROVAL_FOR_ACTION, (approval_id, tenant_id))
+        approval = cursor.fetchone()
 
-    if not approval:
-        raise HTTPException(status_code=404, detail="Approval not found")
+        if not approval:
+            raise HTTPException(status_code=404, detail="Approval not found")
 
-    # 申請者本人チェック
-    if approval["applicant_id"] != user_id:
-        raise HTTPException(status_code=403, detail="Only the applicant can withdraw this request")
+        # 申請者本人チェック
+        if approval["applicant_id"] != user_id:
+            raise HTTPException(status_code=403, detail="Only the applicant can withdraw this request")
 
-    if approval["status"] != "pending":
-        raise HTTPException(status_code=400, detail="Only pending approvals can be withdrawn")
+        if approval["status"] != "pending":
+            raise HTTPException(status_code=400, detail="Only pending approvals can be withdrawn")
 
-    # 承認履歴を追加
-    cursor.execute(
-        """
-        INSERT INTO approval_histories (approval_id, step_order, user_id, action, comment, created_at)
-        VALUES (%s, %s, %s, %s, %s, NOW())
-        """,
-        (approval_id, approval["current_step"], user_id, "withdrawn", request_body.comment or "申請を取り下げました")
-    )
+        raise HTTPException(status_code=409, detail=TRANSITION_CONFLICT)
 
-    # ステータスをwithdrawに更新
+    conn.commit()
+
+    print(f"[DEBUG] Approval {approval_id} withdrawn by user {user_id}")
+
+    return {
+        "success": True,
+        "message": "申請を取り下げました",
+        "approval_id": approval_id,
+        "new_status": "withdrawn"
+    }
+
+BULK_ACTION_MAX = 200
+
+BULK_ACTION_MESSAGES = {
+    "approve": ("approved", "承認しました"),
+    "reject": ("rejected", "差し戻しました"),
+}
+
+class BulkApprovalActionRequest(BaseModel):
+    approval_ids: List[int]
+    action: str  # approve / reject
+    comment: Optional[str] = None
+
+@app.post("/api/approvals/bulk")
+def bulk_approval_action(
+    request_body: BulkApprovalActionRequest,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_db)
+):
+    """複数の申請をまとめて承認・差し戻し
+
+    approve_approval / reject_approval と同じチェック（ステータス・自己承認）を
+    申請ごとに行い、通過したものだけを1トランザクション内でまとめて更新する。
+    結果は申請ごとに results に返す（チェックで弾かれた申請はエラー内容付き。
+    他のリクエストが同時に遷移させている申請は409）。
+    """
+    if request_body.action not in BULK_ACTION_MESSAGES:
+        raise HTTPException(status_code=400, detail="action must be 'approve' or 'reject'")
+
+    approval_ids = list(dict.fromkeys(request_body.approval_ids))
+    if not approval_ids:
+        raise HTTPException(status_code=400, detail="approval_ids is empty")
+    if len(approval_ids) > BULK_ACTION_MAX:
+        raise HTTPException(status_code=400, detail=f"Too many approvals (max {BULK_ACTION_MAX})")
+
+    cursor = conn.cursor()
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+    history_action, default_comment = BULK_ACTION_MESSAGES[request_body.action]
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    # 対象をまとめてロック。単体の承認・差し戻しと同じく SKIP LOCKED で、
+    # 他のリクエストが遷移させている申請はロック待ちせず409にする
     cursor.execute(
         """
-        UPDATE approvals
-        SET status = 'withdrawn', updated_at = NOW()
-        WHERE id = %s
+        SELECT *
+        FROM approvals
+        WHERE id = ANY(%s) AND tenant_id = %s
+        ORDER BY id
+        FOR UPDATE SKIP LOCKED
         """,
-        (approval_id,)
+        (approval_ids, tenant_id)
     )
+    approvals = {row["id"]: row for row in cursor.fetchall()}
+
+    # 取れなかった申請が存在するか（存在すればロック中）
+    locked_ids = set()
+    missing_ids = [approval_id for approval_id in approval_ids if approval_id not in approvals]
+    if missing_ids:
+        cursor.execute(
+            "SELECT id FROM approvals WHERE id = ANY(%s) AND tenant_id = %s",
+            (missing_ids, tenant_id)
+        )
+        locked_ids = {row["id"] for row in cursor.fetchall()}
+
+    results = {}
+    target_ids = []
+    transitions = []
+    for approval_id in approval_ids:
+        try:
+            if approval_id in locked_ids:
+                raise HTTPException(status_code=409, detail=TRANSITION_CONFLICT)
+            approval = approvals.get(approval_id)
+            check_approver_action(approval, user_id, request_body.action)
+            if request_body.action == "approve":
+                route = get_route_layout(cursor, approval["route_id"], approval["route_version"])
+                transitions.append(evaluate_approve(route, approval, user_id))
+        except HTTPException as e:
+            results[approval_id] = {
+                "approval_id": approval_id,
+                "success": False,
+                "status_code": e.status_code,
+                "error": e.detail,
+            }
+        else:
+            target_ids.append(approval_id)
+
+    if target_ids:
+        # 承認履歴をまとめて追加（更新前の current_step を記録する）
+        cursor.execute(
+            f"""
+            WITH logged AS (
+                INSERT INTO approval_histories (approval_id, step_order, user_id, action, comment, created_at)
+                SELECT a.id, a.current_step, %s, %s, %s, NOW()
+                FROM approvals a
+                WHERE a.id = ANY(%s)
+                RETURNING *
+            )
+            {history_summary_upsert_sql("logged")}
+            """,
+            (user_id, history_action, request_body.comment or default_comment, target_ids)
+        )
+
+        if request_body.action == "approve":
+            # ルートエンジンで求めた遷移を列ごとの配列にしてまとめて書き込む
+            statuses, steps, masks, approvers = (list(column) for column in zip(*transitions))
+            cursor.execute(
+                """
+                UPDATE approvals a
+                SET status = t.status,
+                    current_step = t.current_step,
+                    stage_approved_mask = t.approved_mask,
+                    current_approver_id = t.current_approver_id,
+                    updated_at = NOW()
+                FROM unnest(%s::bigint[], %s::varchar[], %s::int[], %s::bigint[], %s::bigint[])
+                    AS t(id, status, current_step, approved_mask, current_approver_id)
+                WHERE a.id = t.id
+                RETURNING a.id, a.status, a.current_step
+                """,
+                (target_ids, statuses, steps, masks, approvers)
+            )
+        else:
+            cursor.execute(
+                """
+                UPDATE approvals
+                SET status = 'rejected', current_approver_id = NULL, updated_at = NOW()
+                WHERE id = ANY(%s)
+                RETURNING id, status, current_step
+                """,
+                (target_ids,)
+            )
+
+        for row in cursor.fetchall():
+            results[row["id"]] = {
+                "approval_id": row["id"],
+                "success": True,
+                "new_status": row["status"],
+                "current_step": row["current_step"],
+            }
 
     conn.commit()
 
-    print(f"[DEBUG] Approval {approval_id} withdrawn by user {user_id}")
+    print(f"[DEBUG] Bulk {request_body.action} by user {user_id}: {len(target_ids)}/{len(approval_ids)} applied")
 
     return {
         "success": True,
-        "message": "申請を取り下げました",
-        "approval_id": approval_id,
-        "new_status": "withdrawn"
+        "message": default_comment,
+        "succeeded": len(target_ids),
+        "failed": len(approval_ids) - len(target_ids),
+        "results": [results[approval_id] for approval_id in approval_ids],
     }
 
-@app.get("/api/users", response_model=List[User])
+# ユーザー一覧で返せる項目とそのSQL式
+USER_LIST_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "email": "email",
+    "role": "role",
+    "avatar_url": "avatar_url",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+USER_LIST_DEFAULT_FIELDS = ("id", "name", "email", "role")
+
+@app.get("/api/users", response_model=List[dict])
 def get_users(
+    fields: Optional[str] = None,
     payload: dict = Depends(verify_token),
     conn = Depends(get_db)
 ):
-    """ユーザー一覧取得"""
+    """ユーザー一覧取得
+
+    Args:
+        fields: 返す項目（カンマ区切り）。省略時は id, name, email, role
+    """
     cursor = conn.cursor()
 
     tenant_id = payload.get("tenant_id")
+    fields = parse_list_fields(fields, USER_LIST_FIELDS, USER_LIST_DEFAULT_FIELDS)
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     cursor.execute(
-        "SELECT id, name, email, role FROM users WHERE tenant_id = %s AND deleted_at IS NULL",
+        f"SELECT {select_list_sql(fields, USER_LIST_FIELDS)} FROM users WHERE tenant_id = %s AND deleted_at IS NULL",
         (tenant_id,)
     )
     users = cursor.fetchall()
@@ -1027,6 +3687,9 @@ def create_user(
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
 
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
     # メールアドレスの重複チェック
     cursor.execute(
         "SELECT * FROM users WHERE email = %s AND tenant_id = %s AND deleted_at IS NULL",
@@ -1040,8 +3703,11 @@ def create_user(
             detail="このメールアドレスは既に登録されています"
         )
 
+    # bcrypt の処理中は読み取りのトランザクションを開いたままにしない
+    conn.rollback()
+
     # パスワードハッシュ化
-    hashed_password = pwd_context.hash(request_body.password)
+    hashed_password = hash_password(request_body.password)
 
     # 新規ユーザー作成
     cursor.execute(
@@ -1056,6 +3722,7 @@ def create_user(
     result = cursor.fetchone()
     user_id = result["id"]
 
+    bump_list_version(cursor, tenant_id, "users")
     conn.commit()
 
     print(f"[DEBUG] Created user: {user_id}")
@@ -1066,6 +3733,183 @@ def create_user(
         "user_id": user_id
     }
 
+# ========================================
+# ユーザー一括登録
+# ========================================
+BULK_USERS_MAX = int(os.getenv("BULK_USERS_MAX", "10000"))  # 1リクエストの最大行数
+BULK_USERS_INSERT_BATCH = 1000  # 1文でINSERTする行数
+BULK_USERS_FORMATS = ("csv", "json", "ndjson")
+
+def iter_bulk_user_rows(file, fmt):
+    """(行番号, dict) のリストにする。JSONは配列（または {"users": [...]}）で、行番号は要素の番号"""
+    if fmt != "json":
+        return list(iter_import_rows(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""), fmt))
+    try:
+        data = json.load(io.TextIOWrapper(file, encoding="utf-8-sig"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if isinstance(data, dict):
+        data = data.get("users")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail='JSON must be an array of users or {"users": [...]}')
+    return [(line_no, row if isinstance(row, dict) else None) for line_no, row in enumerate(data, 1)]
+
+def parse_bulk_user(row):
+    """1行を検証して BulkUserRow にする（不正な行は ImportRowError）
+
+    一括登録（POST /api/users/bulk）とインポート（POST /api/import/users）で共通。
+    """
+    if row is None:
+        raise ImportRowError("invalid JSON object")
+    values = {
+        key.strip(): value.strip() if isinstance(value, str) else value
+        for key, value in row.items()
+        if isinstance(key, str) and value not in (None, "")
+    }
+    try:
+        user = BulkUserRow(**values)
+    except ValidationError as e:
+        error = e.errors()[0]
+        raise ImportRowError(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}")
+    if user.role not in IMPORT_USER_ROLES:
+        raise ImportRowError(f"role must be one of {', '.join(IMPORT_USER_ROLES)}")
+    if user.password_hash is None:
+        if not user.password:
+            raise ImportRowError("password or password_hash is required")
+    elif not user.password_hash.startswith(("$2a$", "$2b$", "$2y$")):
+        raise ImportRowError("password_hash must be a bcrypt hash")
+    return user
+
+def hash_bulk_user_passwords(users):
+    """password_hash の無い BulkUserRow の平文のパスワードをまとめてハッシュ化する（全ワーカーに分散）"""
+    plain = [user for user in users if user.password_hash is None]
+    for user, hashed in zip(plain, password_hasher.hash_many([user.password for user in plain])):
+        user.password_hash = hashed
+
+@app.post("/api/users/bulk")
+def bulk_create_users(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    dry_run: bool = False,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_db)
+):
+    """ユーザーを一括登録（管理者のみ）
+
+    Args:
+        file: CSV（1行目がヘッダ: name,email,role,password）・JSON配列・NDJSON。
+              password の代わりに移行元の bcrypt ハッシュを password_hash で渡せる
+        format: csv / json / ndjson（省略時はファイル名の拡張子で判定）
+        dry_run: Trueの場合、検証だけ行い登録しない（ハッシュ化もしない）
+
+    不正な行・登録済みのメールアドレスの行はエラーとして報告し、他の行は登録する。
+    results は入力順の行ごとの結果（created / valid / error）。
+    """
+    fmt = format
+    if fmt is None:
+        filename = (file.filename or "").lower()
+        if filename.endswith(".json"):
+            fmt = "json"
+        elif filename.endswith((".ndjson", ".jsonl")):
+            fmt = "ndjson"
+        else:
+            fmt = "csv"
+    if fmt not in BULK_USERS_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv, json or ndjson")
+
+    cursor = conn.cursor()
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    if not user or user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    rows = iter_bulk_user_rows(file.file, fmt)
+    if len(rows) > BULK_USERS_MAX:
+        raise HTTPException(status_code=400, detail=f"Too many users (max {BULK_USERS_MAX})")
+
+    # 行ごとの検証とファイル内の重複チェック
+    results = []
+    candidates = []  # (結果, BulkUserRow)
+    seen_emails = set()
+    for line_no, row in rows:
+        result = {"line": line_no, "email": row.get("email") if row else None}
+        results.append(result)
+        try:
+            new_user = parse_bulk_user(row)
+            if new_user.email in seen_emails:
+                raise ImportRowError("duplicate email in file")
+            seen_emails.add(new_user.email)
+        except ImportRowError as e:
+            result.update(status="error", error=str(e))
+        else:
+            result["email"] = new_user.email
+            candidates.append((result, new_user))
+
+    # 登録済みのメールアドレスを1クエリで確認（一意制約は削除済みのユーザーも含む）
+    if candidates:
+        cursor.execute(
+            "SELECT email FROM users WHERE tenant_id = %s AND email = ANY(%s)",
+            (tenant_id, [new_user.email for _, new_user in candidates])
+        )
+        existing = {row["email"] for row in cursor.fetchall()}
+        for result, new_user in candidates:
+            if new_user.email in existing:
+                result.update(status="error", error="email already exists")
+        candidates = [(result, new_user) for result, new_user in candidates if new_user.email not in existing]
+    # ハッシュ化の間トランザクションを開いたままにしない
+    conn.rollback()
+
+    if dry_run:
+        for result, _ in candidates:
+            result["status"] = "valid"
+    elif candidates:
+        password_hasher_call(hash_bulk_user_passwords, [new_user for _, new_user in candidates])
+
+        # バッチごとに1文でINSERT。チェック後に他のリクエストが登録したメールアドレスは飛ばす
+        for start in range(0, len(candidates), BULK_USERS_INSERT_BATCH):
+            batch = candidates[start:start + BULK_USERS_INSERT_BATCH]
+            cursor.execute(
+                """
+                INSERT INTO users (tenant_id, name, email, role, password, created_at, updated_at)
+                SELECT %s, u.name, u.email, u.role, u.password, NOW(), NOW()
+                FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[])
+                    AS u(name, email, role, password)
+                ON CONFLICT (tenant_id, email) DO NOTHING
+                RETURNING id, email
+                """,
+                (tenant_id,
+                 [new_user.name for _, new_user in batch],
+                 [new_user.email for _, new_user in batch],
+                 [new_user.role for _, new_user in batch],
+                 [new_user.password_hash for _, new_user in batch])
+            )
+            created = {row["email"]: row["id"] for row in cursor.fetchall()}
+            for result, new_user in batch:
+                if new_user.email in created:
+                    result.update(status="created", user_id=created[new_user.email])
+                else:
+                    result.update(status="error", error="email already exists")
+        bump_list_version(cursor, tenant_id, "users")
+        conn.commit()
+
+    succeeded = sum(1 for result in results if result["status"] != "error")
+    print(f"[DEBUG] Bulk create users: {succeeded}/{len(results)} (dry_run={dry_run})")
+
+    return {
+        "success": True,
+        "dry_run": dry_run,
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
+    }
+
 @app.put("/api/users/{user_id}")
 def update_user(
     user_id: int,
@@ -1079,6 +3923,14 @@ def update_user(
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
 
+    # パスワードハッシュ化（bcrypt の処理中はトランザクションを開いたままにしないよう、最初のクエリの前に行う）
+    hashed_password = None
+    if request_body.password is not None:
+        hashed_password = hash_password(request_body.password)
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
     # ユーザーの存在確認
     cursor.execute(
         "SELECT * FROM users WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL",
@@ -1115,8 +3967,7 @@ def update_user(
         update_fields.append("email = %s")
         params.append(request_body.email)
 
-    if request_body.password is not None:
-        hashed_password = pwd_context.hash(request_body.password)
+    if hashed_password is not None:
         update_fields.append("password = %s")
         params.append(hashed_password)
 
@@ -1131,6 +3982,7 @@ def update_user(
         query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s"
         cursor.execute(query, params)
 
+        bump_list_version(cursor, tenant_id, "users")
         conn.commit()
 
     print(f"[DEBUG] Updated user: {user_id}")
@@ -1153,6 +4005,9 @@ def delete_user(
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
 
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
     # ユーザーの存在確認
     cursor.execute(
         "SELECT * FROM users WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL",
@@ -1173,10 +4028,11 @@ def delete_user(
 
     # ソフトデリート
     cursor.execute(
-        "UPDATE users SET deleted_at = NOW() WHERE id = %s",
+        "UPDATE users SET deleted_at = NOW(), updated_at = NOW() WHERE id = %s",
         (user_id,)
     )
 
+    bump_list_version(cursor, tenant_id, "users")
     conn.commit()
 
     print(f"[DEBUG] Deleted user: {user_id}")
@@ -1187,7 +4043,14 @@ def delete_user(
         "user_id": user_id
     }
 
-@app.get("/api/notifications")
+NOTIFICATIONS_SQL = """
+    SELECT * FROM notifications
+    WHERE user_id = %s
+    ORDER BY created_at DESC
+    LIMIT 50
+"""
+
+@db_route("get", "/api/notifications", async_impl=False)
 def get_notifications(
     payload: dict = Depends(verify_token),
     conn = Depends(get_db)
@@ -1197,19 +4060,22 @@ def get_notifications(
 
     user_id = payload.get("user_id")
 
-    cursor.execute(
-        """
-        SELECT * FROM notifications
-        WHERE user_id = %s
-        ORDER BY created_at DESC
-        LIMIT 50
-        """,
-        (user_id,)
-    )
+    cursor.execute(NOTIFICATIONS_SQL, (user_id,))
     notifications = cursor.fetchall()
 
     return notifications
 
+@db_route("get", "/api/notifications", async_impl=True)
+async def get_notifications_async(
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_async_db)
+):
+    """通知一覧取得（非同期版）"""
+    user_id = payload.get("user_id")
+
+    cursor = await conn.execute(NOTIFICATIONS_SQL, (user_id,))
+    return await cursor.fetchall()
+
 # ========================================
 # 代理承認 API
 # ========================================
@@ -1225,8 +4091,8 @@ def get_delegations(
     user_id = payload.get("user_id")
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     cursor.execute(
         """
@@ -1281,8 +4147,8 @@ def create_delegation(
     user_id = payload.get("user_id")
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # 委任先ユーザーが存在するか確認
     cursor.execute(
@@ -1349,8 +4215,8 @@ def delete_delegation(
     user_id = payload.get("user_id")
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # 代理承認設定が存在するか確認（自分のものか確認）
     cursor.execute(
@@ -1374,18 +4240,34 @@ def delete_delegation(
 # フォームテンプレート API
 # ========================================
 
+# 一覧のETagの検証子（テンプレート一覧の版数）
+FORM_TEMPLATES_VALIDATOR = queries.register(
+    "form_templates_validator", f"SELECT {list_version_sql('form_templates', 'templates_version')}"
+)
+
 @app.get("/api/form-templates")
 def get_form_templates(
+    request: Request,
+    response: Response,
     payload: dict = Depends(verify_token),
     conn = Depends(get_db)
 ):
-    """フォームテンプレート一覧取得"""
+    """フォームテンプレート一覧取得
+
+    ETag を返す。If-None-Match が一致すれば検証子だけを読んで304を返す。
+    """
     cursor = conn.cursor()
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    queries.execute(cursor, FORM_TEMPLATES_VALIDATOR, (tenant_id,))
+    etag = make_etag("form_templates", tenant_id, *cursor.fetchone().values())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
 
     cursor.execute(
         """
@@ -1431,9 +4313,14 @@ def create_form_template(
     cursor = conn.cursor()
 
     tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    fields = validate_template_fields(request.fields, bool(user and user["role"] == "admin"))
 
     cursor.execute(
         """
@@ -1449,12 +4336,13 @@ def create_form_template(
             request.description,
             request.icon,
             request.is_active,
-            json.dumps(request.fields),
+            json.dumps(fields),
             tenant_id,
         )
     )
 
     template = cursor.fetchone()
+    bump_list_version(cursor, tenant_id, "form_templates")
     conn.commit()
 
     return {
@@ -1479,18 +4367,24 @@ def update_form_template(
     cursor = conn.cursor()
 
     tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
-    # テンプレートが存在するか確認
-    cursor.execute(
-        "SELECT id FROM form_templates WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL",
-        (template_id, tenant_id)
-    )
-    if not cursor.fetchone():
+    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+
+    # テンプレートが存在するか確認（filterable を引き継ぐため現在のフィールドも取る）
+    cursor.execute(FORM_TEMPLATE_FIELDS_SQL + " FOR UPDATE", (template_id, tenant_id))
+    current = cursor.fetchone()
+    if not current:
         raise HTTPException(status_code=404, detail="Form template not found")
 
+    fields = validate_template_fields(
+        request.fields, bool(user and user["role"] == "admin"), current["fields"]
+    )
+
     cursor.execute(
         """
         UPDATE form_templates
@@ -1504,12 +4398,13 @@ def update_form_template(
             request.description,
             request.icon,
             request.is_active,
-            json.dumps(request.fields),
+            json.dumps(fields),
             template_id,
         )
     )
 
     template = cursor.fetchone()
+    bump_list_version(cursor, tenant_id, "form_templates")
     conn.commit()
 
     return {
@@ -1534,8 +4429,8 @@ def delete_form_template(
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # テンプレートが存在するか確認
     cursor.execute(
@@ -1547,14 +4442,105 @@ def delete_form_template(
 
     # ソフトデリート
     cursor.execute(
-        "UPDATE form_templates SET deleted_at = NOW() WHERE id = %s",
+        "UPDATE form_templates SET deleted_at = NOW(), updated_at = NOW() WHERE id = %s",
         (template_id,)
     )
 
+    bump_list_version(cursor, tenant_id, "form_templates")
     conn.commit()
 
     return {"message": "Form template deleted successfully"}
 
+class FormFilterIndexRequest(BaseModel):
+    fields: List[str]  # filterable にするフィールドのid
+
+@app.post("/api/form-templates/{template_id}/filter-indexes")
+def create_form_filter_indexes(
+    template_id: int,
+    request_body: FormFilterIndexRequest,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_db)
+):
+    """フォームテンプレートのフィールドを filterable にし、インデックスを作成（管理者のみ）
+
+    フィールドごとに、そのテンプレートの申請だけを対象にした部分インデックス
+    （WHERE template_id = ...）を CREATE INDEX CONCURRENTLY で作る。
+    GET /api/approvals の form.<field> フィルタはこのインデックスを使う。
+    """
+    cursor = conn.cursor()
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    if not user or user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    cursor.execute(FORM_TEMPLATE_FIELDS_SQL + " FOR UPDATE", (template_id, tenant_id))
+    template = cursor.fetchone()
+    if not template:
+        raise HTTPException(status_code=404, detail="Form template not found")
+
+    fields = template["fields"] or []
+    fields_by_id = {field.get("id"): field for field in fields}
+    for field_id in request_body.fields:
+        if field_id not in fields_by_id:
+            raise HTTPException(status_code=400, detail=f"Unknown field '{field_id}'")
+        if not FORM_FIELD_ID_PATTERN.match(field_id):
+            raise HTTPException(status_code=400, detail=f"Field id '{field_id}' cannot be indexed")
+        fields_by_id[field_id]["filterable"] = True
+
+    cursor.execute(
+        "UPDATE form_templates SET fields = %s, updated_at = NOW() WHERE id = %s",
+        (json.dumps(fields), template_id)
+    )
+    bump_list_version(cursor, tenant_id, "form_templates")
+    conn.commit()
+
+    # CREATE INDEX CONCURRENTLY はトランザクション外で実行する必要がある
+    conn.set_tenant(None)
+    conn.autocommit = True
+    indexes = []
+    try:
+        for field_id in request_body.fields:
+            field = fields_by_id[field_id]
+            name = form_filter_index_name(template_id, field)
+            try:
+                # 以前の失敗で INVALID のまま残ったインデックスは IF NOT EXISTS で
+                # 作り直されないため、消してから作る
+                cursor.execute(
+                    "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,)
+                )
+                existing = cursor.fetchone()
+                if existing and not existing["indisvalid"]:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                cursor.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                    f"ON approvals ({form_field_sql(field, alias='')}) "
+                    f"WHERE template_id = {int(template_id)}"
+                )
+            except psycopg2.Error as e:
+                print(f"[ERROR] Failed to create index {name}: {e}")
+                # 失敗すると INVALID なインデックスが残るので消しておく
+                # （消せなくても次回の作成時に作り直す）
+                try:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                except psycopg2.Error as drop_error:
+                    print(f"[ERROR] Failed to drop invalid index {name}: {drop_error}")
+                raise HTTPException(status_code=500, detail=f"Failed to create index for '{field_id}'")
+            indexes.append({"field": field_id, "index": name})
+    finally:
+        conn.autocommit = False
+
+    return {
+        "success": True,
+        "template_id": template_id,
+        "indexes": indexes,
+    }
+
 # ========================================
 # レポート・統計 API
 # ========================================
@@ -1569,8 +4555,8 @@ def get_stats(
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # 総申請数
     cursor.execute(
@@ -1624,8 +4610,8 @@ def get_monthly_data(
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # 過去6ヶ月の月別データ
     cursor.execute(
@@ -1667,8 +4653,8 @@ def get_department_data(
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # ユーザーの部署別申請数
     # 注：departmentフィールドが存在しない場合は空配列を返す
@@ -1711,8 +4697,8 @@ def get_webhooks(
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     cursor.execute(
         """
@@ -1753,8 +4739,8 @@ def create_webhook(
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     cursor.execute(
         """
@@ -1801,8 +4787,8 @@ def update_webhook(
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # Webhookが存在するか確認
     cursor.execute(
@@ -1855,8 +4841,8 @@ def delete_webhook(
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # Webhookが存在するか確認
     cursor.execute(
@@ -1887,8 +4873,8 @@ def get_webhook_logs(
 
     tenant_id = payload.get("tenant_id")
 
-    # RLS設定
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
 
     # Webhookログを取得（簡易版、webhook_logsテーブルがあると仮定）
     cursor.execute(
@@ -1937,7 +4923,7 @@ async def upload_file(
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
     user_id = payload.get("user_id")
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    conn.set_tenant(tenant_id)
 
     # ファイルサイズチェック
     file_content = await file.read()
@@ -2020,7 +5006,7 @@ def get_file(
 
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    conn.set_tenant(tenant_id)
 
     # ファイル情報取得
     cursor.execute(
@@ -2076,7 +5062,7 @@ def delete_file(
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
     user_id = payload.get("user_id")
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    conn.set_tenant(tenant_id)
 
     # ファイル情報取得
     cursor.execute(
@@ -2132,60 +5118,522 @@ def delete_file(
         raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
 
 
+# ファイル一覧で返せる項目（レスポンスのキー）とそのSQL式
+FILE_LIST_FIELDS = {
+    "id": "f.id",
+    "fileName": "f.file_name",
+    "fileSize": "f.file_size",
+    "mimeType": "f.mime_type",
+    "uploaderName": "u.name",
+    "approvalId": "f.approval_id",
+    "createdAt": "f.created_at",
+}
+FILE_LIST_DEFAULT_FIELDS = tuple(FILE_LIST_FIELDS)
+
 @app.get("/api/files")
 def get_files(
     approval_id: Optional[int] = None,
+    fields: Optional[str] = None,
     payload: dict = Depends(verify_token),
     conn = Depends(get_db)
 ):
-    """ファイル一覧取得"""
+    """ファイル一覧取得
+
+    Args:
+        approval_id: 指定した承認申請のファイルのみ取得（省略時は最新100件）
+        fields: 返す項目（カンマ区切り）。省略時はすべて
+    """
 
     cursor = conn.cursor()
     tenant_id = payload.get("tenant_id")
-    cursor.execute("SET app.current_tenant_id = %s", (tenant_id,))
+    fields = parse_list_fields(fields, FILE_LIST_FIELDS, FILE_LIST_DEFAULT_FIELDS)
+    conn.set_tenant(tenant_id)
+
+    query = f"SELECT {select_list_sql(fields, FILE_LIST_FIELDS)} FROM files f"
+    if "uploaderName" in fields:
+        query += " JOIN users u ON f.uploader_id = u.id"
+    query += " WHERE f.tenant_id = %s AND f.deleted_at IS NULL"
+    params = [tenant_id]
 
     if approval_id:
         # 特定の承認申請のファイル一覧
-        cursor.execute(
-            """
-            SELECT f.id, f.file_name, f.file_size, f.mime_type, f.created_at,
-                   u.name as uploader_name
-            FROM files f
-            JOIN users u ON f.uploader_id = u.id
-            WHERE f.approval_id = %s AND f.tenant_id = %s AND f.deleted_at IS NULL
-            ORDER BY f.created_at DESC
-            """,
-            (approval_id, tenant_id)
-        )
+        query += " AND f.approval_id = %s ORDER BY f.created_at DESC"
+        params.append(approval_id)
     else:
         # 全ファイル一覧
-        cursor.execute(
+        query += " ORDER BY f.created_at DESC LIMIT 100"
+
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+# ========================================
+# 一括インポート API（データ移行）
+# ========================================
+# CSV / NDJSON を1行ずつ読み、バッチごとに一時テーブルへ COPY してから
+# 参照先の存在チェックをSQLでまとめて行い、本テーブルへ INSERT ... SELECT する。
+# （RLSが有効なテーブルへは直接 COPY FROM できないため一時テーブルを経由する）
+# メモリに持つのは1バッチ分だけなので、ファイルサイズに関係なく一定。
+# インポート全体を1トランザクションで実行し、最後にコミットする。
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+IMPORT_MAX_REPORTED_ERRORS = 100
+IMPORT_FORMATS = ("csv", "ndjson")
+IMPORT_APPROVAL_STATUSES = ("pending", "approved", "rejected", "withdrawn")
+IMPORT_HISTORY_ACTIONS = ("approved", "rejected", "withdrawn", "commented")
+IMPORT_USER_ROLES = ("admin", "manager", "member")
+
+class ImportRowError(ValueError):
+    """インポート対象の行が不正"""
+
+def import_value(row, key, required=False):
+    value = row.get(key)
+    if value is None or value == "":
+        if required:
+            raise ImportRowError(f"{key} is required")
+        return None
+    return value
+
+def import_int(row, key, required=False):
+    value = import_value(row, key, required)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ImportRowError(f"{key} must be an integer")
+
+def import_datetime(row, key):
+    value = import_value(row, key)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise ImportRowError(f"{key} must be an ISO 8601 datetime")
+
+def import_choice(row, key, choices, default):
+    value = import_value(row, key) or default
+    if value not in choices:
+        raise ImportRowError(f"{key} must be one of {', '.join(choices)}")
+    return value
+
+def import_json_object(row, key):
+    value = import_value(row, key)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ImportRowError(f"{key} must be a JSON object")
+    if not isinstance(value, dict):
+        raise ImportRowError(f"{key} must be a JSON object")
+    return json.dumps(value, ensure_ascii=False)
+
+def convert_import_user(row):
+    """一括登録と同じ検証をし、移行元の bcrypt ハッシュ（password_hash）を必須にする
+
+    インポートは全体を1トランザクションで取り込むため、その中で bcrypt を実行しない
+    （平文のパスワードのユーザーは POST /api/users/bulk で登録する）。
+    """
+    user = parse_bulk_user(row)
+    if user.password_hash is None:
+        raise ImportRowError("password_hash is required (use POST /api/users/bulk for plain passwords)")
+    return (user.name, user.email, user.role, user.password_hash)
+
+def convert_import_approval(row):
+    applicant_id = import_int(row, "applicant_id")
+    applicant_email = import_value(row, "applicant_email")
+    if applicant_id is None and applicant_email is None:
+        raise ImportRowError("applicant_id or applicant_email is required")
+    return (
+        import_value(row, "external_ref"),
+        import_int(row, "route_id", required=True),
+        applicant_id,
+        applicant_email,
+        import_value(row, "title", required=True),
+        import_value(row, "description"),
+        import_int(row, "template_id"),
+        import_json_object(row, "form_data"),
+        import_choice(row, "status", IMPORT_APPROVAL_STATUSES, "pending"),
+        import_int(row, "current_step") or 1,
+        import_datetime(row, "created_at"),
+        import_datetime(row, "updated_at"),
+    )
+
+def convert_import_history(row):
+    approval_id = import_int(row, "approval_id")
+    approval_ref = import_value(row, "approval_ref")
+    if approval_id is None and approval_ref is None:
+        raise ImportRowError("approval_id or approval_ref is required")
+    user_id = import_int(row, "user_id")
+    user_email = import_value(row, "user_email")
+    if user_id is None and user_email is None:
+        raise ImportRowError("user_id or user_email is required")
+    return (
+        approval_id,
+        approval_ref,
+        user_id,
+        user_email,
+        import_choice(row, "action", IMPORT_HISTORY_ACTIONS, None),
+        import_int(row, "step_order"),
+        import_value(row, "comment"),
+        import_datetime(row, "created_at"),
+    )
+
+# 種類ごとの定義
+#   columns: 一時テーブルの列（convert の戻り値の順）
+#   resolve: メールアドレス・外部IDからIDを埋めるSQL
+#   checks:  (エラー内容, 不正な行の line_no を返すSQL)
+#   insert:  一時テーブルから本テーブルへ移すSQL
+#   conflict: 指定した場合、insert は一時テーブルの行ごとに (line_no, inserted) を返し、
+#             競合で入らなかった行をこのエラー内容で報告する
+IMPORT_SPECS = {
+    "users": {
+        "columns": [("name", "text"), ("email", "text"), ("role", "text"), ("password", "text")],
+        "convert": convert_import_user,
+        "resolve": [],
+        "checks": [
+            ("email already exists", """
+                SELECT s.line_no FROM import_users s
+                WHERE EXISTS (SELECT 1 FROM users u WHERE u.tenant_id = %(tenant)s AND u.email = s.email)
+            """),
+            ("duplicate email in file", """
+                SELECT s.line_no FROM import_users s
+                WHERE EXISTS (SELECT 1 FROM import_users o WHERE o.email = s.email AND o.line_no < s.line_no)
+            """),
+        ],
+        "list_version": "users",
+        # チェック後に他のリクエストが登録したメールアドレスは飛ばしてエラーにする
+        "insert": """
+            WITH inserted AS (
+                INSERT INTO users (tenant_id, name, email, role, password, created_at, updated_at)
+                SELECT %(tenant)s, name, email, role, password, NOW(), NOW() FROM import_users
+                ON CONFLICT (tenant_id, email) DO NOTHING
+                RETURNING email
+            )
+            SELECT s.line_no, i.email IS NOT NULL as inserted
+            FROM import_users s
+            LEFT JOIN inserted i ON i.email = s.email
+        """,
+        "conflict": "email already exists",
+    },
+    "approvals": {
+        "columns": [
+            ("external_ref", "text"), ("route_id", "bigint"), ("applicant_id", "bigint"),
+            ("applicant_email", "text"), ("title", "text"), ("description", "text"),
+            ("template_id", "bigint"), ("form_data", "jsonb"), ("status", "text"),
+            ("current_step", "int"), ("created_at", "timestamp"), ("updated_at", "timestamp"),
+        ],
+        "convert": convert_import_approval,
+        "resolve": ["""
+            UPDATE import_approvals s SET applicant_id = u.id
+            FROM users u
+            WHERE s.applicant_id IS NULL AND u.tenant_id = %(tenant)s AND u.email = s.applicant_email
+        """],
+        "checks": [
+            ("unknown route_id", """
+                SELECT s.line_no FROM import_approvals s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM approval_routes r WHERE r.id = s.route_id AND r.tenant_id = %(tenant)s
+                )
+            """),
+            ("unknown template_id", """
+                SELECT s.line_no FROM import_approvals s
+                WHERE s.template_id IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM form_templates t WHERE t.id = s.template_id AND t.tenant_id = %(tenant)s
+                )
+            """),
+            ("unknown applicant", """
+                SELECT s.line_no FROM import_approvals s
+                WHERE s.applicant_id IS NULL OR NOT EXISTS (
+                    SELECT 1 FROM users u WHERE u.id = s.applicant_id AND u.tenant_id = %(tenant)s
+                )
+            """),
+            ("external_ref already exists", """
+                SELECT s.line_no FROM import_approvals s
+                WHERE s.external_ref IS NOT NULL AND EXISTS (
+                    SELECT 1 FROM approvals a WHERE a.tenant_id = %(tenant)s AND a.external_ref = s.external_ref
+                )
+            """),
+            ("duplicate external_ref in file", """
+                SELECT s.line_no FROM import_approvals s
+                WHERE EXISTS (
+                    SELECT 1 FROM import_approvals o WHERE o.external_ref = s.external_ref AND o.line_no < s.line_no
+                )
+            """),
+        ],
+        # 承認待ちのものは、現在のステップの先頭の必須承認者を current_approver_id にする
+        "insert": """
+            INSERT INTO approvals (
+                tenant_id, external_ref, route_id, route_version, applicant_id, title, description,
+                template_id, form_data, status, current_step, current_approver_id,
+                created_at, updated_at
+            )
+            SELECT
+                %(tenant)s, s.external_ref, s.route_id,
+                (SELECT r.layout_version FROM approval_routes r WHERE r.id = s.route_id),
+                s.applicant_id, s.title, s.description,
+                s.template_id, s.form_data, s.status, s.current_step,
+                CASE WHEN s.status = 'pending' THEN (
+                    SELECT (step->>'approver_id')::bigint
+                    FROM approval_routes r,
+                         jsonb_array_elements(r.step_layout) WITH ORDINALITY AS l(step, ord)
+                    WHERE r.id = s.route_id
+                      AND (step->>'step_order')::int = s.current_step
+                      AND COALESCE((step->>'is_required')::boolean, TRUE)
+                    ORDER BY ord
+                    LIMIT 1
+                ) END,
+                COALESCE(s.created_at, NOW()), COALESCE(s.updated_at, s.created_at, NOW())
+            FROM import_approvals s
+        """,
+    },
+    "approval_histories": {
+        "columns": [
+            ("approval_id", "bigint"), ("approval_ref", "text"), ("user_id", "bigint"),
+            ("user_email", "text"), ("action", "text"), ("step_order", "int"),
+            ("comment", "text"), ("created_at", "timestamp"),
+        ],
+        "convert": convert_import_history,
+        "resolve": [
+            """
+            UPDATE import_approval_histories s SET approval_id = a.id
+            FROM approvals a
+            WHERE s.approval_id IS NULL AND a.tenant_id = %(tenant)s AND a.external_ref = s.approval_ref
+            """,
             """
-            SELECT f.id, f.file_name, f.file_size, f.mime_type, f.created_at,
-                   u.name as uploader_name, f.approval_id
-            FROM files f
-            JOIN users u ON f.uploader_id = u.id
-            WHERE f.tenant_id = %s AND f.deleted_at IS NULL
-            ORDER BY f.created_at DESC
-            LIMIT 100
+            UPDATE import_approval_histories s SET user_id = u.id
+            FROM users u
+            WHERE s.user_id IS NULL AND u.tenant_id = %(tenant)s AND u.email = s.user_email
             """,
-            (tenant_id,)
+        ],
+        "checks": [
+            ("unknown approval", """
+                SELECT s.line_no FROM import_approval_histories s
+                WHERE s.approval_id IS NULL OR NOT EXISTS (
+                    SELECT 1 FROM approvals a WHERE a.id = s.approval_id AND a.tenant_id = %(tenant)s
+                )
+            """),
+            ("unknown user", """
+                SELECT s.line_no FROM import_approval_histories s
+                WHERE s.user_id IS NULL OR NOT EXISTS (
+                    SELECT 1 FROM users u WHERE u.id = s.user_id AND u.tenant_id = %(tenant)s
+                )
+            """),
+        ],
+        # 承認履歴サマリーも同じ文で更新する（rowcount は追加した承認履歴の件数）
+        "insert": f"""
+            WITH logged AS (
+                INSERT INTO approval_histories (approval_id, user_id, action, step_order, comment, created_at)
+                SELECT approval_id, user_id, action, step_order, comment, COALESCE(created_at, NOW())
+                FROM import_approval_histories
+                RETURNING *
+            ),
+            summarized AS ({history_summary_upsert_sql("logged")})
+            SELECT id FROM logged
+        """,
+    },
+}
+
+def iter_import_rows(text_stream, fmt):
+    """(行番号, dict) を1行ずつ返す。NDJSONで読めない行は dict の代わりに None"""
+    if fmt == "csv":
+        reader = csv.DictReader(text_stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_no, line in enumerate(text_stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_no, row if isinstance(row, dict) else None
+
+class BulkImporter:
+    """1種類のデータをバッチごとに検証して COPY で取り込む"""
+
+    def __init__(self, conn, tenant_id, kind, batch_size=IMPORT_BATCH_SIZE):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.kind = kind
+        self.spec = IMPORT_SPECS[kind]
+        self.staging = f"import_{kind}"
+        self.params = {"tenant": tenant_id}
+        self.batch_size = batch_size
+        self.rows = 0
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+
+    def progress(self, event="progress"):
+        return {
+            "event": event,
+            "kind": self.kind,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "errors": self.error_count,
+        }
+
+    def _error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def run(self, rows):
+        """行を取り込み、バッチごとに進捗を返す（コミットは呼び出し側）"""
+        columns = ", ".join(f"{name} {sql_type}" for name, sql_type in self.spec["columns"])
+        self.cursor.execute(
+            f"CREATE TEMP TABLE {self.staging} (line_no int, {columns}) ON COMMIT DROP"
         )
 
-    files = cursor.fetchall()
+        batch = []
+        for line_no, row in rows:
+            self.rows += 1
+            try:
+                if row is None:
+                    raise ImportRowError("invalid JSON object")
+                batch.append((line_no, self.spec["convert"](row)))
+            except ImportRowError as e:
+                self._error(line_no, str(e))
+            if len(batch) >= self.batch_size:
+                self._load_batch(batch)
+                batch = []
+                yield self.progress()
+        if batch:
+            self._load_batch(batch)
+            yield self.progress()
+
+    def _load_batch(self, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows((line_no, *values) for line_no, values in batch)
+        buffer.seek(0)
+        column_names = ", ".join(name for name, _ in self.spec["columns"])
+        self.cursor.copy_expert(
+            f"COPY {self.staging} (line_no, {column_names}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
 
-    return [
-        {
-            "id": f["id"],
-            "fileName": f["file_name"],
-            "fileSize": f["file_size"],
-            "mimeType": f["mime_type"],
-            "uploaderName": f["uploader_name"],
-            "approvalId": f.get("approval_id"),
-            "createdAt": f["created_at"].isoformat(),
-        }
-        for f in files
-    ]
+        for sql in self.spec["resolve"]:
+            self.cursor.execute(sql, self.params)
+
+        rejected = {}
+        for message, sql in self.spec["checks"]:
+            self.cursor.execute(sql, self.params)
+            for row in self.cursor.fetchall():
+                rejected.setdefault(row["line_no"], message)
+        for line_no, message in sorted(rejected.items()):
+            self._error(line_no, message)
+        if rejected:
+            self.cursor.execute(
+                f"DELETE FROM {self.staging} WHERE line_no = ANY(%s)", (list(rejected),)
+            )
+
+        self.cursor.execute(self.spec["insert"], self.params)
+        if "conflict" in self.spec:
+            for row in self.cursor.fetchall():
+                if row["inserted"]:
+                    self.inserted += 1
+                else:
+                    self._error(row["line_no"], self.spec["conflict"])
+        else:
+            self.inserted += self.cursor.rowcount
+        self.cursor.execute(f"TRUNCATE {self.staging}")
+
+def run_import(conn, tenant_id, kind, text_stream, fmt, dry_run=False, batch_size=IMPORT_BATCH_SIZE):
+    """インポートを実行し、進捗イベントを順に返す（APIとCLIで共通）
+
+    最後のイベント（event="done"）にエラー行の一部を含める。
+    dry_run の場合は検証だけ行いロールバックする。
+    """
+    conn.set_tenant(tenant_id)
+    importer = BulkImporter(conn, tenant_id, kind, batch_size)
+    try:
+        yield from importer.run(iter_import_rows(text_stream, fmt))
+        if dry_run:
+            conn.rollback()
+        else:
+            if importer.inserted and "list_version" in importer.spec:
+                bump_list_version(importer.cursor, tenant_id, importer.spec["list_version"])
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    done = importer.progress("done")
+    done["dry_run"] = dry_run
+    done["error_samples"] = sorted(importer.errors, key=lambda e: e["line"])
+    yield done
+
+def detect_import_format(fmt, filename):
+    if fmt:
+        if fmt not in IMPORT_FORMATS:
+            raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+        return fmt
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+@app.post("/api/import/{kind}")
+def import_data(
+    kind: str,
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    dry_run: bool = False,
+    payload: dict = Depends(verify_token),
+    conn = Depends(get_db)
+):
+    """データ移行用の一括インポート（管理者のみ）
+
+    Args:
+        kind: users / approvals / approval_histories
+        file: CSV（1行目がヘッダ）または NDJSON
+        format: csv / ndjson（省略時はファイル名の拡張子で判定）
+        dry_run: Trueの場合、検証だけ行い取り込まない
+
+    レスポンスは進捗の NDJSON（バッチごとに1行、最後に event="done" の集計）。
+    申請は external_ref（旧システムのID）を付けておくと、承認履歴から
+    approval_ref で参照できる。ユーザーは applicant_email / user_email でも参照できる。
+    ユーザーのインポートには移行元の bcrypt ハッシュ（password_hash）が必要。
+    """
+    if kind not in IMPORT_SPECS:
+        raise HTTPException(status_code=404, detail="Unknown import kind")
+    fmt = detect_import_format(format, file.filename)
+
+    tenant_id = payload.get("tenant_id")
+    user_id = payload.get("user_id")
+
+    # RLS設定（最初のクエリに相乗り）
+    conn.set_tenant(tenant_id)
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    if not user or user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    def stream():
+        # レスポンスを返し終わるまで使うため、リクエストの接続とは別に取る。
+        # 取得の失敗（プールのタイムアウトなど）も失敗のイベントとして返す
+        import_conn = None
+        try:
+            import_conn = db_pool.getconn()
+            if replica_db_pool is not None:
+                import_conn.on_commit = lambda: replica_router.mark_write(request)
+            text_stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+            for event in run_import(import_conn, tenant_id, kind, text_stream, fmt, dry_run):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"[ERROR] Import failed: {e}")
+            yield json.dumps({"event": "failed", "kind": kind, "error": str(e)}) + "\n"
+        finally:
+            if import_conn is not None:
+                import_conn.on_commit = None
+                db_pool.putconn(import_conn)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
     import uvicorn
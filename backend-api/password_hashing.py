@@ -0,0 +1,84 @@
+"""パスワードのハッシュ化・照合（bcrypt）
+
+main.py の PasswordHasher がプロセスプールのワーカーで実行する関数。
+ワーカーの起動を軽くするため、このモジュールは passlib 以外に依存しない。
+
+ログインのスループット（1コアあたり）の計測:
+    python password_hashing.py --rounds 10 12 --seconds 5
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+@lru_cache(maxsize=None)
+def crypt_context(rounds):
+    """work factor（コスト）ごとの CryptContext
+
+    これより弱いハッシュは照合時に needs_update（再ハッシュ対象）になる。
+    強いハッシュはそのまま使う。
+    """
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
+def warm(rounds):
+    """ワーカーの起動確認と CryptContext の準備"""
+    crypt_context(rounds)
+
+def hash_password(password, rounds):
+    return crypt_context(rounds).hash(password)
+
+def hash_passwords(passwords, rounds):
+    """まとめてハッシュ化する（一括登録用。プロセス間の往復を減らす）"""
+    context = crypt_context(rounds)
+    return [context.hash(password) for password in passwords]
+
+def verify_password(password, hashed, rounds):
+    """照合し、(一致したか, 再ハッシュしたハッシュまたは None) を返す
+
+    一致したハッシュの work factor が rounds より弱ければ、
+    同じ呼び出しの中で rounds で作り直す。
+    """
+    return crypt_context(rounds).verify_and_update(password, hashed)
+
+def _verify_for(seconds, hashed, rounds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        verify_password("password", hashed, rounds)
+        count += 1
+    return count
+
+def benchmark(rounds, workers, seconds):
+    """workers プロセスで seconds 秒間照合し続け、1秒あたりの照合数を返す"""
+    hashed = hash_password("password", rounds)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_verify_for, seconds, hashed, rounds) for _ in range(workers)]
+        total = sum(future.result() for future in futures)
+    return total / seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="bcrypt 照合（ログイン）のスループット計測")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"workers={args.workers} seconds={args.seconds}")
+    for rounds in args.rounds:
+        per_second = benchmark(rounds, args.workers, args.seconds)
+        print(
+            f"rounds={rounds}: {per_second:.1f} logins/s total, "
+            f"{per_second / args.workers:.1f} logins/s per core, "
+            f"{1000 * args.workers / per_second:.0f} ms per login"
+        )
+
+if __name__ == "__main__":
+    main()
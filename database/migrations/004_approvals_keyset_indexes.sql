@@ -0,0 +1,21 @@
+-- 承認一覧のキーセットページング用インデックス
+-- GET /api/approvals は (created_at, id) の降順でページングする。
+-- フィルタの組み合わせ（テナント / ステータス / 自分の申請）ごとに
+-- 範囲スキャンだけで次ページを取得できるようにする。
+
+-- テナントのみ
+CREATE INDEX IF NOT EXISTS idx_approvals_tenant_created_id
+  ON approvals(tenant_id, created_at DESC, id DESC);
+
+-- テナント + ステータス（idx_approvals_tenant_status_created を置き換え）
+CREATE INDEX IF NOT EXISTS idx_approvals_tenant_status_created_id
+  ON approvals(tenant_id, status, created_at DESC, id DESC);
+DROP INDEX IF EXISTS idx_approvals_tenant_status_created;
+
+-- テナント + 申請者（my=true）
+CREATE INDEX IF NOT EXISTS idx_approvals_tenant_applicant_created_id
+  ON approvals(tenant_id, applicant_id, created_at DESC, id DESC);
+
+-- テナント + 申請者 + ステータス（my=true&status=...）
+CREATE INDEX IF NOT EXISTS idx_approvals_tenant_applicant_status_created_id
+  ON approvals(tenant_id, applicant_id, status, created_at DESC, id DESC);
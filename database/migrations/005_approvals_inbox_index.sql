@@ -0,0 +1,20 @@
+-- 承認待ち一覧（GET /api/approvals/inbox）用
+-- current_approver_id は申請作成・承認・却下・取り下げのたびにハンドラが更新する。
+-- 既存データはここで現在のステップの承認者に合わせておく。
+
+UPDATE approvals a
+SET current_approver_id = (
+  SELECT s.approver_id FROM approval_route_steps s
+  WHERE s.route_id = a.route_id AND s.step_order = a.current_step
+  ORDER BY s.id LIMIT 1
+)
+WHERE a.status = 'pending';
+
+UPDATE approvals
+SET current_approver_id = NULL
+WHERE status <> 'pending' AND current_approver_id IS NOT NULL;
+
+-- 承認者ごとの承認待ちを (created_at, id) の降順で範囲スキャンする
+CREATE INDEX IF NOT EXISTS idx_approvals_inbox
+  ON approvals(tenant_id, current_approver_id, created_at DESC, id DESC)
+  WHERE status = 'pending';
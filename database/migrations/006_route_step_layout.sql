@@ -0,0 +1,30 @@
+-- 承認ルートのステップ構成を approval_routes に非正規化
+-- 承認のたびに approval_route_steps を集計しないよう、総ステップ数と
+-- step_order 順のステップ一覧を保持する。create/update_approval_route が更新し、
+-- ステップを変更するたびに layout_version を上げる（プロセス内キャッシュの検証用）。
+
+ALTER TABLE approval_routes
+  ADD COLUMN IF NOT EXISTS total_steps INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS step_layout JSONB NOT NULL DEFAULT '[]'::jsonb,
+  ADD COLUMN IF NOT EXISTS layout_version INTEGER NOT NULL DEFAULT 1;
+
+-- 既存ルートのバックフィル
+UPDATE approval_routes r
+SET total_steps = (
+      SELECT COUNT(DISTINCT s.step_order) FROM approval_route_steps s
+      WHERE s.route_id = r.id
+    ),
+    step_layout = COALESCE((
+      SELECT jsonb_agg(
+               jsonb_build_object(
+                 'step_order', s.step_order,
+                 'approver_id', s.approver_id,
+                 'is_required', s.is_required,
+                 'is_parallel_group', COALESCE(s.is_parallel_group, FALSE),
+                 'parallel_requirement', s.parallel_requirement
+               )
+               ORDER BY s.step_order, s.id
+             )
+      FROM approval_route_steps s
+      WHERE s.route_id = r.id
+    ), '[]'::jsonb);
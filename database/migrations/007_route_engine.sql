@@ -0,0 +1,15 @@
+-- 承認ルートエンジン（並列グループ・任意ステップ）対応
+-- 並列グループは同じ step_order に複数の承認者を並べて表すため、
+-- (route_id, step_order) の一意制約を (route_id, step_order, approver_id) に変更する。
+ALTER TABLE approval_route_steps
+  DROP CONSTRAINT IF EXISTS approval_route_steps_route_id_step_order_key;
+
+ALTER TABLE approval_route_steps
+  ADD CONSTRAINT approval_route_steps_route_id_step_order_approver_id_key
+  UNIQUE (route_id, step_order, approver_id);
+
+-- 現在のステップ（ステージ）で承認済みの承認者。ビット i が
+-- step_layout 上でそのステップの i 番目の承認者に対応する。
+-- ステップが進むと 0 に戻る。
+ALTER TABLE approvals
+  ADD COLUMN IF NOT EXISTS stage_approved_mask BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,23 @@
+-- 承認の全文検索・あいまい検索（GET /api/approvals/search）用
+-- 式は backend-api/main.py の APPROVAL_SEARCH_VECTOR_SQL / APPROVAL_SEARCH_TEXT_SQL と
+-- 完全に一致させること（一致しないとインデックスが使われない）。
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+-- 全文検索（タイトル > 説明 > フォーム入力値 の重み付け）
+CREATE INDEX IF NOT EXISTS idx_approvals_search_vector
+  ON approvals USING gin (
+    tenant_id,
+    (setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+     || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+     || setweight(jsonb_to_tsvector('simple', coalesce(form_data, '{}'::jsonb), '["string", "numeric"]'), 'C'))
+  );
+
+-- 部分一致（日本語など単語区切りの無いテキスト向けのトライグラム）
+CREATE INDEX IF NOT EXISTS idx_approvals_search_trgm
+  ON approvals USING gin (
+    tenant_id,
+    (coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || coalesce(form_data::text, ''))
+    gin_trgm_ops
+  );
@@ -0,0 +1,9 @@
+-- 一括インポート（POST /api/import/{kind}, import_data.py）用
+-- 旧システムの申請IDを external_ref として保持し、承認履歴の取り込み時に
+-- approval_ref から申請を引けるようにする。同じファイルの再取り込みも検出できる。
+ALTER TABLE approvals
+  ADD COLUMN IF NOT EXISTS external_ref VARCHAR(255);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_approvals_external_ref
+  ON approvals(tenant_id, external_ref)
+  WHERE external_ref IS NOT NULL;
@@ -0,0 +1,52 @@
+-- 承認履歴のサマリー（申請ごとに1行）
+-- 承認詳細でステップごとの最新アクションと件数を返すため、承認履歴を集計せずに
+-- 済むよう非正規化して持つ。承認履歴を追加する文（承認・差し戻し・取り下げ・
+-- 一括操作・インポート）が同じ文の中で更新する。
+--   latest_by_step: {"<step_order>": {id, step_order, user_id, action, comment, created_at}}
+--                   step_order が NULL の履歴は "0" に入れる
+CREATE TABLE IF NOT EXISTS approval_history_summaries (
+  approval_id BIGINT PRIMARY KEY REFERENCES approvals(id) ON DELETE CASCADE,
+  history_count INTEGER NOT NULL DEFAULT 0,
+  last_history_id BIGINT,
+  latest_by_step JSONB NOT NULL DEFAULT '{}'::jsonb,
+  updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- 既存データのバックフィル
+INSERT INTO approval_history_summaries (approval_id, history_count, last_history_id, latest_by_step)
+SELECT n.approval_id, n.history_count, n.last_history_id, l.latest_by_step
+FROM (
+  SELECT approval_id, COUNT(*) AS history_count, MAX(id) AS last_history_id
+  FROM approval_histories
+  GROUP BY approval_id
+) n
+JOIN (
+  SELECT approval_id, jsonb_object_agg(step_key, entry) AS latest_by_step
+  FROM (
+    SELECT DISTINCT ON (approval_id, COALESCE(step_order, 0))
+      approval_id,
+      COALESCE(step_order, 0)::text AS step_key,
+      jsonb_build_object(
+        'id', id, 'step_order', step_order, 'user_id', user_id,
+        'action', action, 'comment', comment, 'created_at', created_at
+      ) AS entry
+    FROM approval_histories
+    ORDER BY approval_id, COALESCE(step_order, 0), created_at DESC, id DESC
+  ) latest
+  GROUP BY approval_id
+) l ON l.approval_id = n.approval_id
+ON CONFLICT (approval_id) DO NOTHING;
+
+-- 承認履歴のページング（GET /api/approvals/{id}/histories）用
+CREATE INDEX IF NOT EXISTS idx_approval_histories_approval_created
+  ON approval_histories(approval_id, created_at, id);
+
+-- Row Level Security 有効化（tenant_id を持たないため、申請のテナントで絞る）
+ALTER TABLE approval_history_summaries ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY tenant_isolation_approval_history_summaries ON approval_history_summaries
+    USING (EXISTS (
+        SELECT 1 FROM approvals a
+        WHERE a.id = approval_history_summaries.approval_id
+          AND a.tenant_id = current_setting('app.current_tenant_id', true)::bigint
+    ));
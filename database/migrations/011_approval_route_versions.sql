@@ -0,0 +1,44 @@
+-- 承認ルートのバージョン（作成後は変更しない）
+-- ステップ構成を変更するたびに approval_routes.layout_version を上げ、その構成を
+-- 新しいバージョンとして追加する。申請は作成時のバージョンを route_version に
+-- 固定するため、ルートを編集しても進行中の申請のステップ数・承認者は変わらない。
+CREATE TABLE IF NOT EXISTS approval_route_versions (
+  route_id BIGINT NOT NULL REFERENCES approval_routes(id) ON DELETE CASCADE,
+  version INTEGER NOT NULL,
+  total_steps INTEGER NOT NULL,
+  step_layout JSONB NOT NULL,
+  created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (route_id, version)
+);
+
+-- 既存ルートの現在の構成をバージョンとして登録
+INSERT INTO approval_route_versions (route_id, version, total_steps, step_layout)
+SELECT id, layout_version, total_steps, step_layout
+FROM approval_routes
+ON CONFLICT (route_id, version) DO NOTHING;
+
+-- 既存の申請は現在のバージョンに固定する
+ALTER TABLE approvals
+  ADD COLUMN IF NOT EXISTS route_version INTEGER;
+
+UPDATE approvals a
+SET route_version = r.layout_version
+FROM approval_routes r
+WHERE r.id = a.route_id AND a.route_version IS NULL;
+
+ALTER TABLE approvals
+  ALTER COLUMN route_version SET NOT NULL;
+
+ALTER TABLE approvals
+  ADD CONSTRAINT approvals_route_version_fkey
+  FOREIGN KEY (route_id, route_version) REFERENCES approval_route_versions(route_id, version);
+
+-- Row Level Security 有効化（tenant_id を持たないため、ルートのテナントで絞る）
+ALTER TABLE approval_route_versions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY tenant_isolation_approval_route_versions ON approval_route_versions
+    USING (EXISTS (
+        SELECT 1 FROM approval_routes r
+        WHERE r.id = approval_route_versions.route_id
+          AND r.tenant_id = current_setting('app.current_tenant_id', true)::bigint
+    ));
@@ -0,0 +1,18 @@
+-- 一覧のETag・キャッシュ用の版数（テナント・一覧ごと）
+-- 一覧に出る行を書き込むトランザクションがコミット直前に +1 する。
+-- 行ロックで同じ一覧への書き込みは直列になるため、コミットのたびに必ず値が変わる。
+-- （MAX(updated_at) はトランザクション開始時刻なので、先に始まって後から
+--   コミットした書き込みを検出できないことがある）
+--   list: approval_routes / users / form_templates
+CREATE TABLE IF NOT EXISTS tenant_list_versions (
+  tenant_id BIGINT NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+  list VARCHAR(50) NOT NULL,
+  version BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (tenant_id, list)
+);
+
+-- Row Level Security 有効化
+ALTER TABLE tenant_list_versions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY tenant_isolation_tenant_list_versions ON tenant_list_versions
+    USING (tenant_id = current_setting('app.current_tenant_id', true)::bigint);